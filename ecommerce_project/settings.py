@@ -27,6 +27,10 @@ OPTION2 = "size"
 OPTION3 = "memory"
 
 
+# محرك البحث في المنتجات (products/search.py)
+PRODUCT_SEARCH_BACKEND = "products.search.SQLiteFTS5Backend"
+
+
 
 # Application definition
 INSTALLED_APPS = [
@@ -101,9 +105,17 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # BEGIN IMMEDIATE: الـ transaction يأخذ قفل الكتابة من البداية وينتظر (timeout) بدل
+        # "database is locked" فورًا عندما يحاول transaction يقرأ أن يكتب بينما آخر يكتب
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+        # قاعدة الاختبارات ملف وليست في الذاكرة: الاختبارات المتزامنة (threads) تحتاج أقفال SQLite الحقيقية
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# الـ cache وملفات الـ snapshot أثناء الاختبارات في مجلد مؤقت (ecommerce_project/test_runner.py)
+TEST_RUNNER = 'ecommerce_project.test_runner.IsolatedTestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -155,6 +167,74 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# نسخ الصور المتجاوبة (website/images.py): عروض srcset، جودة JPEG/WebP، وعدد processes
+IMAGE_VARIANT_WIDTHS = [200, 400, 800, 1200]
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_WORKERS = 2
+
+# حدود الصور المرفوعة (تُفحص من الـ header قبل أي decode)، والرفع يُكتب لملف مؤقت وليس للذاكرة
+IMAGE_MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+IMAGE_MAX_PIXELS = 40_000_000
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
+
+# تصغير الصور عند الطلب (/image/...): العروض والجودات المسموحة، مجلد الكاش، وكم تصغير في نفس الوقت لكل process
+IMAGE_RESIZE_WIDTHS = [100, 200, 300, 400, 600, 800, 1200, 1600]
+IMAGE_RESIZE_QUALITIES = [50, 65, 75, 85]
+# الرابط مبني على اسم الصورة وليس محتواها: مدة قصيرة ثم تحقق بالـ ETag (304)
+IMAGE_RESIZE_MAX_AGE = 3600
+IMAGE_CACHE_DIR = os.path.join(BASE_DIR, '.image_cache')
+IMAGE_RESIZE_CONCURRENCY = 2
+
+
+# Cache مشترك بين كل workers تبع gunicorn على نفس الجهاز (facets، نسخة الكتالوج، ملخصات السلات...)
+# المفاتيح باسم قاعدة البيانات: قاعدة أخرى على نفس الجهاز لا تقرأ بيانات هذه
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, '.django_cache'),
+        'TIMEOUT': 300,
+        'KEY_PREFIX': os.path.basename(DATABASES['default']['NAME']),
+    }
+}
+
+# حدود شرائح السعر في /products/facets/
+PRODUCT_PRICE_BUCKETS = [0, 100, 250, 500, 1000, 2500, 5000]
+
+# نسخة عمودية من الكتالوج (numpy + mmap) مشتركة بين workers، تستعملها قوائم المنتجات
+PRODUCT_SNAPSHOT_ENABLED = True
+PRODUCT_SNAPSHOT_DIR = os.path.join(BASE_DIR, '.catalog_snapshot')
+# البناء الكامل في thread بالخلفية؛ حتى ينتهي تُجاب القوائم من ORM
+PRODUCT_SNAPSHOT_ASYNC = True
+
+# feed الكتالوج (/products/feed.xml و manage.py export_products_feed): العملة (ISO 4217) وعنوان القناة
+PRODUCT_FEED_CURRENCY = "MAD"
+PRODUCT_FEED_TITLE = "Products"
+# /products/feed.<fmt> يرسل ملفًا من هنا، ويُعاد توليده إذا كان أقدم من PRODUCT_FEED_MAX_AGE ثانية
+# (أو من cron: manage.py export_products_feed --format xml)
+PRODUCT_FEED_DIR = os.path.join(BASE_DIR, '.product_feeds')
+PRODUCT_FEED_MAX_AGE = 3600
+
+
+# أرقام الطلبات تُحجز على دفعات لكل process (orders/sequences.py)
+ORDER_NUMBER_BLOCK_SIZE = 20
+
+# عدد استعمالات الكوبون في الـ cache لـ apply-promo (orders/coupons.py)؛ الـ checkout يتحقق دائمًا من قاعدة البيانات
+COUPON_CACHE_TTL = 30
+
+# Token bucket لنقاط الكتابة المفتوحة للزوار (website/throttling.py): لكل IP، و route_rate لكل الـ route
+THROTTLE_RATES = {
+    'ratings': {'rate': '5/min', 'burst': 5, 'route_rate': '120/min'},
+    'contact': {'rate': '3/min', 'burst': 5, 'route_rate': '60/min'},
+    'supplier_inquiry': {'rate': '3/min', 'burst': 5, 'route_rate': '60/min'},
+    'guest_order': {'rate': '10/min', 'burst': 10, 'route_rate': '600/min'},
+}
+# حالة الـ buckets مشتركة بين workers نفس الجهاز؛ لعدة أجهزة:
+# {'BACKEND': 'website.throttling.RedisBucketStore', 'OPTIONS': {'url': 'redis://...'}}
+THROTTLE_STORE = {
+    'BACKEND': 'website.throttling.SharedFileBucketStore',
+    'OPTIONS': {'path': os.path.join(BASE_DIR, '.throttle_state')},
+}
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -170,6 +250,9 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    # عدد الـ reverse proxies أمام Django (nginx = 1). بدونه يقرأ DRF قيمة X-Forwarded-For
+    # كما يرسلها العميل، فيغير الـ IP في كل طلب ويتجاوز الـ throttling. 0 = REMOTE_ADDR فقط
+    'NUM_PROXIES': 0,
 }
 
 from datetime import timedelta
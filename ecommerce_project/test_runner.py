@@ -0,0 +1,33 @@
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class IsolatedTestRunner(DiscoverRunner):
+    """
+    قاعدة الاختبارات ملف (test_db.sqlite3) وليست في الذاكرة، فالـ snapshot والـ cache يعملان فيها كما في الإنتاج.
+    لذلك كل ما يُكتب على القرص (cache، snapshot الكتالوج، صور مصغرة، feeds، حالة الـ throttling) يذهب لمجلد
+    مؤقت يُحذف بعد الاختبارات، و الـ cache في الذاكرة: لا شيء يختلط مع .django_cache أو db.sqlite3 تبع التطوير.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.temp_dir = tempfile.mkdtemp(prefix='ecommerce-tests-')
+        self.isolated_settings = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'}},
+            PRODUCT_SNAPSHOT_DIR=f'{self.temp_dir}/catalog_snapshot',
+            IMAGE_CACHE_DIR=f'{self.temp_dir}/image_cache',
+            PRODUCT_FEED_DIR=f'{self.temp_dir}/product_feeds',
+            THROTTLE_STORE={
+                'BACKEND': 'website.throttling.SharedFileBucketStore',
+                'OPTIONS': {'path': f'{self.temp_dir}/throttle_state'},
+            },
+        )
+        self.isolated_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.isolated_settings.disable()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
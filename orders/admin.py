@@ -3,7 +3,6 @@ from .models import *
 # Register your models here.
 
 admin.site.register(Cart)
-admin.site.register(Order)
 admin.site.register(CartItem)
 admin.site.register(SupplierInquiry)
 admin.site.register(wishlist)
@@ -28,13 +27,24 @@ class TaxAdmin(admin.ModelAdmin):
 
 @admin.register(ShippingFee)
 class ShippingFeeAdmin(admin.ModelAdmin):
-    list_display = ("region", "cost", "estimated_days", "active")
+    list_display = ("region", "aliases", "cost", "estimated_days", "active")
     list_filter = ("active",)
-    search_fields = ("region",)
+    search_fields = ("region", "aliases")
 
 
 @admin.register(ServiceFee)
 class ServiceFeeAdmin(admin.ModelAdmin):
     list_display = ("name", "cost", "active")
     list_filter = ("active",)
-    search_fields = ("name",)
\ No newline at end of file
+    search_fields = ("name",)
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    readonly_fields = ("product", "product_name", "quantity", "unit_price", "options", "color", "size")
+
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    inlines = [OrderItemInline]
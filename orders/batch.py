@@ -0,0 +1,191 @@
+"""
+تعديلات السلة والمفضلة على دفعات: قائمة عمليات في طلب واحد و transaction واحد، بعدد queries ثابت.
+
+السلة: {"operations": [
+    {"op": "add", "product_id": "...", "quantity": 2, "color": "Red", "size": "M", "options": null},
+    {"op": "set", "item_id": 12, "quantity": 3},
+    {"op": "change", "item_id": 12, "quantity_change": -1},
+    {"op": "remove", "item_id": 12},
+]}
+المفضلة: {"operations": [{"op": "add", "product_id": "..."}, {"op": "remove", "product_id": "..."}]}
+
+كل العمليات محصورة في سلة/مفضلة المستخدم (cart__user=user)؛ أي عملية غير صالحة ترفض الدفعة كلها.
+الترتيب: add ثم set ثم change ثم remove، وكل عنصر يظهر مرة واحدة على الأكثر في set/change/remove.
+"""
+import uuid
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+
+from products.models import Product
+from .cart_summary import schedule_cart_refresh
+from .models import Cart, CartItem, wishlist, wishlistItem
+
+
+MAX_OPERATIONS = 100
+CART_OPERATIONS = ('add', 'set', 'change', 'remove')
+WISHLIST_OPERATIONS = ('add', 'remove')
+
+
+class BatchError(Exception):
+    def __init__(self, message, index=None):
+        super().__init__(message)
+        self.index = index
+
+    def as_data(self):
+        return {"error": str(self), "index": self.index}
+
+
+def _product_id(operation, index):
+    try:
+        return uuid.UUID(str(operation.get('product_id')))
+    except ValueError:
+        raise BatchError("Invalid product_id", index)
+
+
+def _int(operation, field, index, minimum=None, default=None):
+    try:
+        value = int(operation.get(field, default))
+    except (TypeError, ValueError):
+        raise BatchError(f"Invalid {field}", index)
+    if minimum is not None and value < minimum:
+        raise BatchError(f"Invalid {field}", index)
+    return value
+
+
+def _parse(operations, allowed):
+    if not isinstance(operations, list) or not operations:
+        raise BatchError("operations must be a non-empty list")
+    if len(operations) > MAX_OPERATIONS:
+        raise BatchError(f"At most {MAX_OPERATIONS} operations per request")
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in allowed:
+            raise BatchError(f"op must be one of {', '.join(allowed)}", index)
+        yield index, operation
+
+
+def _check_products(product_ids):
+    missing = set(product_ids) - set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+    if missing:
+        return next(index for product_id, index in product_ids.items() if product_id in missing)
+    return None
+
+
+def _quantities(values):
+    return Case(
+        *[When(pk=item_id, then=Value(quantity)) for item_id, quantity in values.items()],
+        default=Value(0), output_field=IntegerField(),
+    )
+
+
+def apply_cart_operations(user, operations):
+    """
+    يرجع عدد العمليات التي غيّرت شيئًا. BatchError = لا شيء تغير.
+    """
+    adds, sets, changes, removes = {}, {}, {}, set()
+    products = {}  # product_id → index أول عملية (للخطأ)
+    touched = set()
+    for index, operation in _parse(operations, CART_OPERATIONS):
+        if operation['op'] == 'add':
+            product_id = _product_id(operation, index)
+            key = (product_id, *(operation.get(field) or None for field in ('color', 'size', 'options')))
+            adds[key] = adds.get(key, 0) + _int(operation, 'quantity', index, minimum=1, default=1)
+            products.setdefault(product_id, index)
+            continue
+
+        item_id = _int(operation, 'item_id', index)
+        if item_id in touched:
+            raise BatchError("Each item can appear once in set/change/remove", index)
+        touched.add(item_id)
+        if operation['op'] == 'set':
+            sets[item_id] = _int(operation, 'quantity', index, minimum=0)
+        elif operation['op'] == 'change':
+            changes[item_id] = _int(operation, 'quantity_change', index)
+        else:
+            removes.add(item_id)
+
+    # set 0 = حذف
+    removes.update(item_id for item_id, quantity in sets.items() if quantity == 0)
+    sets = {item_id: quantity for item_id, quantity in sets.items() if quantity > 0}
+    owned = CartItem.objects.filter(cart__user=user)
+    changed = 0
+
+    with transaction.atomic():
+        if adds:
+            missing = _check_products(products)
+            if missing is not None:
+                raise BatchError("Product not found", missing)
+            cart = Cart.objects.filter(user=user).first() or Cart.objects.create(user=user)
+            existing = {
+                (item.product_id, item.color, item.size, item.options): item
+                for item in owned.filter(product_id__in=products)
+            }
+            created, restored = [], []
+            for key, quantity in adds.items():
+                item = existing.get(key)
+                if item is None:
+                    product_id, color, size, options = key
+                    created.append(CartItem(
+                        cart=cart, product_id=product_id, quantity=quantity, color=color, size=size, options=options,
+                    ))
+                elif item.is_ordered:
+                    # نفس سلوك Add_To_Cart: المطلوب سابقًا يرجع للسلة بالكمية الجديدة
+                    item.is_ordered, item.quantity = False, quantity
+                    restored.append(item)
+            CartItem.objects.bulk_create(created)
+            CartItem.objects.bulk_update(restored, ['is_ordered', 'quantity'])
+            changed += len(created) + len(restored)
+
+        active = owned.filter(is_ordered=False)
+        if sets:
+            if active.filter(pk__in=sets).update(quantity=_quantities(sets)) != len(sets):
+                raise BatchError("Cart item not found")
+            changed += len(sets)
+        if changes:
+            # F(): نقرتان في نفس الوقت لا تضيع إحداهما
+            updated = active.filter(pk__in=changes).update(quantity=Greatest(F('quantity') + _quantities(changes), Value(0)))
+            if updated != len(changes):
+                raise BatchError("Cart item not found")
+            changed += updated
+            removes.update(active.filter(pk__in=changes, quantity=0).values_list('pk', flat=True))
+        if removes:
+            deleted, _ = active.filter(pk__in=removes).delete()
+            if deleted != len(removes):
+                raise BatchError("Cart item not found")
+            changed += deleted
+
+        # update/bulk لا تطلق post_save: الملخص يُكتب بعد الـ commit
+        schedule_cart_refresh(user.pk)
+    return changed
+
+
+def apply_wishlist_operations(user, operations):
+    adds, removes = {}, set()
+    for index, operation in _parse(operations, WISHLIST_OPERATIONS):
+        product_id = _product_id(operation, index)
+        if operation['op'] == 'add':
+            adds.setdefault(product_id, index)
+            removes.discard(product_id)
+        else:
+            removes.add(product_id)
+            adds.pop(product_id, None)
+
+    owned = wishlistItem.objects.filter(wishlist__user=user)
+    changed = 0
+    with transaction.atomic():
+        if adds:
+            missing = _check_products(adds)
+            if missing is not None:
+                raise BatchError("Product not found", missing)
+            user_wishlist = wishlist.objects.filter(user=user).first() or wishlist.objects.create(user=user)
+            present = set(owned.filter(product_id__in=adds).values_list('product_id', flat=True))
+            created = wishlistItem.objects.bulk_create([
+                wishlistItem(wishlist=user_wishlist, product_id=product_id)
+                for product_id in adds if product_id not in present
+            ])
+            changed += len(created)
+        if removes:
+            deleted, _ = owned.filter(product_id__in=removes).delete()
+            changed += deleted
+    return changed
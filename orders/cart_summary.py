@@ -0,0 +1,145 @@
+"""
+ملخص سلة كل مستخدم في الـ cache المشترك: العناصر (بنفس شكل الـ API)، مجموع كل سطر، subtotal وعدد العناصر.
+
+صفحة السلة وعداد السلة في الـ header يقرآن الملخص فقط (بدون أي query على CartItem أو Product).
+كل تعديل على السلة يعيد بناء الملخص ويكتبه بعد الـ commit (write-through):
+- حفظ/حذف CartItem عبر post_save/post_delete (orders/signals.py)
+- العمليات الجماعية بدون signals (الـ checkout، دمج سلة الزائر) تنادي schedule_cart_refresh
+- تغيير سعر/اسم منتج (catalog_changed) يُسقط ملخصات السلات التي فيها هذا المنتج
+
+المفتاح فيه رقم نسخة لكل مستخدم يزيد بعد كل commit قبل إعادة البناء: بناء قديم (commit سابق، أو قراءة
+بدأت قبل الـ commit) يُكتب تحت نسخة لم يعد أحد يقرأها، فلا يغطي على الملخص الجديد.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from products.cards import get_cards
+from products.catalog import current_batch
+from products.serializers import ProductCardSerializer
+from .models import CartItem
+from .pricing import ZERO, money
+
+
+CART_SUMMARY_TIMEOUT = 7 * 24 * 3600
+
+_pending = threading.local()
+
+
+def cart_version_key(user_id):
+    return f'orders:cart-version:{user_id}'
+
+
+def get_cart_version(user_id):
+    key = cart_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # نبدأ من الوقت وليس 1: نسخة حُذفت من الـ cache لا ترجع لرقم قديم ما زال ملخصه محفوظًا
+        version = time.time_ns()
+        cache.add(key, version, timeout=None)
+        version = cache.get(key, version)
+    return version
+
+
+def bump_cart_version(user_id):
+    try:
+        return cache.incr(cart_version_key(user_id))
+    except ValueError:
+        return get_cart_version(user_id)
+
+
+def cart_summary_key(user_id, version=None):
+    if version is None:
+        version = get_cart_version(user_id)
+    return f'orders:cart-summary:{user_id}:{version}'
+
+
+def build_cart_summary(user_id):
+    """
+    query على عناصر السلة + query على ProductCard، مهما كان عدد العناصر
+    """
+    rows = list(
+        CartItem.objects.filter(cart__user_id=user_id, is_ordered=False)
+        .order_by('pk').values('id', 'product_id', 'quantity', 'options', 'color', 'size')
+    )
+    cards = {card.product_id: card for card in get_cards({row['product_id'] for row in rows})}
+
+    items, lines = [], []
+    for row in rows:
+        card = cards.get(row['product_id'])
+        if card is None:
+            continue
+        items.append({
+            "id": row['id'],
+            "product": ProductCardSerializer(card).data,
+            "quantity": row['quantity'],
+            "total": card.price * row['quantity'],
+            "options": row['options'],
+            "color": row['color'],
+            "size": row['size'],
+            "is_ordered": False,
+        })
+        lines.append((card.price, row['quantity']))
+
+    return {
+        "items": items,
+        "lines": lines,  # [(سعر الوحدة، الكمية)] لـ price_cart
+        "item_count": len(items),
+        "quantity": sum(quantity for _, quantity in lines),
+        "subtotal": money(sum((price * quantity for price, quantity in lines), ZERO)),
+    }
+
+
+def get_cart_summary(user_id):
+    key = cart_summary_key(user_id)
+    summary = cache.get(key)
+    if summary is None:
+        summary = build_cart_summary(user_id)
+        cache.set(key, summary, CART_SUMMARY_TIMEOUT)
+    return summary
+
+
+def refresh_cart_summaries(user_ids):
+    # النسخة تزيد قبل القراءة من قاعدة البيانات: آخر نسخة دائمًا مبنية بعد آخر commit
+    summaries = {}
+    for user_id in user_ids:
+        version = bump_cart_version(user_id)
+        summaries[cart_summary_key(user_id, version)] = build_cart_summary(user_id)
+    cache.set_many(summaries, CART_SUMMARY_TIMEOUT)
+
+
+class _RefreshBatch:
+    def __init__(self):
+        self.user_ids = set()
+
+    def __call__(self):
+        # أول callback يعيد بناء كل الملخصات، والباقي لا يجد شيئًا
+        user_ids, self.user_ids = self.user_ids, set()
+        if user_ids:
+            refresh_cart_summaries(user_ids)
+
+
+def schedule_cart_refresh(user_id):
+    """
+    عدة تعديلات في نفس الـ transaction (الـ checkout مثلًا) = إعادة بناء واحدة بعد الـ commit
+    """
+    if user_id is None:
+        return
+    # مثل schedule_catalog_change: بعد rollback يختفي الـ batch مع الـ callbacks
+    batch = current_batch(_pending, _RefreshBatch)
+    batch.user_ids.add(user_id)
+    transaction.on_commit(batch)
+
+
+def forget_carts_with_products(sender=None, product_ids=(), **kwargs):
+    """
+    receiver لـ catalog_changed: الملخصات التي فيها سعر قديم تصبح نسخة قديمة وتُبنى عند القراءة التالية
+    """
+    user_ids = (
+        CartItem.objects.filter(product_id__in=product_ids, is_ordered=False, cart__user__isnull=False)
+        .values_list('cart__user_id', flat=True).distinct()
+    )
+    for user_id in user_ids:
+        bump_cart_version(user_id)
@@ -0,0 +1,68 @@
+"""
+إنشاء الطلب من السلة في transaction واحد، بعدد queries ثابت مهما كان عدد المنتجات في السلة.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from products.catalog import schedule_sales_change
+from products.models import Product
+from .cart_summary import schedule_cart_refresh
+from .copurchase import record_order
+from .models import CartItem, Order, OrderItem
+
+
+class CartChanged(Exception):
+    """السلة تغيرت (طلب آخر أخذ نفس العناصر) أثناء الـ checkout"""
+
+
+def get_checkout_items(user):
+    """
+    عناصر السلة غير المطلوبة مع منتجاتها في query واحد. داخل transaction: مقفلة حتى الـ commit
+    (select_for_update على PostgreSQL؛ SQLite يقفل كل قاعدة البيانات بـ BEGIN IMMEDIATE)
+    """
+    queryset = CartItem.objects.filter(cart__user=user, is_ordered=False).select_related('product').order_by('pk')
+    if transaction.get_connection().in_atomic_block:
+        queryset = queryset.select_for_update(of=('self',))
+    return list(queryset)
+
+
+def place_order(items, **fields):
+    """
+    Order + سطر OrderItem لكل عنصر (bulk_create)، عناصر السلة تصبح مطلوبة بـ UPDATE واحد،
+    و sales_count يزيد بـ UPDATE واحد بـ F(). items: عناصر CartItem (العنصر بدون pk = طلب مباشر بدون سلة).
+    """
+    with transaction.atomic():
+        order = Order.objects.create(**fields)
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order, product=item.product, product_name=item.product.name, quantity=item.quantity,
+                unit_price=item.product.price, options=item.options, color=item.color, size=item.size,
+            )
+            for item in items
+        ])
+        product_ids = {item.product_id for item in items}
+        Order.products.through.objects.bulk_create(
+            [Order.products.through(order_id=order.pk, product_id=product_id) for product_id in product_ids],
+            ignore_conflicts=True,
+        )
+
+        cart_item_ids = [item.pk for item in items if item.pk is not None]
+        if cart_item_ids:
+            marked = CartItem.objects.filter(pk__in=cart_item_ids, is_ordered=False).update(is_ordered=True)
+            if marked != len(cart_item_ids):
+                raise CartChanged()
+            schedule_cart_refresh(order.user_id)
+
+        quantities = {}
+        for item in items:
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+        # طلبان في نفس الوقت لا يضيع أي منهما زيادة الآخر
+        Product.objects.filter(pk__in=quantities).update(sales_count=F('sales_count') + Case(
+            *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+            default=Value(0), output_field=IntegerField(),
+        ))
+        # update() لا يطلق post_save: sales_count في البطاقات و snapshot يتحدث بعد الـ commit
+        # (sales_changed وليس catalog_changed: لا إعادة فهرسة ولا نسخة كاش جديدة مع كل طلب)
+        schedule_sales_change(quantities)
+        record_order(product_ids)
+    return order
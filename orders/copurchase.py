@@ -0,0 +1,207 @@
+"""
+"يُشترى معًا عادةً": مصفوفة co-occurrence متناثرة (sparse) من الطلبات.
+
+ProductCoPurchase تحفظ المصفوفة في قاعدة البيانات (صف لكل زوج غير صفري + القطر = support).
+الطلب الجديد يحدثها مباشرة في CreateOrder.post (record_order)، والبناء الكامل من كل الطلبات
+يتم بـ numpy (build_pair_counts) عبر: python manage.py rebuild_copurchases
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+try:
+    import numpy as np
+except ImportError:  # numpy اختياري: الطلبات والاقتراحات تعمل بدونه، البناء الكامل فقط يحتاجه
+    np = None
+
+from .models import Order, ProductCoPurchase
+
+
+COMPANIONS_COUNT = 6
+MIN_PAIR_COUNT = 2  # زوج ظهر مرة واحدة فقط = صدفة
+COMPANIONS_CACHE_TIMEOUT = 10 * 60
+ORDERS_PER_CHUNK = 100_000
+
+
+def _cache_key(product_id):
+    return f'orders:bought-together:{product_id}'
+
+
+def record_order(product_ids):
+    """
+    تحديث تزايدي بعد طلب جديد: كل زوج (والقطر) +1، بـ 2 queries مهما كان عدد المنتجات
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    with transaction.atomic():
+        ProductCoPurchase.objects.bulk_create(
+            [ProductCoPurchase(product_id=a, companion_id=b) for a in product_ids for b in product_ids],
+            ignore_conflicts=True,
+        )
+        # UPDATE واحد بـ F(): طلبان في نفس الوقت لا يضيع أي منهما زيادة الآخر
+        ProductCoPurchase.objects.filter(
+            product_id__in=product_ids, companion_id__in=product_ids,
+        ).update(count=F('count') + 1)
+    cache.delete_many([_cache_key(pk) for pk in product_ids])
+
+
+def build_pair_counts(order_index, product_index, product_count):
+    """
+    من مصفوفتي (رقم الطلب، رقم المنتج) → COO متناثرة (rows, cols, counts) لكل الأزواج المرتبة + القطر.
+    كل الحساب numpy، على دفعات من الطلبات حتى تبقى الذاكرة محدودة.
+    """
+    order_index = np.asarray(order_index, dtype=np.int64)
+    product_index = np.asarray(product_index, dtype=np.int64)
+    # منتج مكرر في نفس الطلب يحسب مرة واحدة
+    entries = np.unique(order_index * product_count + product_index)
+    order_index, product_index = entries // product_count, entries % product_count
+
+    keys = np.empty(0, dtype=np.int64)
+    counts = np.empty(0, dtype=np.int64)
+    boundaries = np.searchsorted(order_index, np.arange(0, order_index.max(initial=-1) + 1, ORDERS_PER_CHUNK))
+    boundaries = np.append(boundaries, len(order_index))
+    for low, high in zip(boundaries[:-1], boundaries[1:]):
+        chunk_keys, chunk_counts = _chunk_pairs(order_index[low:high], product_index[low:high], product_count)
+        keys, counts = _merge(keys, counts, chunk_keys, chunk_counts)
+    return keys // product_count, keys % product_count, counts
+
+
+def _chunk_pairs(orders, products, product_count):
+    if not len(orders):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    # orders مرتبة: كل طلب = مقطع متصل [start, start + size)
+    starts = np.flatnonzero(np.r_[True, orders[1:] != orders[:-1]])
+    sizes = np.diff(np.r_[starts, len(orders)])
+    size_of_entry = np.repeat(sizes, sizes)
+    start_of_entry = np.repeat(starts, sizes)
+
+    # كل عنصر يتكرر بعدد عناصر طلبه، ويقابل كل عنصر في نفس الطلب (بما فيه نفسه = القطر)
+    left = np.repeat(products, size_of_entry)
+    repeat_start = np.repeat(np.cumsum(size_of_entry) - size_of_entry, size_of_entry)
+    offset = np.arange(len(left)) - repeat_start
+    right = products[np.repeat(start_of_entry, size_of_entry) + offset]
+    return np.unique(left * product_count + right, return_counts=True)
+
+
+def _merge(keys, counts, new_keys, new_counts):
+    if not len(keys):
+        return new_keys, new_counts.astype(np.int64)
+    all_keys = np.concatenate((keys, new_keys))
+    all_counts = np.concatenate((counts, new_counts))
+    merged, inverse = np.unique(all_keys, return_inverse=True)
+    return merged, np.bincount(inverse, weights=all_counts).astype(np.int64)
+
+
+def score_pairs(pair_counts, product_support, companion_support, total_orders):
+    """
+    confidence = P(companion | product)، lift = confidence / P(companion). كلها عمليات على مصفوفات.
+    """
+    pair_counts = np.asarray(pair_counts, dtype=np.float64)
+    product_support = np.asarray(product_support, dtype=np.float64)
+    companion_support = np.asarray(companion_support, dtype=np.float64)
+    confidence = pair_counts / np.maximum(product_support, 1)
+    lift = confidence * total_orders / np.maximum(companion_support, 1)
+    return confidence, lift
+
+
+def top_companions(rows, cols, counts, support, total_orders, k=COMPANIONS_COUNT):
+    """
+    أفضل k لكل منتج من COO كاملة (rows, cols, counts): ترتيب حسب lift ثم confidence، بدون حلقات Python على الأزواج
+    """
+    keep = (rows != cols) & (counts >= MIN_PAIR_COUNT)
+    rows, cols, counts = rows[keep], cols[keep], counts[keep]
+    confidence, lift = score_pairs(counts, support[rows], support[cols], total_orders)
+    order = np.lexsort((-confidence, -lift, rows))
+    rows, cols = rows[order], cols[order]
+    # الترتيب داخل كل منتج: رقم العنصر منذ بداية مجموعته
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.empty(0, dtype=np.int64)
+    rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+    best = rank < k
+    return rows[best], cols[best], lift[order][best], confidence[order][best]
+
+
+def rebuild_copurchases():
+    """
+    إعادة بناء ProductCoPurchase من كل الطلبات (للتصحيح أو أول تشغيل)
+    """
+    links = Order.products.through.objects.values_list('order_id', 'product_id')
+    order_numbers, product_numbers, product_ids = {}, {}, []
+    order_index, product_index = [], []
+    for order_id, product_id in links.iterator(chunk_size=10_000):
+        order_index.append(order_numbers.setdefault(order_id, len(order_numbers)))
+        if product_id not in product_numbers:
+            product_numbers[product_id] = len(product_ids)
+            product_ids.append(product_id)
+        product_index.append(product_numbers[product_id])
+
+    rows, cols, counts = build_pair_counts(order_index, product_index, max(len(product_ids), 1))
+    with transaction.atomic():
+        ProductCoPurchase.objects.all().delete()
+        ProductCoPurchase.objects.bulk_create(
+            (
+                ProductCoPurchase(product_id=product_ids[a], companion_id=product_ids[b], count=int(n))
+                for a, b, n in zip(rows.tolist(), cols.tolist(), counts.tolist())
+            ),
+            batch_size=5000,
+        )
+    cache.delete_many([_cache_key(pk) for pk in product_ids])
+    return len(order_numbers), len(rows)
+
+
+def companions_for(product_ids, k=COMPANIONS_COUNT):
+    """
+    [(companion_id, lift, confidence)] لمجموعة منتجات (صفحة المنتج: واحد، السلة: كل منتجاتها).
+    لكل مرشح نأخذ أفضل lift عبر منتجات المجموعة.
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return []
+
+    pairs = list(
+        ProductCoPurchase.objects
+        .filter(product_id__in=product_ids, count__gte=MIN_PAIR_COUNT)
+        .exclude(companion_id__in=product_ids)
+        .values_list('product_id', 'companion_id', 'count')
+    )
+    if not pairs:
+        return []
+    companion_ids = {companion for _, companion, _ in pairs}
+    support = dict(
+        ProductCoPurchase.objects
+        .filter(product_id__in=product_ids | companion_ids, companion_id=F('product_id'))
+        .values_list('product_id', 'count')
+    )
+    total_orders = Order.objects.count()
+
+    products, companions, counts = zip(*pairs)
+    product_support = [support.get(pk, 0) for pk in products]
+    companion_support = [support.get(pk, 0) for pk in companions]
+
+    # أفضل قيمة لكل مرشح (أفضل lift، وعند التساوي أفضل confidence)
+    if np is None:
+        # نفس الحساب بـ Python: أزواج منتجات الصفحة/السلة فقط، قليلة
+        confidence = [count / max(n, 1) for count, n in zip(counts, product_support)]
+        lift = [value * total_orders / max(n, 1) for value, n in zip(confidence, companion_support)]
+        order = sorted(range(len(pairs)), key=lambda i: (-lift[i], -confidence[i]))
+    else:
+        confidence, lift = score_pairs(counts, product_support, companion_support, total_orders)
+        order = np.lexsort((-confidence, -lift)).tolist()
+    result, seen = [], set()
+    for i in order:
+        if companions[i] in seen:
+            continue
+        seen.add(companions[i])
+        result.append((companions[i], round(float(lift[i]), 3), round(float(confidence[i]), 3)))
+        if len(result) == k:
+            break
+    return result
+
+
+def get_companions(product_id, k=COMPANIONS_COUNT):
+    key = _cache_key(product_id)
+    companions = cache.get(key)
+    if companions is None:
+        companions = companions_for([product_id], k=k)
+        cache.set(key, companions, COMPANIONS_CACHE_TIMEOUT)
+    return companions
@@ -0,0 +1,64 @@
+"""
+استعمال الكوبونات بدون تجاوز usage_limit مهما كان عدد الطلبات في نفس الوقت.
+
+البحث بالكود من snapshot التسعير (orders/pricing.py) بدون query. عدد الاستعمالات (used_count) يتغير
+مع كل طلب فلا يدخل في الـ snapshot: نسخة منه في الـ cache لمدة قصيرة (COUPON_CACHE_TTL) تكفي لرفض
+كوبون منتهٍ في apply-promo. القرار النهائي في الـ checkout: UPDATE واحد بشرط (مفعل، تحت الحد، داخل
+الفترة) يزيد used_count، داخل transaction الطلب، فإذا فشل الطلب يرجع العداد.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Coupon, CouponUsage
+
+
+COUPON_CACHE_TTL = 30  # ثواني
+
+
+class CouponUnavailable(Exception):
+    """الكوبون انتهى (الحد، الفترة، غير مفعل) أو استعمله هذا المستخدم من قبل"""
+
+
+def _used_count_key(coupon_id):
+    return f'orders:coupon-used:{coupon_id}'
+
+
+def get_used_count(coupon_id):
+    key = _used_count_key(coupon_id)
+    used_count = cache.get(key)
+    if used_count is None:
+        used_count = Coupon.objects.filter(pk=coupon_id).values_list('used_count', flat=True).first() or 0
+        cache.set(key, used_count, getattr(settings, 'COUPON_CACHE_TTL', COUPON_CACHE_TTL))
+    return used_count
+
+
+def has_uses_left(coupon):
+    """
+    coupon: CouponRule. تقريبي (قد يتأخر COUPON_CACHE_TTL ثانية)، الـ checkout يتحقق من جديد
+    """
+    return coupon.usage_limit is None or get_used_count(coupon.id) < coupon.usage_limit
+
+
+def redeem_coupon(coupon_id, user, now=None):
+    """
+    استعمال واحد للكوبون من طرف user داخل الـ transaction الحالي، أو CouponUnavailable
+    """
+    now = now or timezone.now()
+    try:
+        with transaction.atomic():
+            CouponUsage.objects.create(coupon_id=coupon_id, user=user)
+    except IntegrityError:
+        raise CouponUnavailable("Coupon already used by this user")
+
+    redeemed = Coupon.objects.filter(
+        Q(start_date__isnull=True) | Q(start_date__lte=now),
+        Q(end_date__isnull=True) | Q(end_date__gte=now),
+        pk=coupon_id, active=True, used_count__lt=F('usage_limit'),
+    ).update(used_count=F('used_count') + 1)
+    if not redeemed:
+        raise CouponUnavailable("Invalid or expired coupon")
+
+    transaction.on_commit(lambda: cache.delete(_used_count_key(coupon_id)))
@@ -0,0 +1,181 @@
+"""
+سلة الزائر (بدون حساب) في cookie موقّع ومضغوط، بدون أي صف في قاعدة البيانات.
+
+كل سطر: [id، المنتج (uuid hex)، الكمية، color، size، options] (القيم الفارغة في الآخر تُحذف).
+الأسعار والأسماء من ProductCard (get_cards: query واحد لكل السلة). عند تسجيل الدخول
+(CookieTokenObtainPairView) تُدمج السلة في Cart/CartItem بـ bulk_create + bulk_update ثم يُحذف الـ cookie.
+"""
+import uuid
+from dataclasses import dataclass
+
+from django.core import signing
+from django.db import transaction
+
+from products.cards import get_cards
+from products.models import Product
+from products.serializers import ProductCardSerializer
+from .cart_summary import schedule_cart_refresh
+from .models import Cart, CartItem
+
+
+GUEST_CART_COOKIE = 'guest_cart'
+GUEST_CART_SALT = 'orders.guest_cart'
+GUEST_CART_MAX_AGE = 30 * 24 * 3600
+GUEST_CART_MAX_LINES = 50
+GUEST_CART_MAX_COOKIE_BYTES = 4000  # المتصفحات ترفض cookie أكبر من 4KB (مع الاسم والخصائص)
+# الكمية تدخل CartItem.quantity عند الدمج: رقم ضخم = OverflowError في SQLite
+GUEST_CART_MAX_QUANTITY = 99
+# color / size / options تُقص لطول حقول CartItem، حتى لا يفشل الدمج عند تسجيل الدخول
+GUEST_CHOICE_MAX_LENGTH = CartItem._meta.get_field('options').max_length
+
+
+@dataclass
+class GuestLine:
+    id: int
+    product_id: uuid.UUID
+    quantity: int = 1
+    color: str = None
+    size: str = None
+    options: str = None
+
+    @property
+    def key(self):
+        # نفس شروط "نفس المنتج" في Add_To_Cart
+        return (self.product_id, self.color, self.size, self.options)
+
+
+def guest_quantity(value):
+    """
+    الكمية بين 1 و GUEST_CART_MAX_QUANTITY. ValueError/TypeError إذا لم تكن رقمًا.
+    """
+    return min(max(1, int(value)), GUEST_CART_MAX_QUANTITY)
+
+
+def load_guest_cart(request):
+    value = request.COOKIES.get(GUEST_CART_COOKIE)
+    if not value:
+        return []
+    try:
+        rows = signing.loads(value, salt=GUEST_CART_SALT, max_age=GUEST_CART_MAX_AGE)
+    except signing.BadSignature:
+        return []
+
+    lines = []
+    for row in rows if isinstance(rows, list) else []:
+        try:
+            line_id, product_id, quantity, *choices = row
+            lines.append(GuestLine(int(line_id), uuid.UUID(product_id), guest_quantity(quantity), *choices[:3]))
+        except (TypeError, ValueError):
+            continue
+    return lines[:GUEST_CART_MAX_LINES]
+
+
+def encode_guest_cart(lines):
+    rows = []
+    for line in lines:
+        row = [line.id, line.product_id.hex, line.quantity, line.color, line.size, line.options]
+        while row[-1] is None:
+            row.pop()
+        rows.append(row)
+    return signing.dumps(rows, salt=GUEST_CART_SALT, compress=True)
+
+
+def guest_cart_fits(lines):
+    return len(encode_guest_cart(lines)) <= GUEST_CART_MAX_COOKIE_BYTES
+
+
+def save_guest_cart(response, lines):
+    if not lines:
+        response.delete_cookie(GUEST_CART_COOKIE)
+        return
+    response.set_cookie(
+        GUEST_CART_COOKIE,
+        encode_guest_cart(lines),
+        max_age=GUEST_CART_MAX_AGE,
+        httponly=True,
+        samesite='Lax',
+    )
+
+
+def add_guest_line(lines, product_id, quantity=1, color=None, size=None, options=None):
+    """
+    يرجع السطر الجديد، أو None إذا كان نفس المنتج (بنفس الاختيارات) في السلة
+    """
+    color, size, options = (
+        str(value)[:GUEST_CHOICE_MAX_LENGTH] if value is not None else None
+        for value in (color, size, options)
+    )
+    line = GuestLine(
+        max((line.id for line in lines), default=0) + 1, product_id, guest_quantity(quantity), color, size, options,
+    )
+    if any(existing.key == line.key for existing in lines):
+        return None
+    lines.append(line)
+    return line
+
+
+def guest_cart_items(lines, request=None):
+    """
+    (بيانات العناصر بنفس شكل CartItemSerializer، [(السعر، الكمية)] للتسعير).
+    المنتجات المحذوفة أو غير المفعلة لا تظهر.
+    """
+    cards = {card.product_id: card for card in get_cards({line.product_id for line in lines})}
+    items, price_lines = [], []
+    for line in lines:
+        card = cards.get(line.product_id)
+        if card is None or not card.is_active:
+            continue
+        items.append({
+            "id": line.id,
+            "product": ProductCardSerializer(card, context={"request": request}).data,
+            "quantity": line.quantity,
+            "total": card.price * line.quantity,
+            "options": line.options,
+            "color": line.color,
+            "size": line.size,
+            "is_ordered": False,
+        })
+        price_lines.append((card.price, line.quantity))
+    return items, price_lines
+
+
+def merge_guest_cart(user_id, lines):
+    """
+    سطور الزائر → CartItem للمستخدم بعدد queries ثابت. نفس المنتج الموجود: الكمية الأكبر
+    (دمج نفس السلة مرتين لا يضاعف الكميات)، والمطلوب سابقًا (is_ordered) يرجع للسلة.
+    """
+    if not lines:
+        return 0
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(user_id=user_id)
+        lines = list({line.key: line for line in lines}.values())
+        product_ids = {line.product_id for line in lines}
+        available = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+        existing = {
+            (item.product_id, item.color, item.size, item.options): item
+            for item in CartItem.objects.filter(cart=cart, product_id__in=available)
+        }
+
+        created, updated = [], []
+        for line in lines:
+            if line.product_id not in available:
+                continue
+            item = existing.get(line.key)
+            if item is None:
+                item = CartItem(
+                    cart=cart, product_id=line.product_id, quantity=line.quantity,
+                    color=line.color, size=line.size, options=line.options,
+                )
+                created.append(item)
+            elif item.is_ordered:
+                item.is_ordered = False
+                item.quantity = line.quantity
+                updated.append(item)
+            elif line.quantity > item.quantity:
+                item.quantity = line.quantity
+                updated.append(item)
+
+        CartItem.objects.bulk_create(created)
+        CartItem.objects.bulk_update(updated, ['quantity', 'is_ordered'])
+        schedule_cart_refresh(user_id)
+    return len(created) + len(updated)
@@ -0,0 +1,97 @@
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ecommerce_project.test_runner import IsolatedTestRunner
+from orders.models import Cart, CartItem, Order, Tax
+from orders.sequences import order_numbers
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark checkout throughput: the same orders in one thread, then spread over several threads. "
+        "Runs against a throwaway test database, so the real data and cache are never touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=240, help="Orders placed under load.")
+        parser.add_argument("--baseline", type=int, default=40, help="Orders placed in a single thread first.")
+        parser.add_argument("--threads", type=int, default=8)
+
+    def handle(self, *args, **options):
+        # نفس عزل الاختبارات: قاعدة test_db.sqlite3 مؤقتة، cache في الذاكرة ومجلدات مؤقتة
+        runner = IsolatedTestRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        databases = runner.setup_databases()
+        try:
+            with override_settings(THROTTLE_RATES={}):
+                self.benchmark(options["baseline"], options["orders"], options["threads"])
+        finally:
+            runner.teardown_databases(databases)
+            runner.teardown_test_environment()
+
+    def requests(self, count, offset):
+        """
+        [(client، url، data)]: نصفها checkout من سلة مستخدم، ونصفها طلب مباشر بدون حساب
+        """
+        User = get_user_model()
+        product = Product.objects.get()
+        customer = {"customer_name": "Buyer", "customer_phone": "0600", "customer_address": "Street 1"}
+        requests = []
+        for i in range(offset, offset + count):
+            if i % 2:
+                requests.append((Client(), f"/orders/api/orders/create/{product.pk}/", customer))
+                continue
+            user = User.objects.create_user(email=f"bench{i}@example.com", username=f"bench{i}")
+            CartItem.objects.create(cart=Cart.objects.create(user=user), product=product, quantity=1)
+            client = Client()
+            client.cookies["access_token"] = str(AccessToken.for_user(user))
+            requests.append((client, "/orders/user/orders/create/", {**customer, "city": "Rabat", "total": "50", "is_use_coupon": False}))
+        return requests
+
+    def run(self, requests, threads):
+        statuses = []
+
+        def worker(batch):
+            try:
+                for client, url, data in batch:
+                    statuses.append(client.post(url, data, content_type="application/json").status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(requests[i::threads],)) for i in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        failed = len(statuses) - statuses.count(201)
+        self.stdout.write(
+            f"{threads:>2} thread(s): {len(requests)} orders in {elapsed:.2f}s, "
+            f"{elapsed / len(requests) * 1000:.1f} ms/order, {failed} failed"
+        )
+        return elapsed / len(requests)
+
+    def benchmark(self, baseline, orders, threads):
+        order_numbers.reset()
+        Tax.objects.create(name="VAT", rate=0)
+        Product.objects.create(name="Lamp", price=50, description_1="Desk lamp", image_1="")
+
+        sequential = self.run(self.requests(baseline, 0), threads=1)
+        parallel = self.run(self.requests(orders, baseline), threads=threads)
+
+        numbers = list(Order.objects.values_list("order_number", flat=True))
+        if len(set(numbers)) != len(numbers):
+            self.stderr.write(f"Duplicate order numbers: {len(numbers) - len(set(numbers))}")
+        # SQLite يكتب واحدًا واحدًا: تحت الضغط الطلب الواحد يجب أن يبقى قريبًا من وقته في thread واحد
+        ratio = parallel / sequential
+        style = self.style.SUCCESS if ratio < 1.5 else self.style.WARNING
+        self.stdout.write(style(f"Per-order time under load: {ratio:.2f}x the single-thread time"))
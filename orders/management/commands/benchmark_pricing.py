@@ -0,0 +1,32 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from orders.pricing import get_pricing_rules, load_pricing_rules, price_cart
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark: pricing a cart from the cached rules snapshot vs. querying the rules on every call."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=2000)
+        parser.add_argument("--lines", type=int, default=5, help="Cart lines per quote.")
+
+    def run(self, label, func, iterations):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{label:<28} {iterations / elapsed:>10.0f} quotes/s  {elapsed / iterations * 1e6:>8.1f} us/quote")
+        return elapsed
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        lines = [(Decimal("19.99") + index, index % 3 + 1) for index in range(options["lines"])]
+
+        # الطريقة القديمة: القواعد تُقرأ من قاعدة البيانات في كل حساب
+        queried = self.run("rules queried per call", lambda: price_cart(lines, load_pricing_rules()), iterations)
+        get_pricing_rules()  # تسخين الـ snapshot
+        cached = self.run("cached snapshot", lambda: price_cart(lines, get_pricing_rules()), iterations)
+        self.stdout.write(self.style.SUCCESS(f"Speed-up: {queried / cached:.1f}x"))
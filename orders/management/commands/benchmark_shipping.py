@@ -0,0 +1,49 @@
+import random
+import string
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from orders.pricing import ShippingRule
+from orders.shipping import ShippingIndex
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark the in-memory shipping region index (exact, alias, prefix, partial and miss lookups)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--regions", type=int, default=10_000)
+        parser.add_argument("--lookups", type=int, default=20_000, help="Lookups per match type.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(7)
+
+        def word():
+            return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10)))
+
+        # مناطق وهمية بأسماء فيها accents وحروف كبيرة، ولكل منطقة alias
+        rules = [
+            ShippingRule(f"{word().title()}-É{index}", Decimal(rng.randint(10, 80)), rng.randint(1, 7), (f"{word()} {index}",))
+            for index in range(options["regions"])
+        ]
+
+        started = time.perf_counter()
+        index = ShippingIndex(rules)
+        self.stdout.write(f"build: {len(index)} keys in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        samples = rng.sample(rules, min(len(rules), 1000))
+        queries = {
+            "exact": [rule.region.upper() for rule in samples],
+            "alias": [rule.aliases[0] for rule in samples],
+            "prefix": [rule.region[:-2] for rule in samples],
+            "partial": [f"{rule.region} Quartier 20000" for rule in samples],
+            "miss": [f"zz{word()} {word()}" for _ in samples],
+        }
+        lookups = options["lookups"]
+        for label, texts in queries.items():
+            started = time.perf_counter()
+            for position in range(lookups):
+                index.lookup(texts[position % len(texts)])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{label:<8} {elapsed / lookups * 1e6:>6.2f} us/lookup")
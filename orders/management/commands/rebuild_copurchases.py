@@ -0,0 +1,61 @@
+import resource
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders import copurchase
+
+
+class Command(BaseCommand):
+    help = "Rebuild the frequently-bought-together co-occurrence matrix from all orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--benchmark", type=int, metavar="N", default=None,
+            help="Time and measure a build over N synthetic orders without touching the database.",
+        )
+        parser.add_argument("--products", type=int, default=20_000, help="Catalog size for --benchmark.")
+
+    def handle(self, *args, **options):
+        if copurchase.np is None:
+            raise CommandError("numpy is not installed.")
+        if options["benchmark"]:
+            return self.benchmark(options["benchmark"], options["products"])
+
+        started = time.perf_counter()
+        orders, pairs = copurchase.rebuild_copurchases()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {pairs} pair count(s) from {orders} order(s) in {elapsed:.2f}s."
+        ))
+
+    def benchmark(self, order_count, product_count):
+        np = copurchase.np
+        rng = np.random.default_rng(7)
+        # سلال من 1 إلى 6 منتجات، والمنتجات الأكثر شعبية تظهر أكثر (zipf)
+        sizes = rng.integers(1, 7, order_count)
+        order_index = np.repeat(np.arange(order_count), sizes)
+        product_index = (rng.zipf(1.3, len(order_index)) - 1) % product_count
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        rows, cols, counts = copurchase.build_pair_counts(order_index, product_index, product_count)
+        built = time.perf_counter()
+        support = np.zeros(product_count, dtype=np.int64)
+        diagonal = rows == cols
+        support[rows[diagonal]] = counts[diagonal]
+        best = copurchase.top_companions(rows, cols, counts, support, order_count)
+        scored = time.perf_counter()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        coo_bytes = rows.nbytes + cols.nbytes + counts.nbytes
+        self.stdout.write(f"orders:            {order_count} ({len(order_index)} lines, {product_count} products)")
+        self.stdout.write(f"non-zero pairs:    {len(rows)} ({coo_bytes / 2**20:.1f} MiB as COO)")
+        self.stdout.write(f"build:             {built - started:.2f}s")
+        self.stdout.write(f"score + top-k:     {scored - built:.2f}s ({len(best[0])} companions)")
+        self.stdout.write(f"peak numpy memory: {peak / 2**20:.1f} MiB")
+        self.stdout.write(self.style.SUCCESS(
+            f"max RSS:           {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB"
+        ))
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:27
+
+import django.db.models.deletion
+from collections import Counter
+from itertools import product as pairs_of
+
+from django.db import migrations, models
+
+
+def backfill_copurchases(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    ProductCoPurchase = apps.get_model('orders', 'ProductCoPurchase')
+
+    baskets = {}
+    for order_id, product_id in Order.products.through.objects.values_list('order_id', 'product_id'):
+        baskets.setdefault(order_id, set()).add(product_id)
+
+    counts = Counter()
+    for basket in baskets.values():
+        counts.update(pairs_of(basket, repeat=2))
+
+    ProductCoPurchase.objects.bulk_create(
+        [ProductCoPurchase(product_id=a, companion_id=b, count=n) for (a, b), n in counts.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+        ('products', '0012_product_neighbors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCoPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('companion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product')),
+            ],
+            options={
+                'unique_together': {('product', 'companion')},
+            },
+        ),
+        migrations.RunPython(backfill_copurchases, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-18 20:04
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_order_number(apps, schema_editor):
+    # الترقيم يكمل من آخر طلب موجود
+    Order = apps.get_model('orders', 'Order')
+    NumberSequence = apps.get_model('orders', 'NumberSequence')
+    last = Order.objects.aggregate(last=Max('order_number'))['last'] or 0
+    NumberSequence.objects.update_or_create(name='order_number', defaults={'value': last})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_product_copurchase'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_order_number, migrations.RunPython.noop),
+    ]
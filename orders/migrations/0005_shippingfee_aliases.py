@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 20:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_order_items'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shippingfee',
+            name='aliases',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -75,6 +75,7 @@ class Tax(models.Model):
 class ShippingFee(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     region = models.CharField(max_length=100)  # المنطقة أو المدينة
+    aliases = models.TextField(blank=True, default="")  # أسماء أخرى مفصولة بفاصلة: Casa, الدار البيضاء
     cost = models.DecimalField(max_digits=10, decimal_places=2)
     estimated_days = models.PositiveIntegerField(default=3)  # مدة التوصيل المتوقعة بالأيام
     active = models.BooleanField(default=True)
@@ -94,6 +95,17 @@ class ServiceFee(models.Model):
 
 
 
+class NumberSequence(models.Model):
+    """
+    عداد مشترك لأرقام متسلسلة (رقم الطلب...). value = آخر رقم محجوز، يُحجز على دفعات (orders/sequences.py)
+    """
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
 class Order(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='orders', null=True, blank=True)
     order_number = models.PositiveIntegerField(unique=True, null=True, blank=True)
@@ -145,11 +157,8 @@ class Order(models.Model):
     )
     def save(self, *args, **kwargs):
         if not self.order_number:
-            last_order = Order.objects.all().order_by('-order_number').first()
-            if last_order and last_order.order_number:
-                self.order_number = last_order.order_number + 1
-            else:
-                self.order_number = 1  # بداية الترقيم
+            from .sequences import next_order_number
+            self.order_number = next_order_number()
         if self.state == self.OrderState.DELIVERED:
             self.is_completed = True
         super().save(*args, **kwargs)
@@ -159,6 +168,44 @@ class Order(models.Model):
 
 
 
+class OrderItem(models.Model):
+    """
+    سطر في الطلب: المنتج، الكمية، وسعر الوحدة والاسم والخيارات وقت الشراء (لا تتغير إذا تغير المنتج لاحقًا)
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name='order_items')
+    product_name = models.CharField(max_length=300)
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    options = models.CharField(max_length=100, null=True, blank=True)
+    color = models.CharField(max_length=100, null=True, blank=True)
+    size = models.CharField(max_length=100, null=True, blank=True)
+
+    @property
+    def line_total(self):
+        return self.unit_price * self.quantity
+
+    def __str__(self):
+        return f"{self.quantity} × {self.product_name}"
+
+
+
+class ProductCoPurchase(models.Model):
+    """
+    عدد الطلبات التي فيها product و companion معًا (في الاتجاهين).
+    الصف product == companion = عدد الطلبات التي فيها المنتج (support). يحسب في orders/copurchase.py
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    companion = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'companion')
+
+    def __str__(self):
+        return f"{self.product_id} + {self.companion_id}: {self.count}"
+
+
 class SupplierInquiry(models.Model):
     item = models.CharField(max_length=255)  
     details = models.TextField(blank=True, null=True)  
@@ -0,0 +1,250 @@
+"""
+محرك التسعير الوحيد: السلة، الـ checkout، صفحة التأكيد وتطبيق الكوبون كلها تحسب المجاميع من هنا.
+
+قواعد التسعير (الضريبة، الخصم، الشحن، رسوم الخدمة، الكوبونات المفعلة) تُقرأ مرة واحدة في snapshot
+غير قابل للتعديل ومحفوظ في ذاكرة كل process. رقم نسخة في الـ cache المشترك يتغير عند أي حفظ في الأدمن
+(orders/signals.py)، وكل process يتحقق منه مرة كل RULES_CHECK_INTERVAL ثانية على الأكثر.
+الحساب نفسه (price_cart) دوال Decimal بدون أي query.
+
+الترتيب: subtotal → الخصم العام → الكوبون (نسبة مما بقي) → الضريبة على الباقي → + الشحن + رسوم الخدمة.
+الشحن حسب مدينة الزبون (rules.shipping_for، orders/shipping.py)، وإلا آخر ShippingFee مفعل.
+"""
+import time
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal
+from types import MappingProxyType
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Coupon, Discount, ServiceFee, ShippingFee, Tax
+from .shipping import ShippingIndex, split_aliases
+
+
+PRICING_VERSION_KEY = 'orders:pricing-version'
+RULES_CHECK_INTERVAL = 1.0  # ثواني
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+HUNDRED = Decimal('100')
+
+
+def money(value):
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+# ____________________________ القواعد ____________________________
+
+
+@dataclass(frozen=True)
+class TaxRule:
+    name: str
+    rate: Decimal
+
+
+@dataclass(frozen=True)
+class DiscountRule:
+    name: str
+    amount: Decimal
+    percent: Decimal
+
+
+@dataclass(frozen=True)
+class ShippingRule:
+    region: str
+    cost: Decimal
+    estimated_days: int
+    aliases: tuple = ()
+
+
+@dataclass(frozen=True)
+class ServiceFeeRule:
+    name: str
+    cost: Decimal
+
+
+@dataclass(frozen=True)
+class CouponRule:
+    id: str
+    code: str
+    percent: Decimal
+    start_date: object = None
+    end_date: object = None
+    usage_limit: int = None
+
+    def is_valid_at(self, now):
+        return (self.start_date is None or self.start_date <= now) and (self.end_date is None or now <= self.end_date)
+
+
+@dataclass(frozen=True)
+class PricingRules:
+    version: int
+    tax: TaxRule = None
+    discount: DiscountRule = None
+    shipping: ShippingRule = None
+    service_fee: ServiceFeeRule = None
+    coupons: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))  # id → CouponRule
+    coupon_codes: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))  # code → id
+    shipping_index: ShippingIndex = field(default_factory=ShippingIndex)
+
+    def shipping_for(self, city=None, prefix=False):
+        """
+        (ShippingRule، نوع التطابق) لمدينة الزبون؛ بدون تطابق: آخر ShippingFee مفعل و 'default'.
+        prefix=True لصفحة الاقتراحات فقط: السعر لا يُحسب من مدينة لم تكتمل.
+        """
+        rule, match = self.shipping_index.lookup(city, prefix=prefix) if city else (None, None)
+        if rule is None:
+            return self.shipping, 'default'
+        return rule, match
+
+    def get_coupon(self, coupon_id=None, code=None, now=None):
+        """
+        الكوبون المفعل وداخل فترة start_date/end_date الآن، أو None
+        """
+        if coupon_id is None and code is not None:
+            coupon_id = self.coupon_codes.get(code)
+        coupon = self.coupons.get(str(coupon_id)) if coupon_id else None
+        if coupon is None or not coupon.is_valid_at(now or timezone.now()):
+            return None
+        return coupon
+
+
+def _last_active(model):
+    # نفس القاعدة المستعملة سابقًا في كل الصفحات: .filter(active=True).last()
+    return model.objects.filter(active=True).order_by('pk').last()
+
+
+def load_pricing_rules(version=0):
+    tax = _last_active(Tax)
+    discount = _last_active(Discount)
+    shipping_rules = [
+        ShippingRule(fee.region, fee.cost, fee.estimated_days, tuple(split_aliases(fee.aliases)))
+        for fee in ShippingFee.objects.filter(active=True).order_by('pk')
+    ]
+    service_fee = _last_active(ServiceFee)
+    coupons = {
+        str(coupon.pk): CouponRule(
+            id=str(coupon.pk), code=coupon.code, percent=coupon.discount_percent,
+            start_date=coupon.start_date, end_date=coupon.end_date, usage_limit=coupon.usage_limit,
+        )
+        for coupon in Coupon.objects.filter(active=True).only(
+            'id', 'code', 'discount_percent', 'start_date', 'end_date', 'usage_limit',
+        )
+    }
+    return PricingRules(
+        version=version,
+        tax=TaxRule(tax.name, tax.rate) if tax else None,
+        discount=DiscountRule(discount.name, discount.amount, discount.percent) if discount else None,
+        shipping=shipping_rules[-1] if shipping_rules else None,
+        service_fee=ServiceFeeRule(service_fee.name, service_fee.cost) if service_fee else None,
+        coupons=MappingProxyType(coupons),
+        coupon_codes=MappingProxyType({coupon.code: coupon_id for coupon_id, coupon in coupons.items()}),
+        shipping_index=ShippingIndex(shipping_rules),
+    )
+
+
+def get_pricing_version():
+    version = cache.get(PRICING_VERSION_KEY)
+    if version is None:
+        cache.add(PRICING_VERSION_KEY, 1, timeout=None)
+        version = cache.get(PRICING_VERSION_KEY, 1)
+    return version
+
+
+def bump_pricing_version():
+    global _checked_at
+    _checked_at = None  # نفس الـ process يرى التغيير فورًا
+    try:
+        cache.incr(PRICING_VERSION_KEY)
+    except ValueError:
+        cache.set(PRICING_VERSION_KEY, 2, timeout=None)
+
+
+_rules = None
+_checked_at = None
+
+
+def get_pricing_rules():
+    """
+    الـ snapshot الحالي لهذا الـ process (يُقرأ من قاعدة البيانات فقط إذا تغيرت النسخة)
+    """
+    global _rules, _checked_at
+    now = time.monotonic()
+    if _rules is None or _checked_at is None or now - _checked_at > RULES_CHECK_INTERVAL:
+        version = get_pricing_version()
+        if _rules is None or _rules.version != version:
+            _rules = load_pricing_rules(version)
+        _checked_at = now
+    return _rules
+
+
+# ____________________________ الحساب ____________________________
+
+
+@dataclass(frozen=True)
+class Quote:
+    subtotal: Decimal
+    discount: Decimal
+    coupon_discount: Decimal
+    tax_rate: Decimal
+    tax: Decimal
+    shipping: Decimal
+    service_fee: Decimal
+    total: Decimal
+    coupon: CouponRule = None
+    shipping_rule: ShippingRule = None
+
+
+def cart_lines(items):
+    """
+    (سعر الوحدة، الكمية) من عناصر السلة (CartItem مع product)
+    """
+    return [(item.product.price, item.quantity) for item in items]
+
+
+def price_cart(lines, rules, coupon=None, shipping=None):
+    """
+    lines: [(سعر الوحدة، الكمية)]. coupon: CouponRule صالح (rules.get_coupon) أو None.
+    shipping: ShippingRule المدينة (rules.shipping_for)، الافتراضي rules.shipping.
+    """
+    subtotal = money(sum((Decimal(price) * quantity for price, quantity in lines), ZERO))
+
+    discount = ZERO
+    if subtotal and rules.discount is not None:
+        if rules.discount.percent:
+            discount = money(subtotal * rules.discount.percent / HUNDRED)
+        elif rules.discount.amount:
+            discount = money(rules.discount.amount)
+        discount = min(discount, subtotal)
+
+    coupon_discount = money((subtotal - discount) * coupon.percent / HUNDRED) if coupon is not None else ZERO
+    taxable = subtotal - discount - coupon_discount
+
+    tax_rate = rules.tax.rate if rules.tax is not None else ZERO
+    tax = money(taxable * tax_rate / HUNDRED)
+    shipping_rule = shipping or rules.shipping
+    shipping = money(shipping_rule.cost) if shipping_rule is not None and lines else ZERO
+    service_fee = money(rules.service_fee.cost) if rules.service_fee is not None and lines else ZERO
+
+    return Quote(
+        subtotal=subtotal, discount=discount, coupon_discount=coupon_discount,
+        tax_rate=tax_rate, tax=tax, shipping=shipping, service_fee=service_fee,
+        total=taxable + tax + shipping + service_fee, coupon=coupon, shipping_rule=shipping_rule,
+    )
+
+
+def quote_data(quote):
+    """
+    المجاميع للـ API (float مثل باقي الـ responses). tax = المبلغ (الواجهة تعرضه كمبلغ)، tax_rate = النسبة
+    """
+    return {
+        'subtotal': float(quote.subtotal),
+        'discount': float(quote.discount + quote.coupon_discount),
+        'coupon_discount': float(quote.coupon_discount),
+        'tax': float(quote.tax),
+        'tax_rate': float(quote.tax_rate),
+        'shipping': float(quote.shipping),
+        'service_fee': float(quote.service_fee),
+        'total': float(quote.total),
+        'shipping_region': quote.shipping_rule.region if quote.shipping_rule else None,
+        'estimated_days': quote.shipping_rule.estimated_days if quote.shipping_rule else None,
+    }
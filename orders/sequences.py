@@ -0,0 +1,89 @@
+"""
+أرقام متسلسلة بدون تعارض (hi/lo) لرقم الطلب.
+
+كل process يحجز دفعة (block) من الأرقام بـ UPDATE واحد على NumberSequence، ثم يوزعها من الذاكرة
+بدون أي query. UPDATE ... SET value = value + n يأخذ قفل الصف (أو قفل الكتابة في SQLite)، فلا يمكن
+لـ processين حجز نفس الدفعة، ولا يتكرر أي رقم مهما كان عدد الطلبات في نفس الوقت.
+الثمن: فجوات في الترقيم (process أُعيد تشغيله يترك باقي دفعته)، والأرقام بين workers ليست بترتيب الوقت.
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Max
+
+from .models import NumberSequence, Order
+
+
+BLOCK_SIZE = 20
+
+
+class HiLoSequence:
+    def __init__(self, name, initial=lambda: 0, block_size=None):
+        self.name = name
+        self.initial = initial  # أول قيمة إذا الصف غير موجود (آخر رقم مستعمل)
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._blocks = []  # [(التالي، الأخير)] دفعات محجوزة ومؤكدة (بعد commit)
+        self._pid = os.getpid()
+
+    def get_block_size(self):
+        return self.block_size or getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', BLOCK_SIZE)
+
+    def reserve(self, size):
+        """
+        حجز size رقم في قاعدة البيانات، يرجع (الأول، الأخير)
+        """
+        rows = NumberSequence.objects.filter(name=self.name)
+        with transaction.atomic():
+            if not rows.update(value=F('value') + size):
+                try:
+                    with transaction.atomic():
+                        NumberSequence.objects.create(name=self.name, value=self.initial() + size)
+                except IntegrityError:
+                    # process آخر أنشأ الصف في نفس اللحظة
+                    rows.update(value=F('value') + size)
+            last = rows.values_list('value', flat=True).get()
+        return last - size + 1, last
+
+    def _keep(self, first, last):
+        if first <= last:
+            with self._lock:
+                self._blocks.append((first, last))
+
+    def next_value(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self.reset()  # بعد fork لا يرث الـ worker دفعة الـ process الأب
+            if self._blocks:
+                value, last = self._blocks[0]
+                if value == last:
+                    self._blocks.pop(0)
+                else:
+                    self._blocks[0] = (value + 1, last)
+                return value
+
+        in_transaction = connection.in_atomic_block
+        first, last = self.reserve(self.get_block_size())
+        if in_transaction:
+            # الحجز جزء من transaction المتصل: إذا تراجع (rollback) يرجع العداد، فالباقي
+            # لا يُستعمل إلا بعد commit (وإلا قد يحجز process آخر نفس الأرقام)
+            transaction.on_commit(lambda: self._keep(first + 1, last))
+        else:
+            self._keep(first + 1, last)
+        return first
+
+
+def _last_order_number():
+    return Order.objects.aggregate(last=Max('order_number'))['last'] or 0
+
+
+order_numbers = HiLoSequence('order_number', initial=_last_order_number)
+
+
+def next_order_number():
+    return order_numbers.next_value()
@@ -0,0 +1,102 @@
+"""
+تحديد رسوم ومدة الشحن من مدينة/منطقة الزبون.
+
+كل مناطق ShippingFee المفعلة (الاسم + aliases) في فهرس داخل الذاكرة، جزء من snapshot التسعير
+(orders/pricing.py)، فيُبنى من جديد عند أي حفظ لـ ShippingFee. الأسماء تُطبّع (بدون حركات ولا
+accents، بدون فرق بين الحروف الكبيرة والصغيرة: "Fès" = "FES" = "fes") ثم البحث بالترتيب:
+1. exact: الاسم نفسه
+2. alias: أحد الأسماء الأخرى
+3. prefix: الزبون ما زال يكتب ("casab" → Casablanca)، أول اسم أبجديًا بنفس البداية (bisect)
+4. partial: الاسم متبوع بتفاصيل ("Casablanca Maarif 20000" → Casablanca)
+
+prefix للاقتراحات فقط: "Ca" تطابق Casablanca و Cairo معًا، فالتسعير (الطلب والكوبون) لا يستعمله.
+"""
+import re
+import unicodedata
+from bisect import bisect_left
+
+EXACT, ALIAS, PREFIX, PARTIAL = 'exact', 'alias', 'prefix', 'partial'
+
+# حروف عربية تُكتب بأكثر من شكل
+_LETTERS = str.maketrans({'ة': 'ه', 'ى': 'ي', 'ـ': None})
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def normalize_region(text):
+    """
+    " Tanger-Tétouan " → "tanger tetouan"، "الدّار البيضاء" → "الدار البيضاء"
+    """
+    text = str(text or '')
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _SEPARATORS.sub(' ', text.translate(_LETTERS).casefold()).strip()
+
+
+def split_aliases(aliases):
+    return [alias.strip() for alias in re.split(r'[,\n|]', aliases or '') if alias.strip()]
+
+
+class ShippingIndex:
+    """
+    rules: عناصر فيها region و aliases (ShippingRule). عند تكرار نفس الاسم الأخير يربح
+    (نفس قاعدة .last() القديمة)، والاسم الأصلي لمنطقة يربح دائمًا على alias لمنطقة أخرى.
+    """
+
+    def __init__(self, rules=()):
+        self.names = {}
+        self.aliases = {}
+        for rule in rules:
+            self.names[normalize_region(rule.region)] = rule
+            for alias in rule.aliases:
+                self.aliases[normalize_region(alias)] = rule
+        self.names.pop('', None)
+        self.aliases.pop('', None)
+        self.keys = sorted(self.names.keys() | self.aliases.keys())
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _get(self, key):
+        return self.names.get(key) or self.aliases.get(key)
+
+    def lookup(self, text, prefix=True):
+        """
+        (القاعدة، نوع التطابق) أو (None، None). prefix=False: exact أو alias أو partial فقط.
+        """
+        key = normalize_region(text)
+        if not key:
+            return None, None
+        if key in self.names:
+            return self.names[key], EXACT
+        if key in self.aliases:
+            return self.aliases[key], ALIAS
+
+        if prefix:
+            position = bisect_left(self.keys, key)
+            if position < len(self.keys) and self.keys[position].startswith(key):
+                return self._get(self.keys[position]), PREFIX
+
+        # نحذف الكلمات من الآخر حتى نجد اسمًا معروفًا
+        while ' ' in key:
+            key = key.rsplit(' ', 1)[0]
+            rule = self._get(key)
+            if rule is not None:
+                return rule, PARTIAL
+        return None, None
+
+    def suggest(self, text, limit=5):
+        """
+        مناطق تبدأ بما كتبه الزبون (بدون تكرار)، للاقتراحات أثناء الكتابة
+        """
+        key = normalize_region(text)
+        results = []
+        if not key:
+            return results
+        for position in range(bisect_left(self.keys, key), len(self.keys)):
+            if not self.keys[position].startswith(key) or len(results) >= limit:
+                break
+            rule = self._get(self.keys[position])
+            if rule not in results:
+                results.append(rule)
+        return results
@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from products.catalog import catalog_changed
+from .cart_summary import forget_carts_with_products, schedule_cart_refresh
+from .models import CartItem, Coupon, Discount, ServiceFee, ShippingFee, Tax
+from .pricing import bump_pricing_version
+
+
+@receiver(post_save, sender=Tax)
+@receiver(post_save, sender=Discount)
+@receiver(post_save, sender=ShippingFee)
+@receiver(post_save, sender=ServiceFee)
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Tax)
+@receiver(post_delete, sender=Discount)
+@receiver(post_delete, sender=ShippingFee)
+@receiver(post_delete, sender=ServiceFee)
+@receiver(post_delete, sender=Coupon)
+def pricing_rules_changed(sender, **kwargs):
+    # كل process يعيد قراءة قواعد التسعير (orders/pricing.py) بعد الـ commit
+    if kwargs.get('raw'):
+        return
+    transaction.on_commit(bump_pricing_version)
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def cart_item_changed(sender, instance, **kwargs):
+    # ملخص السلة في الـ cache (orders/cart_summary.py) يُكتب من جديد بعد الـ commit
+    if kwargs.get('raw') or instance.cart_id is None:
+        return
+    schedule_cart_refresh(instance.cart.user_id)
+
+
+catalog_changed.connect(forget_carts_with_products, dispatch_uid='orders_cart_summaries')
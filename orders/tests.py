@@ -1,3 +1,712 @@
-from django.test import TestCase
+import threading
+import unittest
+import secrets
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from contextlib import suppress
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from django.core.cache import cache
+from products.cards import refresh_product_cards
+from products.catalog import catalog_changed
+from products.models import Product, ProductCard
+from .coupons import CouponUnavailable, redeem_coupon
+from .cart_summary import build_cart_summary, cart_summary_key, refresh_cart_summaries
+from .guest_cart import (
+    GUEST_CART_COOKIE, GUEST_CART_MAX_COOKIE_BYTES, GUEST_CART_MAX_LINES, GUEST_CART_MAX_QUANTITY, GuestLine,
+    encode_guest_cart,
+)
+from . import copurchase
+from .copurchase import companions_for, get_companions, record_order, top_companions
+from .models import Cart, CartItem, Coupon, CouponUsage, Order, OrderItem, ProductCoPurchase, ServiceFee, ShippingFee, Tax, wishlistItem
+from .shipping import ShippingIndex
+from .pricing import CouponRule, DiscountRule, PricingRules, ServiceFeeRule, ShippingRule, TaxRule, get_pricing_rules, price_cart
+from .sequences import HiLoSequence, order_numbers
+
+
+@override_settings(THROTTLE_RATES={}, ORDER_NUMBER_BLOCK_SIZE=20)
+class OrderNumberTests(TransactionTestCase):
+    THREADS = 8
+    ORDERS = 240
+
+    def setUp(self):
+        order_numbers.reset()
+        Tax.objects.create(name='VAT', rate=0)
+        self.product = Product.objects.create(name='Lamp', price=50, description_1='Desk lamp', image_1='')
+
+    def run_parallel(self, requests, threads=THREADS):
+        """
+        requests: [(client، url، data)] مقسمة على threads thread. ترجع status codes.
+        (السرعة مقارنة بـ thread واحد: python manage.py benchmark_checkout)
+        """
+        statuses = []
+
+        def worker(batch):
+            try:
+                for client, url, data in batch:
+                    statuses.append(client.post(url, data, content_type='application/json').status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(requests[i::threads],)) for i in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return statuses
+
+    def test_parallel_checkouts_get_unique_numbers(self):
+        requests = []
+        User = get_user_model()
+        for i in range(self.ORDERS // 2):
+            user = User.objects.create_user(email=f'buyer{i}@example.com', username=f'buyer{i}')
+            CartItem.objects.create(cart=Cart.objects.create(user=user), product=self.product, quantity=1)
+            client = Client()
+            client.cookies['access_token'] = str(AccessToken.for_user(user))
+            customer = {'customer_name': 'Buyer', 'customer_phone': '0600', 'customer_address': 'Street 1'}
+            requests.append((client, '/orders/user/orders/create/', {**customer, 'city': 'Rabat', 'total': '50', 'is_use_coupon': False}))
+            requests.append((Client(), f'/orders/api/orders/create/{self.product.pk}/', customer))
+
+        with mock.patch.object(order_numbers, 'reserve', wraps=order_numbers.reserve) as reserve:
+            statuses = self.run_parallel(requests)
+
+        self.assertEqual(statuses, [201] * self.ORDERS)
+        numbers = list(Order.objects.values_list('order_number', flat=True))
+        self.assertEqual(len(numbers), self.ORDERS)
+        self.assertEqual(len(set(numbers)), self.ORDERS)
+        # query حجز واحد لكل 20 طلب (+ دفعة ناقصة على الأكثر لكل thread)، وليس query لكل طلب
+        self.assertLessEqual(reserve.call_count, len(requests) // 20 + self.THREADS)
+
+    def test_rolled_back_reservation_is_not_kept(self):
+        sequence = HiLoSequence('test', block_size=5)
+        with suppress(RuntimeError), transaction.atomic():
+            first = sequence.next_value()
+            raise RuntimeError
+        # العداد رجع مع الـ rollback، والباقي لم يُحفظ في الذاكرة: نفس الدفعة تُحجز من جديد مرة واحدة
+        self.assertEqual([sequence.next_value() for _ in range(6)], [first, first + 1, first + 2, first + 3, first + 4, first + 5])
+        self.assertEqual(HiLoSequence('test', block_size=5).next_value(), first + 10)
+
+
+@override_settings(THROTTLE_RATES={})
+class CheckoutTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Tax.objects.create(name='VAT', rate=0)
+        get_pricing_rules()  # snapshot التسعير جاهز قبل عد الـ queries
+        self.user = get_user_model().objects.create_user(email='buyer@example.com', username='buyer')
+        self.cart = Cart.objects.create(user=self.user)
+        self.client.cookies['access_token'] = str(AccessToken.for_user(self.user))
+        self.products = [
+            Product.objects.create(name=f'Cup {i}', price=10 + i, description_1='Cup', image_1='', sales_count=3)
+            for i in range(5)
+        ]
+
+    def fill_cart(self, count):
+        for i, product in enumerate(self.products[:count]):
+            CartItem.objects.create(cart=self.cart, product=product, quantity=i + 1, color='Red', size='M')
+
+    def checkout(self):
+        data = {
+            'customer_name': 'Buyer', 'customer_phone': '0600', 'customer_address': 'Street 1',
+            'city': 'Rabat', 'total': '100', 'is_use_coupon': False,
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/orders/user/orders/create/', data, content_type='application/json')
+        return response, len(queries)
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        self.fill_cart(1)
+        response, one_item_queries = self.checkout()
+        self.assertEqual(response.status_code, 201)
+
+        self.fill_cart(5)
+        response, five_item_queries = self.checkout()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(five_item_queries, one_item_queries)
+
+        order = Order.objects.get(pk=response.json()['order']['id'])
+        lines = list(order.items.order_by('unit_price'))
+        self.assertEqual([(line.product_name, line.quantity, line.unit_price) for line in lines],
+                         [(f'Cup {i}', i + 1, 10 + i) for i in range(5)])
+        self.assertEqual((lines[0].color, lines[0].size), ('Red', 'M'))
+        self.assertEqual(order.products.count(), 5)
+        self.assertFalse(CartItem.objects.filter(is_ordered=False).exists())
+        self.assertEqual(
+            list(Product.objects.order_by('price').values_list('sales_count', flat=True)), [3 + 1 + 1, 5, 6, 7, 8],
+        )
+
+    def test_order_refreshes_sales_without_catalog_change(self):
+        refresh_product_cards([product.pk for product in self.products])
+        self.fill_cart(2)
+        with mock.patch.object(catalog_changed, 'send') as changed, self.captureOnCommitCallbacks(execute=True):
+            response, _ = self.checkout()
+        self.assertEqual(response.status_code, 201)
+        # لا إعادة فهرسة ولا نسخة كاش جديدة ولا نسيان السلات مع كل طلب
+        changed.assert_not_called()
+        self.assertEqual(
+            list(ProductCard.objects.order_by('price').values_list('sales_count', flat=True)), [4, 5, 3, 3, 3],
+        )
+
+    def test_failed_checkout_changes_nothing(self):
+        self.fill_cart(3)
+        with mock.patch('orders.checkout.record_order', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.checkout()
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertEqual(CartItem.objects.filter(is_ordered=False).count(), 3)
+        self.assertEqual(set(Product.objects.values_list('sales_count', flat=True)), {3})
+
+    def test_guest_order_keeps_line_and_choices(self):
+        product = self.products[0]
+        response = self.client.post(f'/orders/api/orders/create/{product.pk}/', {
+            'customer_name': 'Guest', 'customer_phone': '0600', 'customer_address': 'Street 2',
+            'quantity': 2, 'color': 'Blue',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        line = OrderItem.objects.get(order_id=response.json()['order_id'])
+        self.assertEqual((line.quantity, line.unit_price, line.color), (2, 10, 'Blue'))
+        self.assertEqual(line.order.total, 20)
+        product.refresh_from_db()
+        self.assertEqual(product.sales_count, 5)
+
+
+class PricingTests(TestCase):
+    def test_price_cart(self):
+        rules = PricingRules(
+            version=1,
+            tax=TaxRule('VAT', Decimal('20')),
+            discount=DiscountRule('Season', Decimal('0'), Decimal('10')),
+            shipping=ShippingRule('Rabat', Decimal('30'), 2),
+            service_fee=ServiceFeeRule('Packing', Decimal('5')),
+        )
+        coupon = CouponRule(id='c', code='SAVE', percent=Decimal('50'))
+        quote = price_cart([(Decimal('19.99'), 3), (Decimal('40'), 1)], rules, coupon)
+        # 99.97 - 10% (10.00) = 89.97؛ الكوبون 50% = 44.99 (تقريب لأقرب سنتيم)؛ الضريبة 20% من 44.98
+        self.assertEqual(
+            (quote.subtotal, quote.discount, quote.coupon_discount, quote.tax, quote.total),
+            (Decimal('99.97'), Decimal('10.00'), Decimal('44.99'), Decimal('9.00'), Decimal('88.98')),
+        )
+        self.assertEqual(price_cart([], rules).total, 0)
+
+    def test_snapshot_is_cached_and_invalidated_on_save(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tax = Tax.objects.create(name='VAT', rate=10)
+            ShippingFee.objects.create(region='Rabat', cost=20)
+        rules = get_pricing_rules()
+        with self.assertNumQueries(0):
+            for _ in range(100):
+                total = price_cart([(Decimal('100'), 1)], get_pricing_rules()).total
+        self.assertEqual(total, Decimal('130.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tax.rate = 20
+            tax.save()
+            ServiceFee.objects.create(name='Packing', cost=5)
+        self.assertGreater(get_pricing_rules().version, rules.version)
+        self.assertEqual(price_cart([(Decimal('100'), 1)], get_pricing_rules()).total, Decimal('145.00'))
+
+    def test_coupon_window(self):
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            Coupon.objects.create(code='NOW', discount_percent=10)
+            Coupon.objects.create(code='LATER', discount_percent=10, start_date=now + timedelta(days=1))
+            Coupon.objects.create(code='OVER', discount_percent=10, end_date=now - timedelta(days=1))
+            Coupon.objects.create(code='OFF', discount_percent=10, active=False)
+        rules = get_pricing_rules()
+        self.assertEqual([code for code in ['NOW', 'LATER', 'OVER', 'OFF'] if rules.get_coupon(code=code)], ['NOW'])
+        self.assertIsNotNone(rules.get_coupon(code='LATER', now=now + timedelta(days=2)))
+
+
+class ShippingTests(TestCase):
+    def test_index_matching(self):
+        casablanca = ShippingRule('Casablanca', Decimal('20'), 1, ('Casa', 'الدار البيضاء'))
+        fes = ShippingRule('Fès', Decimal('35'), 3)
+        index = ShippingIndex([casablanca, fes, ShippingRule('Tanger-Tétouan', Decimal('40'), 4)])
+        self.assertEqual(index.lookup('  FES '), (fes, 'exact'))
+        self.assertEqual(index.lookup('casa'), (casablanca, 'alias'))
+        self.assertEqual(index.lookup('الدّار البيضاء'), (casablanca, 'alias'))
+        self.assertEqual(index.lookup('Casab'), (casablanca, 'prefix'))
+        self.assertEqual(index.lookup('Casab', prefix=False), (None, None))
+        self.assertEqual(index.lookup('Casablanca, Maarif 20000'), (casablanca, 'partial'))
+        self.assertEqual(index.lookup('tanger tetouan')[0].region, 'Tanger-Tétouan')
+        self.assertEqual(index.lookup('Agadir'), (None, None))
+        self.assertEqual([rule.region for rule in index.suggest('ca')], ['Casablanca'])
+
+    @override_settings(THROTTLE_RATES={})
+    def test_checkout_uses_city_shipping(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ShippingFee.objects.create(region='Casablanca', aliases='Casa, الدار البيضاء', cost=20, estimated_days=1)
+            ShippingFee.objects.create(region='Default', cost=50, estimated_days=5)
+
+        response = self.client.get('/orders/shipping-quote/', {'city': 'casa'})
+        self.assertEqual(response.json()['region'], 'Casablanca')
+        self.assertEqual((response.json()['match'], response.json()['cost']), ('alias', 20.0))
+        # بدون تطابق: نفس القاعدة القديمة (آخر ShippingFee مفعل حسب pk)
+        response = self.client.get('/orders/shipping-quote/', {'city': 'Agadir'})
+        self.assertEqual(response.json()['match'], 'default')
+        self.assertEqual(response.json()['cost'], float(get_pricing_rules().shipping.cost))
+
+        user = get_user_model().objects.create_user(email='shipper@example.com', username='shipper')
+        CartItem.objects.create(
+            cart=Cart.objects.create(user=user), quantity=1,
+            product=Product.objects.create(name='Lamp', price=100, description_1='Lamp', image_1=''),
+        )
+        self.client.cookies['access_token'] = str(AccessToken.for_user(user))
+        self.assertEqual(self.client.get('/orders/user/orders/create/', {'city': 'Casablanca'}).json()['total'], 120.0)
+        # مدينة لم تكتمل: اقتراح في صفحة الشحن، لكن السعر الافتراضي في الطلب
+        self.assertEqual(self.client.get('/orders/shipping-quote/', {'city': 'Casab'}).json()['match'], 'prefix')
+        default_total = 100 + float(get_pricing_rules().shipping.cost)
+        self.assertEqual(self.client.get('/orders/user/orders/create/', {'city': 'Casab'}).json()['total'], default_total)
+        response = self.client.post('/orders/user/orders/create/', {
+            'customer_name': 'Buyer', 'customer_phone': '0600', 'customer_address': 'Street 1', 'city': 'الدار البيضاء',
+        }, content_type='application/json')
+        self.assertEqual(response.json()['order']['estimated_days'], 1)
+        self.assertEqual(Order.objects.get().total, Decimal('120.00'))
+
+        # تعديل المنطقة في الأدمن يعيد بناء الفهرس
+        with self.captureOnCommitCallbacks(execute=True):
+            ShippingFee.objects.filter(region='Casablanca').get().delete()
+        self.assertEqual(self.client.get('/orders/shipping-quote/', {'city': 'casa'}).json()['match'], 'default')
+
+
+@override_settings(THROTTLE_RATES={})
+class CouponRedemptionTests(TransactionTestCase):
+    THREADS = 16
+    CHECKOUTS = 1000
+
+    def setUp(self):
+        order_numbers.reset()
+        self.product = Product.objects.create(name='Lamp', price=50, description_1='Desk lamp', image_1='')
+        self.coupon = Coupon.objects.create(code='HUNDRED', discount_percent=10, usage_limit=100)
+
+    def test_parallel_checkouts_respect_usage_limit(self):
+        User = get_user_model()
+        users = User.objects.bulk_create([
+            User(email=f'coupon{i}@example.com', username=f'coupon{i}') for i in range(self.CHECKOUTS)
+        ])
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=self.product, quantity=1) for cart in carts])
+        customer = {
+            'customer_name': 'Buyer', 'customer_phone': '0600', 'customer_address': 'Street 1',
+            'city': 'Rabat', 'code_id': str(self.coupon.pk),
+        }
+        statuses = []
+
+        def worker(batch):
+            try:
+                for user in batch:
+                    client = Client()
+                    client.cookies['access_token'] = str(AccessToken.for_user(user))
+                    statuses.append(client.post('/orders/user/orders/create/', customer, content_type='application/json').status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(users[i::self.THREADS],)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.coupon.refresh_from_db()
+        self.assertEqual((statuses.count(201), statuses.count(400)), (100, self.CHECKOUTS - 100))
+        self.assertEqual(self.coupon.used_count, 100)
+        self.assertEqual(CouponUsage.objects.count(), 100)
+        self.assertEqual(Order.objects.filter(coupon=self.coupon).count(), 100)
+        # الطلبات المرفوضة لم تترك أي أثر: السلة ما زالت كما هي
+        self.assertEqual(CartItem.objects.filter(is_ordered=False).count(), self.CHECKOUTS - 100)
+
+    def test_redeem_rules(self):
+        user = get_user_model().objects.create_user(email='once@example.com', username='once')
+        with transaction.atomic():
+            redeem_coupon(self.coupon.pk, user)
+        with self.assertRaisesMessage(CouponUnavailable, 'already used'), transaction.atomic():
+            redeem_coupon(self.coupon.pk, user)
+
+        # rollback يرجع العداد
+        other = get_user_model().objects.create_user(email='other@example.com', username='other')
+        with suppress(RuntimeError), transaction.atomic():
+            redeem_coupon(self.coupon.pk, other)
+            raise RuntimeError
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.used_count, 1)
+
+        Coupon.objects.filter(pk=self.coupon.pk).update(end_date=timezone.now() - timedelta(minutes=1))
+        with self.assertRaises(CouponUnavailable), transaction.atomic():
+            redeem_coupon(self.coupon.pk, other)
+        self.assertEqual(CouponUsage.objects.count(), 1)
+
+
+@unittest.skipIf(copurchase.np is None, "numpy is not installed")
+class CoPurchaseTests(TestCase):
+    # p1 شائع (مع الكل)، p6 يُشترى فقط مع p0: lift أعلى رغم confidence أقل
+    BASKETS = [{0, 1}, {0, 1}, {0, 1}, {1, 2}, {1, 3}, {1, 4}, {1, 5}, {0, 6}, {0, 6}, {2, 3, 4}]
+
+    def setUp(self):
+        cache.clear()
+        self.products = [
+            Product.objects.create(name=f'Pan {i}', price=10, description_1='Pan', image_1='') for i in range(7)
+        ]
+        for basket in self.BASKETS:
+            self.order([self.products[i].pk for i in basket])
+
+    def order(self, product_ids):
+        order = Order.objects.create(customer_name='Buyer', customer_phone='0600', customer_address='Street 1')
+        order.products.add(*product_ids)
+        record_order(product_ids)
+
+    def stored_counts(self):
+        return {(row.product_id, row.companion_id): row.count for row in ProductCoPurchase.objects.all()}
+
+    def test_incremental_counts_match_rebuild(self):
+        expected = {}
+        for basket in self.BASKETS:
+            for a in basket:
+                for b in basket:
+                    key = (self.products[a].pk, self.products[b].pk)
+                    expected[key] = expected.get(key, 0) + 1
+        self.assertEqual(self.stored_counts(), expected)
+
+        out = StringIO()
+        call_command('rebuild_copurchases', stdout=out)
+        self.assertIn(f'from {len(self.BASKETS)} order(s)', out.getvalue())
+        self.assertEqual(self.stored_counts(), expected)
+
+    def test_ranking_by_lift_then_confidence(self):
+        p = self.products
+        total = len(self.BASKETS)
+        # p0: مع p1 3 مرات من 5 (confidence 0.6)، مع p6 مرتين (0.4)؛ p1 في 7 طلبات و p6 في 2
+        self.assertEqual(get_companions(p[0].pk), [
+            (p[6].pk, round(0.4 * total / 2, 3), 0.4),
+            (p[1].pk, round(0.6 * total / 7, 3), 0.6),
+        ])
+        # الأزواج التي ظهرت مرة واحدة لا تُحسب، ومنتجات السلة نفسها لا تُقترح
+        self.assertEqual([pk for pk, _, _ in get_companions(p[1].pk)], [p[0].pk])
+        self.assertEqual([pk for pk, _, _ in companions_for([p[0].pk, p[6].pk])], [p[1].pk])
+        # بدون numpy: نفس الأرقام ونفس الترتيب
+        expected = companions_for([p[0].pk, p[2].pk])
+        with mock.patch.object(copurchase, 'np', None):
+            self.assertEqual(companions_for([p[0].pk, p[2].pk]), expected)
+
+        # نفس الترتيب من البناء الكامل (numpy)
+        np = copurchase.np
+        ids = [product.pk for product in p]
+        rows, cols, counts = np.array([
+            (ids.index(a), ids.index(b), n) for (a, b), n in self.stored_counts().items()
+        ]).T
+        support = np.zeros(len(ids), dtype=np.int64)
+        support[rows[rows == cols]] = counts[rows == cols]
+        best_rows, best_cols, _, _ = top_companions(rows, cols, counts, support, total)
+        self.assertEqual([ids[c] for c in best_cols[best_rows == 0]], [p[6].pk, p[1].pk])
+
+    def test_new_order_invalidates_cached_companions(self):
+        p = self.products
+        self.assertEqual([pk for pk, _, _ in get_companions(p[6].pk)], [p[0].pk])
+        with self.assertNumQueries(0):
+            get_companions(p[6].pk)
+        for _ in range(2):
+            self.order([p[6].pk, p[5].pk])
+        self.assertEqual({pk for pk, _, _ in get_companions(p[6].pk)}, {p[0].pk, p[5].pk})
+
+
+@override_settings(THROTTLE_RATES={})
+class GuestCartTests(TestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f'Vase {i}', price=20 + i, description_1='Vase', image_1='')
+            for i in range(5)
+        ]
+        refresh_product_cards([product.pk for product in self.products])
+        get_pricing_rules()
+
+    def add(self, product, **data):
+        return self.client.post('/orders/add-to-cart/', {'product_id': str(product.pk), **data}, content_type='application/json')
+
+    def cart(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/orders/items-list/cart/')
+        return response.json(), len(queries)
+
+    def test_guest_cart_lives_in_signed_cookie(self):
+        self.assertEqual(self.add(self.products[0], quantity=2, color='Blue').status_code, 201)
+        self.assertEqual(self.add(self.products[0], quantity=2, color='Blue').json()['message'], 'Product already in cart')
+        self.add(self.products[1])
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(CartItem.objects.exists())
+
+        two_items, two_item_queries = self.cart()
+        self.assertEqual([(item['product']['name'], item['quantity'], item['color']) for item in two_items['items']],
+                         [('Vase 0', 2, 'Blue'), ('Vase 1', 1, None)])
+        self.assertEqual(two_items['subtotal'], 61.0)
+
+        for product in self.products[2:]:
+            self.add(product)
+        five_items, five_item_queries = self.cart()
+        self.assertEqual(len(five_items['items']), 5)
+        # الأسعار من ProductCard: query واحد مهما كان عدد العناصر
+        self.assertEqual((five_item_queries, two_item_queries), (1, 1))
+
+        line_id = two_items['items'][1]['id']
+        self.assertEqual(self.client.put(f'/orders/items-list/cart/{line_id}/', {'quantity_change': 2}, content_type='application/json').json()['quantity'], 3)
+        self.client.delete(f'/orders/items-list/cart/{two_items["items"][0]["id"]}/')
+        self.assertEqual([item['quantity'] for item in self.cart()[0]['items']], [3, 1, 1, 1])
+
+        # cookie معدّل = سلة فارغة
+        self.client.cookies[GUEST_CART_COOKIE] = self.client.cookies[GUEST_CART_COOKIE].value[:-2] + 'xx'
+        self.assertEqual(self.cart()[0]['items'], [])
+
+    def test_guest_choices_capped_and_cookie_size_limited(self):
+        self.assertEqual(self.add(self.products[0], color='B' * 500).status_code, 201)
+        self.assertEqual(self.cart()[0]['items'][0]['color'], 'B' * 100)
+
+        # قيم عشوائية لا تنضغط: تُرفض الإضافة قبل أن يتجاوز الـ cookie حد المتصفح
+        for attempt in range(GUEST_CART_MAX_LINES):
+            cookie = self.client.cookies[GUEST_CART_COOKIE].value
+            response = self.add(self.products[1], **{key: secrets.token_hex(50) for key in ('color', 'size', 'options')})
+            if response.status_code != 201:
+                break
+        self.assertEqual((response.status_code, response.json()['message']), (400, 'Cart is full'))
+        self.assertLess(attempt, GUEST_CART_MAX_LINES - 1)
+        self.assertLessEqual(len(cookie), GUEST_CART_MAX_COOKIE_BYTES)
+        self.assertEqual(self.client.cookies[GUEST_CART_COOKIE].value, cookie)
+        self.assertEqual(len(self.cart()[0]['items']), attempt + 1)
+
+    def test_merge_on_login(self):
+        user = get_user_model().objects.create_user(email='guest@example.com', username='guest', password='secret-pass-1')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=1)
+        CartItem.objects.create(cart=cart, product=self.products[1], quantity=5, is_ordered=True)
+
+        self.add(self.products[0], quantity=3)
+        self.add(self.products[1], quantity=2)
+        self.add(self.products[2], size='L')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/users/auth/jwt/create/', {'email': 'guest@example.com', 'password': 'secret-pass-1'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies[GUEST_CART_COOKIE].value, '')
+        self.assertEqual(len([query for query in queries if 'orders_cartitem' in query['sql']]), 3)
+
+        items = CartItem.objects.filter(cart__user=user, is_ordered=False).order_by('product__price')
+        self.assertEqual([(item.product_id, item.quantity, item.size) for item in items], [
+            (self.products[0].pk, 3, None), (self.products[1].pk, 2, None), (self.products[2].pk, 1, 'L'),
+        ])
+
+    def test_guest_quantity_is_clamped(self):
+        self.add(self.products[0], quantity=10 ** 30)
+        line_id = self.cart()[0]['items'][0]['id']
+        self.assertEqual(self.cart()[0]['items'][0]['quantity'], GUEST_CART_MAX_QUANTITY)
+        response = self.client.put(f'/orders/items-list/cart/{line_id}/', {'quantity_change': 10 ** 30}, content_type='application/json')
+        self.assertEqual(response.json()['quantity'], GUEST_CART_MAX_QUANTITY)
+
+        # cookie قديم (قبل الحد) بكمية ضخمة: يُقص عند القراءة
+        line = GuestLine(1, self.products[1].pk, 10 ** 30)
+        self.client.cookies[GUEST_CART_COOKIE] = encode_guest_cart([line])
+        self.assertEqual(self.cart()[0]['items'][0]['quantity'], GUEST_CART_MAX_QUANTITY)
+
+        get_user_model().objects.create_user(email='big@example.com', username='big', password='secret-pass-1')
+        response = self.client.post('/users/auth/jwt/create/', {'email': 'big@example.com', 'password': 'secret-pass-1'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(CartItem.objects.get(cart__user__email='big@example.com').quantity, GUEST_CART_MAX_QUANTITY)
+
+    def test_failed_merge_does_not_block_login(self):
+        get_user_model().objects.create_user(email='guest@example.com', username='guest', password='secret-pass-1')
+        self.add(self.products[0])
+        with mock.patch('users.views.merge_guest_cart', side_effect=OverflowError), \
+                self.assertLogs('users.views', 'ERROR'):
+            response = self.client.post('/users/auth/jwt/create/', {'email': 'guest@example.com', 'password': 'secret-pass-1'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.json())
+        self.assertEqual(response.cookies[GUEST_CART_COOKIE].value, '')
+        self.assertFalse(CartItem.objects.exists())
+
+
+@override_settings(THROTTLE_RATES={})
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(email='summary@example.com', username='summary')
+        self.client.cookies['access_token'] = str(AccessToken.for_user(self.user))
+        self.products = [
+            Product.objects.create(name=f'Bowl {i}', price=10 + i, description_1='Bowl', image_1='')
+            for i in range(3)
+        ]
+        refresh_product_cards([product.pk for product in self.products])
+        get_pricing_rules()
+
+    def cart(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/orders/items-list/cart/').json()
+        # الاستعلام الوحيد المسموح: المستخدم من الـ JWT (CookieJWTAuthentication)
+        self.assertEqual([query['sql'] for query in queries if 'users_customuser' not in query['sql']], [])
+        return data
+
+    def test_mutations_write_through(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for product in self.products[:2]:
+                self.client.post('/orders/add-to-cart/', {'product_id': str(product.pk), 'quantity': 2}, content_type='application/json')
+        data = self.cart()
+        self.assertEqual((data['item_count'], data['subtotal']), (2, 42.0))
+        self.assertEqual(data['items'][0]['product']['name'], 'Bowl 0')
+
+        item_id = data['items'][1]['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(f'/orders/items-list/cart/{item_id}/', {'quantity_change': 1}, content_type='application/json')
+        self.assertEqual(self.cart()['subtotal'], 53.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/orders/items-list/cart/{data["items"][0]["id"]}/')
+        self.assertEqual((self.cart()['item_count'], self.cart()['subtotal']), (1, 33.0))
+
+        # سعر جديد: الملخص القديم يُحذف
+        Product.objects.filter(pk=self.products[1].pk).update(price=20)
+        refresh_product_cards([self.products[1].pk])
+        catalog_changed.send(sender=None, product_ids={self.products[1].pk})
+        self.assertIsNone(cache.get(cart_summary_key(self.user.pk)))
+        self.client.get('/orders/items-list/cart/')
+        self.assertEqual(self.cart()['subtotal'], 60.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/orders/user/orders/create/', {
+                'customer_name': 'Buyer', 'customer_phone': '0600', 'customer_address': 'Street 1', 'city': 'Rabat',
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.cart()['items'], [])
+
+    def test_refresh_once_per_commit_and_not_after_rollback(self):
+        cart = Cart.objects.create(user=self.user)
+        with mock.patch('orders.cart_summary.refresh_cart_summaries', wraps=refresh_cart_summaries) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                with suppress(RuntimeError), transaction.atomic():
+                    CartItem.objects.create(cart=cart, product=self.products[0], quantity=1)
+                    raise RuntimeError
+            refresh.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+                for product in self.products:
+                    CartItem.objects.create(cart=cart, product=product, quantity=1)
+            refresh.assert_called_once_with({self.user.pk})
+        self.assertEqual(self.cart()['item_count'], 3)
+
+    def test_stale_rebuild_does_not_overwrite_newer_summary(self):
+        cart = Cart.objects.create(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            CartItem.objects.create(cart=cart, product=self.products[0], quantity=1)
+        # قراءة (أو commit سابق) بدأت البناء قبل الـ commit التالي وتنتهي بعده
+        stale_key, stale = cart_summary_key(self.user.pk), build_cart_summary(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            CartItem.objects.create(cart=cart, product=self.products[1], quantity=1)
+        cache.set(stale_key, stale)
+        self.assertEqual(self.cart()['item_count'], 2)
+
+    def test_other_users_items_are_not_reachable(self):
+        other = Cart.objects.create(user=get_user_model().objects.create_user(email='other2@example.com', username='other2'))
+        item = CartItem.objects.create(cart=other, product=self.products[0], quantity=1)
+        self.assertEqual(self.client.delete(f'/orders/items-list/cart/{item.pk}/').status_code, 404)
+        self.assertTrue(CartItem.objects.filter(pk=item.pk).exists())
+
+
+@override_settings(THROTTLE_RATES={})
+class BatchMutationTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(email='batch@example.com', username='batch')
+        self.cart = Cart.objects.create(user=self.user)
+        self.client.cookies['access_token'] = str(AccessToken.for_user(self.user))
+        self.products = [
+            Product.objects.create(name=f'Plate {i}', price=10 * (i + 1), description_1='Plate', image_1='')
+            for i in range(6)
+        ]
+        refresh_product_cards([product.pk for product in self.products])
+        get_pricing_rules()
+
+    def post(self, url, operations):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {'operations': operations}, content_type='application/json')
+        return response, len(queries)
+
+    def add_all(self, count):
+        return self.post('/orders/cart/batch/', [
+            {'op': 'add', 'product_id': str(product.pk), 'quantity': 2, 'color': 'White'}
+            for product in self.products[:count]
+        ])
+
+    def test_cart_batch(self):
+        response, two_queries = self.add_all(2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['item_count'], response.json()['subtotal']), (2, 60.0))
+        CartItem.objects.all().delete()
+        response, six_queries = self.add_all(6)
+        self.assertEqual(six_queries, two_queries)
+        self.assertEqual(response.json()['item_count'], 6)
+
+        ids = [item['id'] for item in response.json()['items']]
+        response, _ = self.post('/orders/cart/batch/', [
+            {'op': 'set', 'item_id': ids[0], 'quantity': 5},
+            {'op': 'change', 'item_id': ids[1], 'quantity_change': -1},
+            {'op': 'change', 'item_id': ids[2], 'quantity_change': -9},
+            {'op': 'set', 'item_id': ids[3], 'quantity': 0},
+            {'op': 'remove', 'item_id': ids[4]},
+        ])
+        self.assertEqual([(item['id'], item['quantity']) for item in response.json()['items']],
+                         [(ids[0], 5), (ids[1], 1), (ids[5], 2)])
+        self.assertEqual(response.json()['subtotal'], 50.0 + 20.0 + 120.0)
+
+        # عنصر مستخدم آخر أو منتج غير موجود: لا شيء يتغير
+        other = CartItem.objects.create(
+            cart=Cart.objects.create(user=get_user_model().objects.create_user(email='x@example.com', username='x')),
+            product=self.products[0], quantity=1,
+        )
+        response, _ = self.post('/orders/cart/batch/', [
+            {'op': 'add', 'product_id': str(self.products[1].pk), 'color': 'Black'},
+            {'op': 'remove', 'item_id': other.pk},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(CartItem.objects.filter(pk=other.pk).exists())
+        self.assertFalse(CartItem.objects.filter(color='Black').exists())
+        response, _ = self.post('/orders/cart/batch/', [{'op': 'add', 'product_id': str(uuid.uuid4())}])
+        self.assertEqual(response.json()['index'], 0)
+
+    def test_wishlist_batch(self):
+        response, _ = self.post('/orders/wishlist/batch/', [
+            {'op': 'add', 'product_id': str(product.pk)} for product in self.products[:4]
+        ] + [{'op': 'add', 'product_id': str(self.products[0].pk)}])
+        self.assertEqual(response.json()['count'], 4)
+        response, _ = self.post('/orders/wishlist/batch/', [
+            {'op': 'remove', 'product_id': str(self.products[0].pk)},
+            {'op': 'add', 'product_id': str(self.products[5].pk)},
+        ])
+        self.assertEqual(response.json()['changed'], 2)
+        self.assertEqual(
+            sorted(wishlistItem.objects.filter(wishlist__user=self.user).values_list('product__name', flat=True)),
+            ['Plate 1', 'Plate 2', 'Plate 3', 'Plate 5'],
+        )
+
+    def test_parallel_quantity_changes_are_not_lost(self):
+        item = CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        token = str(AccessToken.for_user(self.user))
+
+        def worker():
+            try:
+                client = Client()
+                client.cookies['access_token'] = token
+                for _ in range(10):
+                    client.put(f'/orders/items-list/cart/{item.pk}/', {'quantity_change': 1}, content_type='application/json')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, 81)
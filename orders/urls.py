@@ -7,10 +7,15 @@ urlpatterns = [
     path('add-to-cart/', Add_To_Cart.as_view(), name='AddToCart'),
     path('add-to-wishlist/', Add_To_Wishlist.as_view(), name='AddToWishlist'),
     path('add-to-wishlist/<uuid:product_id>/', Add_To_Wishlist.as_view(), name='remove_from_wishlist'),
+    path('cart/batch/', CartBatchView.as_view(), name='cart-batch'),
+    path('wishlist/batch/', WishlistBatchView.as_view(), name='wishlist-batch'),
     path('items-list/cart/', CartItemsViewsBuyUser.as_view(), name='cart-items-list'),
     path('items-list/cart/<int:id>/', CartItemsViewsBuyUser.as_view(), name='cart-items-list'),
     path('api/orders/create/<uuid:id>/', CreateOrderNoAuthenticated.as_view(), name='create-order-no-auth'),
     path('user/orders/create/', CreateOrder.as_view(), name='create-order'),
+    path('shipping-quote/', ShippingQuoteView.as_view(), name='shipping-quote'),
     path('apply-promo/', ApplyCouponAPIView.as_view(), name='apply-coupon'),
+    path('bought-together/<uuid:product_id>/', ProductBoughtTogether.as_view(), name='product-bought-together'),
+    path('bought-together/cart/', CartBoughtTogether.as_view(), name='cart-bought-together'),
 ]
 
@@ -9,18 +9,38 @@ from users.serializers import *
 from rest_framework.permissions import AllowAny,IsAdminUser,IsAuthenticated
 from django.shortcuts import get_object_or_404
 from decimal import Decimal
+import uuid
+from products.cards import get_cards
+from products.serializers import ProductCardSerializer
+from .copurchase import companions_for, get_companions
+from .batch import BatchError, apply_cart_operations, apply_wishlist_operations
+from .cart_summary import get_cart_summary, schedule_cart_refresh
+from .checkout import CartChanged, get_checkout_items, place_order
+from .coupons import CouponUnavailable, has_uses_left, redeem_coupon
+from .guest_cart import (
+    GUEST_CART_MAX_LINES, add_guest_line, guest_cart_fits, guest_cart_items, guest_quantity, load_guest_cart,
+    save_guest_cart,
+)
+from .pricing import cart_lines, get_pricing_rules, price_cart, quote_data
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from website.throttling import TokenBucketThrottle
 
 class Add_To_Cart(APIView):
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [AllowAny]
 
     def post(self, request):
         user = request.user
-        cart, created = Cart.objects.get_or_create(user=user)
-
         product_id = request.data.get('product_id')
         if not product_id:
             return Response({"message": "Product ID is required"}, status=status.HTTP_400_BAD_REQUEST)
 
+        if not user.is_authenticated:
+            return self.add_for_guest(request, product_id)
+
+        cart, created = Cart.objects.get_or_create(user=user)
+
         # التحقق من وجود المنتج
         try:
             product = Product.objects.get(id=product_id)
@@ -64,6 +84,38 @@ class Add_To_Cart(APIView):
 
         return Response({"message": "Product added successfully"}, status=201)
 
+    def add_for_guest(self, request, product_id):
+        # الزائر: السلة في cookie (orders/guest_cart.py)، بدون Cart ولا CartItem
+        try:
+            product_id = uuid.UUID(str(product_id))
+        except ValueError:
+            return Response({"message": "Product not found"}, status=404)
+        if not Product.objects.filter(id=product_id).exists():
+            return Response({"message": "Product not found"}, status=404)
+        try:
+            quantity = guest_quantity(request.data.get('quantity') or 1)
+        except (TypeError, ValueError):
+            return Response({"message": "Invalid quantity value"}, status=400)
+
+        lines = load_guest_cart(request)
+        if len(lines) >= GUEST_CART_MAX_LINES:
+            return Response({"message": "Cart is full"}, status=400)
+        line = add_guest_line(
+            lines, product_id, quantity,
+            color=request.data.get('color') or None,
+            size=request.data.get('size') or None,
+            options=request.data.get('options') or None,
+        )
+        if line is None:
+            return Response({"message": "Product already in cart"}, status=200)
+        if not guest_cart_fits(lines):
+            # cookie أكبر من 4KB يرفضه المتصفح بصمت وتضيع السلة كلها
+            return Response({"message": "Cart is full"}, status=400)
+
+        response = Response({"message": "Product added successfully"}, status=201)
+        save_guest_cart(response, lines)
+        return response
+
 
 
 class Add_To_Wishlist(APIView):
@@ -117,6 +169,9 @@ class Add_To_Wishlist(APIView):
     
 
 class SupplierinquiryView(APIView):
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'supplier_inquiry'
+
     def post(self, request, *args, **kwargs):
         serializer = SupplierinquirySerializer(data=request.data)
         if serializer.is_valid():
@@ -141,68 +196,47 @@ class SupplierinquiryView(APIView):
 
 
 class CartItemsViewsBuyUser(APIView):
-    permission_classes = [IsAuthenticated]
+    """
+    سلة المستخدم من CartItem، وسلة الزائر من الـ cookie (نفس شكل الـ response)
+    """
+    permission_classes = [AllowAny]
 
     def get(self, request, id=None):
         user = request.user
         if not user.is_authenticated:
-            return Response({"error": "User undefined"}, status=401)
-
-        items = CartItem.objects.filter(cart__user=user, is_ordered=False)
-
-        # Serializer للـ items
-        serializer = CartItemSerializer(items, many=True)
-
-        # حساب subtotal (مجموع أسعار كل المنتجات مع الكمية)
-        subtotal = sum([item.product.price * item.quantity for item in items], Decimal('0.00'))
-
-        # جلب الخصائص الإضافية
-        tax = Tax.objects.filter(active=True).last()
-        discount = Discount.objects.filter(active=True).last()
-        shippingFee = ShippingFee.objects.filter(active=True).last()
-        serviceFee = ServiceFee.objects.filter(active=True).last()
-
-        # تطبيق الخصم
-        discount_amount = Decimal('0.00')
-        if discount:
-            if getattr(discount, 'percent', None):
-                discount_amount = subtotal * (Decimal(discount.percent) / Decimal('100'))
-            elif getattr(discount, 'amount', None):
-                discount_amount = Decimal(discount.amount)
-
-        total = subtotal - discount_amount
-        # إضافة الضريبة
-        if tax and getattr(tax, 'rate', None):
-            total += total * (Decimal(tax.rate) / Decimal('100'))
-
-        # إضافة رسوم الشحن
-        if shippingFee and getattr(shippingFee, 'cost', None):
-            total += Decimal(shippingFee.cost)
-
-        # إضافة رسوم الخدمة
-        if serviceFee and getattr(serviceFee, 'cost', None):
-            total += Decimal(serviceFee.cost)
-
-        total = round(total + tax.rate, 2)
+            items, lines = guest_cart_items(load_guest_cart(request), request)
+            rules = get_pricing_rules()
+            return Response({
+                "items": items,
+                **quote_data(price_cart(lines, rules)),
+                "shippingFee": float(rules.shipping.cost) if rules.shipping else None,
+                "serviceFee": float(rules.service_fee.cost) if rules.service_fee else None,
+            })
 
+        # ملخص السلة من الـ cache (orders/cart_summary.py) والمجاميع من محرك التسعير: بدون أي query
+        rules = get_pricing_rules()
         return Response({
-            "items": serializer.data,
-            "subtotal": float(subtotal),
-            "discount": float(discount_amount),
-            "tax": float(tax.rate) if tax else None,
-            "shippingFee": float(shippingFee.cost) if shippingFee else None,
-            "serviceFee": float(serviceFee.cost) if serviceFee else None,
-            "total": float(total),
+            **cart_state(user),
+            "shippingFee": float(rules.shipping.cost) if rules.shipping else None,
+            "serviceFee": float(rules.service_fee.cost) if rules.service_fee else None,
         })
 
 
     def delete(self, request, id):
-        item = get_object_or_404(CartItem, id=id)
+        if not request.user.is_authenticated:
+            lines = load_guest_cart(request)
+            remaining = [line for line in lines if line.id != id]
+            if len(remaining) == len(lines):
+                return Response({"detail": "Not found."}, status=404)
+            response = Response({"message": "Item deleted successfully"})
+            save_guest_cart(response, remaining)
+            return response
+
+        item = get_object_or_404(CartItem, id=id, cart__user=request.user)
         item.delete()
         return Response({"message": "Item deleted successfully"})
 
     def put(self, request, id):
-        item = get_object_or_404(CartItem, id=id)
         quantity_change = request.data.get("quantity_change")
 
         try:
@@ -210,12 +244,20 @@ class CartItemsViewsBuyUser(APIView):
         except (TypeError, ValueError):
             return Response({"error": "Invalid quantity value"}, status=400)
 
-        item.quantity += quantity_change
-        if item.quantity <= 0:
-            item.delete()
-            return Response({"message": "Item removed from cart"})
-
-        item.save()
+        if not request.user.is_authenticated:
+            return self.update_guest_line(request, id, quantity_change)
+
+        # زيادة/نقص في قاعدة البيانات (F): نقرتان في نفس الوقت لا تضيع إحداهما
+        items = CartItem.objects.filter(id=id, cart__user=request.user)
+        with transaction.atomic():
+            if not items.update(quantity=Greatest(F('quantity') + quantity_change, Value(0))):
+                return Response({"detail": "Not found."}, status=404)
+            item = items.select_related('product').get()
+            if item.quantity <= 0:
+                item.delete()
+                return Response({"message": "Item removed from cart"})
+            # update() لا يطلق post_save
+            schedule_cart_refresh(request.user.pk)
 
         # حساب total الخاص بالمنتج
         item_total = float(item.product.price * item.quantity)
@@ -226,8 +268,31 @@ class CartItemsViewsBuyUser(APIView):
             "total": item_total
         })
 
+    def update_guest_line(self, request, id, quantity_change):
+        lines = load_guest_cart(request)
+        line = next((line for line in lines if line.id == id), None)
+        if line is None:
+            return Response({"detail": "Not found."}, status=404)
+
+        if line.quantity + quantity_change <= 0:
+            response = Response({"message": "Item removed from cart"})
+            save_guest_cart(response, [other for other in lines if other is not line])
+            return response
+        line.quantity = guest_quantity(line.quantity + quantity_change)
+
+        items, _ = guest_cart_items([line], request)
+        response = Response({
+            "message": "Quantity updated",
+            "quantity": line.quantity,
+            "total": float(items[0]["total"]) if items else 0,
+        })
+        save_guest_cart(response, lines)
+        return response
+
 class CreateOrderNoAuthenticated(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'guest_order'
 
     def post(self, request, id):
         try:
@@ -235,7 +300,12 @@ class CreateOrderNoAuthenticated(APIView):
         except Product.DoesNotExist:
             return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        quantity = int(request.data.get("quantity", 1))
+        try:
+            quantity = int(request.data.get("quantity", 1))
+        except (TypeError, ValueError):
+            quantity = 0
+        if quantity < 1:
+            return Response({"error": "Invalid quantity value"}, status=status.HTTP_400_BAD_REQUEST)
         customer_name = request.data.get("customer_name")
         customer_phone = request.data.get("customer_phone")
         customer_address = request.data.get("customer_address")
@@ -243,20 +313,22 @@ class CreateOrderNoAuthenticated(APIView):
         if not all([customer_name, customer_phone, customer_address]):
             return Response({"error": "Missing required customer information"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # إنشاء الطلب
-        order = Order.objects.create(
+        # طلب مباشر بدون سلة: عنصر واحد غير محفوظ
+        choices = {field: request.data.get(field) or None for field in ("options", "color", "size")}
+        line = CartItem(product=product, quantity=quantity, **choices)
+        # المجموع يُحفظ مع الطلب مثل CreateOrder (صفحة التأكيد تعرضه كما هو)
+        quote = price_cart([(product.price, quantity)], get_pricing_rules())
+        order = place_order(
+            [line],
             customer_name=customer_name,
             customer_phone=customer_phone,
             customer_address=customer_address,
             payment_method=Order.PaymentMethod.CASH_ON_DELIVERY,
             state=Order.OrderState.PENDING,
+            total=quote.total,
+            discount=quote.discount,
+            **choices,
         )
-        order.products.add(product)
-        order.save()
-
-        # زيادة sales_count للمنتج
-        product.sales_count += quantity
-        product.save(update_fields=['sales_count'])
 
         return Response({"message": "Order created successfully", "order_id": str(order.id)}, status=status.HTTP_201_CREATED)
 
@@ -265,49 +337,18 @@ class CreateOrderNoAuthenticated(APIView):
 class CreateOrder(APIView):
     permission_classes = [IsAuthenticated]
 
-    def calculate_totals(self, items):
-        subtotal = Decimal('0.00')
-        for item in items:
-            subtotal += Decimal(item.product.price) * item.quantity
-
-        # جلب الخصائص الإضافية
-        tax = Tax.objects.filter(active=True).last()
-        discount_obj = Discount.objects.filter(active=True).last()
-        shippingFee = ShippingFee.objects.filter(active=True).last()
-        serviceFee = ServiceFee.objects.filter(active=True).last()
-
-        # حساب الخصم
-        discount = Decimal('0.00')
-        if discount_obj:
-            if getattr(discount_obj, 'percent', None):
-                discount = subtotal * (Decimal(discount_obj.percent) / Decimal('100'))
-            elif getattr(discount_obj, 'amount', None):
-                discount = Decimal(discount_obj.amount)
-
-        total = subtotal - discount
-
-        # إضافة الضريبة
-        tax_rate = Decimal(tax.rate) if tax and getattr(tax, 'rate', None) else Decimal('0.00')
-        total += total * (tax_rate / Decimal('100'))
-
-        # رسوم الشحن
-        shipping = Decimal(shippingFee.cost) if shippingFee and getattr(shippingFee, 'cost', None) else Decimal('0.00')
-        total += shipping
-
-        # رسوم الخدمة
-        service_fee = Decimal(serviceFee.cost) if serviceFee and getattr(serviceFee, 'cost', None) else Decimal('0.00')
-        total += service_fee
-
-        total = round(total, 2) + tax.rate
-        return float(subtotal), float(discount), float(tax_rate), float(shipping), float(service_fee), float(total)
+    def calculate_totals(self, items, coupon=None, city=None):
+        rules = get_pricing_rules()
+        shipping, _ = rules.shipping_for(city)
+        return price_cart(cart_lines(items), rules, coupon, shipping)
 
     def get(self, request):
         user = request.user
         if not user.is_authenticated:
             return Response({"error": "User undefined"}, status=401)
 
-        items = CartItem.objects.filter(cart__user=user, is_ordered=False)
-        if not items.exists():
+        items = list(CartItem.objects.filter(cart__user=user, is_ordered=False).select_related('product'))
+        if not items:
             return Response({
                 "order_summary": [],
                 "subtotal": 0,
@@ -331,16 +372,9 @@ class CreateOrder(APIView):
                 }
             })
 
-        subtotal, discount, tax_rate, shipping, service_fee, total = self.calculate_totals(items)
-    
         return Response({
             "order_summary": order_summary,
-            "subtotal": subtotal,
-            "discount": discount,
-            "tax": tax_rate,
-            "shipping": shipping,
-            "service_fee": service_fee,
-            "total": total
+            **quote_data(self.calculate_totals(items, city=request.query_params.get("city"))),
         }, status=200)
 
     def post(self, request):
@@ -352,47 +386,50 @@ class CreateOrder(APIView):
         customer_email = request.data.get("customer_email")
         customer_phone = request.data.get("customer_phone")
         customer_address = request.data.get("customer_address")
-        is_use_coupon = request.data.get("is_use_coupon")
         code_id = request.data.get("code_id")
-        total_ = request.data.get("total")
         city = request.data.get("city")
 
         if not all([customer_name, customer_phone, customer_address, city]):
             return Response({"error": "Missing required customer information"}, status=400)
 
-        items = CartItem.objects.filter(cart__user=user, is_ordered=False)
-        if not items.exists():
-            return Response({"error": "Cart is empty"}, status=400)
-
-        # تسجيل استخدام الكوبون مرة واحدة لكل مستخدم
-        if code_id and not CouponUsage.objects.filter(user=user, coupon_id=code_id).exists():
-            CouponUsage.objects.create(user=user, coupon_id=code_id)
-
-        order = Order.objects.create(
-            state=Order.OrderState.PENDING,
-            payment_method=Order.PaymentMethod.CASH_ON_DELIVERY,
-            customer_name=customer_name,
-            customer_email=customer_email,
-            customer_phone=customer_phone,
-            customer_address=customer_address,
-            city=city,
-            user=user,
-            total=total_,
-            is_use_coupon=is_use_coupon
-        )
-
-        for item in items:
-            order.products.add(item.product)
-            item.is_ordered = True
-            item.order = order
-            item.save()
+        # الكوبون يجب أن يكون مفعلًا وداخل فترته الآن؛ المجموع يُحسب هنا وليس من الواجهة
+        coupon = get_pricing_rules().get_coupon(coupon_id=code_id) if code_id else None
+        if code_id and coupon is None:
+            return Response({"error": "Invalid or expired coupon"}, status=400)
 
-            # زيادة sales_count حسب كمية المنتج
-            item.product.sales_count += item.quantity
-            item.product.save(update_fields=['sales_count'])
-
-        subtotal, discount, tax_rate, shipping, service_fee, total = self.calculate_totals(items)
-        order.save()
+        try:
+            with transaction.atomic():
+                # كل الـ checkout في transaction واحد: إما الطلب كاملًا أو لا شيء
+                items = get_checkout_items(user)
+                if not items:
+                    return Response({"error": "Cart is empty"}, status=400)
+
+                # المجاميع من العناصر قبل أي تعديل
+                quote = self.calculate_totals(items, coupon, city)
+
+                # مرة واحدة لكل مستخدم وتحت usage_limit، بـ UPDATE بشرط (يرجع مع أي rollback)
+                if coupon:
+                    redeem_coupon(coupon.id, user)
+
+                order = place_order(
+                    items,
+                    state=Order.OrderState.PENDING,
+                    payment_method=Order.PaymentMethod.CASH_ON_DELIVERY,
+                    customer_name=customer_name,
+                    customer_email=customer_email,
+                    customer_phone=customer_phone,
+                    customer_address=customer_address,
+                    city=city,
+                    user=user,
+                    total=quote.total,
+                    discount=quote.discount + quote.coupon_discount,
+                    coupon_id=coupon.id if coupon else None,
+                    is_use_coupon=coupon is not None,
+                )
+        except CartChanged:
+            return Response({"error": "Cart changed, please try again"}, status=409)
+        except CouponUnavailable as error:
+            return Response({"error": str(error)}, status=400)
 
         order_summary = [{
             "id": str(item.id),
@@ -414,12 +451,7 @@ class CreateOrder(APIView):
                 "customer_phone": order.customer_phone,
                 "customer_address": order.customer_address,
                 "city": order.city,
-                "subtotal": subtotal,
-                "discount": discount,
-                "tax": tax_rate,
-                "shipping": shipping,
-                "service_fee": service_fee,
-                "total": total,
+                **quote_data(quote),
                 "items": order_summary
             }
         }, status=201)
@@ -432,15 +464,139 @@ class ApplyCouponAPIView(APIView):
         user = request.user
         if not user.is_authenticated:
             return Response({"error": "User undefined"}, status=status.HTTP_401_UNAUTHORIZED)
-        print(f"User {user.username} is applying a coupon")
         coupon_code = request.data.get("code")
         if not coupon_code:
             return Response({"error": "Coupon code is required"}, status=status.HTTP_400_BAD_REQUEST)
-        if CouponUsage.objects.filter(user=user, coupon__code=coupon_code).exists():
-            return Response({"error": "Coupon already used by this user"}, status=status.HTTP_400_BAD_REQUEST)
 
-        if not Coupon.objects.filter(code=coupon_code, active=True).exists():
+        # مفعل وداخل فترة start_date/end_date، من snapshot التسعير بدون query؛ الاستعمالات من الـ cache
+        rules = get_pricing_rules()
+        coupon = rules.get_coupon(code=coupon_code)
+        if coupon is None or not has_uses_left(coupon):
             return Response({"error": "Invalid or inactive coupon code"}, status=status.HTTP_400_BAD_REQUEST)
-        code = Coupon.objects.get(code=coupon_code, active=True)
-        print(f"Applying coupon: {code.code} with discount {code.discount_percent}%")
-        return Response({"message": "Coupon applied successfully","code":code.code,"discount_percent":code.discount_percent,"code_id":code.id}, status=status.HTTP_200_OK)
\ No newline at end of file
+        if CouponUsage.objects.filter(user=user, coupon_id=coupon.id).exists():
+            return Response({"error": "Coupon already used by this user"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # المجاميع الجديدة للسلة بنفس حساب الـ checkout
+        items = CartItem.objects.filter(cart__user=user, is_ordered=False).select_related('product')
+        shipping, _ = rules.shipping_for(request.data.get("city"))
+        quote = price_cart(cart_lines(items), rules, coupon, shipping)
+        return Response({
+            "message": "Coupon applied successfully",
+            "code": coupon.code,
+            "discount_percent": coupon.percent,
+            "code_id": coupon.id,
+            **quote_data(quote),
+        }, status=status.HTTP_200_OK)
+
+
+
+def cart_state(user):
+    summary = get_cart_summary(user.pk)
+    rules = get_pricing_rules()
+    return {
+        "items": summary["items"],
+        "item_count": summary["item_count"],
+        **quote_data(price_cart(summary["lines"], rules)),
+    }
+
+
+class CartBatchView(APIView):
+    """
+    عدة عمليات على السلة (add/set/change/remove) في transaction واحد (orders/batch.py)، يرجع السلة الجديدة
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            changed = apply_cart_operations(request.user, request.data.get("operations"))
+        except BatchError as error:
+            return Response(error.as_data(), status=400)
+        return Response({"changed": changed, **cart_state(request.user)})
+
+
+class WishlistBatchView(APIView):
+    """
+    عدة عمليات على المفضلة (add/remove) في transaction واحد، يرجع المفضلة الجديدة
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            changed = apply_wishlist_operations(request.user, request.data.get("operations"))
+        except BatchError as error:
+            return Response(error.as_data(), status=400)
+
+        product_ids = wishlistItem.objects.filter(wishlist__user=request.user).values_list('product_id', flat=True)
+        cards = get_cards(product_ids)
+        return Response({
+            "changed": changed,
+            "count": len(cards),
+            "items": ProductCardSerializer(cards, many=True, context={"request": request}).data,
+        })
+
+
+def shipping_rule_data(rule):
+    return {
+        "region": rule.region,
+        "cost": float(rule.cost),
+        "estimated_days": rule.estimated_days,
+    }
+
+
+class ShippingQuoteView(APIView):
+    """
+    رسوم ومدة الشحن لمدينة الزبون (?city=...) أثناء الكتابة في صفحة الـ checkout، مع اقتراحات
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        city = request.query_params.get("city", "")
+        rules = get_pricing_rules()
+        rule, match = rules.shipping_for(city, prefix=True)
+        return Response({
+            "city": city,
+            "match": match,
+            **(shipping_rule_data(rule) if rule else {"region": None, "cost": None, "estimated_days": None}),
+            "suggestions": [shipping_rule_data(suggestion) for suggestion in rules.shipping_index.suggest(city)],
+        })
+
+
+
+def companions_response(request, companions):
+    cards = {card.product_id: card for card in get_cards([pk for pk, _, _ in companions])}
+    results = []
+    for product_id, lift, confidence in companions:
+        card = cards.get(product_id)
+        if card is None:
+            continue
+        data = ProductCardSerializer(card, context={"request": request}).data
+        data["lift"] = lift
+        data["confidence"] = confidence
+        results.append(data)
+    return Response({"results": results})
+
+
+class ProductBoughtTogether(APIView):
+    """
+    منتجات تُشترى عادةً مع هذا المنتج، مرتبة حسب lift ثم confidence
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, product_id):
+        return companions_response(request, get_companions(product_id))
+
+
+class CartBoughtTogether(APIView):
+    """
+    اقتراحات لصفحة السلة بناءً على كل منتجات السلة
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        if not request.user.is_authenticated:
+            product_ids = [line.product_id for line in load_guest_cart(request)]
+            return companions_response(request, companions_for(product_ids))
+        product_ids = CartItem.objects.filter(
+            cart__user=request.user, is_ordered=False
+        ).values_list('product_id', flat=True)
+        return companions_response(request, companions_for(product_ids))
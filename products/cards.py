@@ -0,0 +1,91 @@
+from django.db.models import OuterRef, Prefetch, Subquery
+from django.utils.text import Truncator
+
+from .models import Category, Option, Product, ProductCard
+
+
+SHORT_DESCRIPTION_LENGTH = 160
+
+CARD_FIELDS = [
+    'name', 'price', 'old_price', 'discount', 'short_description', 'image',
+    'categories', 'options', 'rating_count', 'rating_sum', 'sales_count', 'is_active', 'created_at',
+]
+
+
+def build_card(product):
+    return ProductCard(
+        product=product,
+        name=product.name,
+        price=product.price,
+        old_price=product.old_price,
+        discount=product.discount,
+        short_description=Truncator(product.description_1 or '').chars(SHORT_DESCRIPTION_LENGTH),
+        image=product.image_1.name or '',
+        categories=[
+            {'id': c.id, 'name': c.name, 'image': c.image.url if c.image else None}
+            for c in product.categories.all()
+        ],
+        options=[{'id': o.id, 'name': o.name} for o in product.options.all()],
+        rating_count=product.rating_count,
+        rating_sum=product.rating_sum,
+        sales_count=product.sales_count,
+        is_active=product.is_active,
+        created_at=product.created_at,
+    )
+
+
+def refresh_product_cards(product_ids):
+    """
+    إعادة بناء بطاقات هذه المنتجات (3 queries مهما كان العدد). المنتج المحذوف تُحذف بطاقته بالـ CASCADE.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    products = (
+        Product.objects.filter(pk__in=product_ids)
+        .only(
+            'id', 'name', 'price', 'old_price', 'discount', 'description_1', 'image_1',
+            'rating_count', 'rating_sum', 'sales_count', 'is_active', 'created_at',
+        )
+        .prefetch_related(
+            Prefetch('categories', queryset=Category.objects.only('id', 'name', 'image')),
+            Prefetch('options', queryset=Option.objects.only('id', 'name')),
+        )
+    )
+    cards = [build_card(product) for product in products]
+    ProductCard.objects.bulk_create(
+        cards, update_conflicts=True, unique_fields=['product'], update_fields=CARD_FIELDS,
+    )
+    return len(cards)
+
+
+def rebuild_product_cards(chunk_size=500):
+    ids = list(Product.objects.values_list('pk', flat=True))
+    for start in range(0, len(ids), chunk_size):
+        refresh_product_cards(ids[start:start + chunk_size])
+    ProductCard.objects.exclude(product_id__in=Product.objects.values('pk')).delete()
+    return len(ids)
+
+
+def get_cards(product_ids):
+    """
+    البطاقات بنفس ترتيب ids، في query واحد على المفتاح الأساسي. البطاقات الناقصة تُبنى فورًا.
+    """
+    product_ids = list(product_ids)
+    cards = ProductCard.objects.in_bulk(product_ids)
+    missing = [pk for pk in product_ids if pk not in cards]
+    if missing:
+        refresh_product_cards(missing)
+        cards.update(ProductCard.objects.in_bulk(missing))
+    return [cards[pk] for pk in product_ids if pk in cards]
+
+
+def refresh_changed_cards(sender, product_ids, **kwargs):
+    refresh_product_cards(product_ids)
+
+
+def refresh_sales_counts(sender, product_ids, **kwargs):
+    # receiver لـ sales_changed: عمود واحد بـ UPDATE واحد بدل إعادة بناء البطاقات
+    ProductCard.objects.filter(product_id__in=product_ids).update(
+        sales_count=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('sales_count')[:1])
+    )
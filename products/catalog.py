@@ -0,0 +1,82 @@
+import threading
+import weakref
+
+from django.core.cache import cache
+from django.db import transaction
+from django.dispatch import Signal
+
+
+# يُرسل بعد الـ commit مع ids المنتجات التي تغيرت (المنتج، علاقاته، تقييماته، أسماء التصنيفات...)
+# المستقبلون: فهرس البحث، نسخة الكاش، ...
+catalog_changed = Signal()
+# مثل catalog_changed لكن بعد الطلبات: sales_count فقط تغير، فالبطاقات وعمود المبيعات في الـ snapshot يكفيان
+# (بدون إعادة فهرسة البحث ولا نسخة الكاش ولا سلات المستخدمين)
+sales_changed = Signal()
+
+CATALOG_VERSION_KEY = 'products:catalog-version'
+
+_pending = threading.local()
+_pending_sales = threading.local()
+
+
+class _ChangeBatch:
+    signal = catalog_changed
+
+    def __init__(self):
+        self.ids = set()
+
+    def __call__(self):
+        # أول callback بعد الـ commit يرسل كل الـ ids ويفرغ المجموعة، والباقي لا يجد شيئًا
+        product_ids, self.ids = self.ids, set()
+        if product_ids:
+            self.signal.send(sender=type(self), product_ids=frozenset(product_ids))
+
+
+class _SalesBatch(_ChangeBatch):
+    signal = sales_changed
+
+
+def current_batch(local, factory):
+    """
+    الـ batch المفتوح في هذا الـ thread. local يحتفظ فقط بـ weakref، والـ callbacks المسجلة عبر on_commit
+    هي التي تبقيه حيًا: بعد rollback يحذفها Django فيختفي الـ batch مع ids التغييرات الملغاة
+    """
+    batch = local.batch() if getattr(local, 'batch', None) else None
+    if batch is None:
+        batch = factory()
+        local.batch = weakref.ref(batch)
+    return batch
+
+
+def schedule_catalog_change(product_ids):
+    """
+    حفظ المنتج + save_m2m في الأدمن يطلق عدة signals؛ نجمعها ونرسل catalog_changed مرة واحدة بعد الـ commit
+    """
+    batch = current_batch(_pending, _ChangeBatch)
+    batch.ids.update(product_ids)
+    transaction.on_commit(batch)
+
+
+def schedule_sales_change(product_ids):
+    """
+    sales_count تغير بـ update() (الطلبات): sales_changed مرة واحدة بعد الـ commit
+    """
+    batch = current_batch(_pending_sales, _SalesBatch)
+    batch.ids.update(product_ids)
+    transaction.on_commit(batch)
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version(sender=None, **kwargs):
+    # كل الكاش المرتبط بالكتالوج يستعمل هذا الرقم في المفتاح، فيصبح القديم غير مستعمل
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, 2, timeout=None)
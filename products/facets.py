@@ -0,0 +1,143 @@
+import hashlib
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.functions import Floor
+
+from .catalog import get_catalog_version
+from .filters import ProductFilter
+from .models import Category, Color, Option, Product, Size
+
+
+FACETS_CACHE_TIMEOUT = 10 * 60
+
+# facet → (باراميتر الفلتر، علاقة M2M في Product، الموديل)
+ATTRIBUTE_FACETS = {
+    'category': ('category', 'categories', Category),
+    'color': ('color', 'color', Color),
+    'size': ('size', 'size', Size),
+    'option': ('option', 'options', Option),
+}
+
+LIST_PARAMS = {'category', 'color', 'size', 'option'}
+
+
+def normalize_params(params):
+    """
+    فقط باراميترات ProductFilter، بترتيب ثابت، حتى يكون مفتاح الكاش نفسه لنفس الفلاتر
+    """
+    normalized = {}
+    for key in ProductFilter.base_filters:
+        value = params.get(key)
+        if value in (None, ''):
+            continue
+        if key in LIST_PARAMS:
+            values = sorted({v.strip() for v in str(value).split(',') if v.strip()})
+            if values:
+                normalized[key] = ','.join(values)
+        else:
+            normalized[key] = str(value).strip()
+    return normalized
+
+
+def price_buckets():
+    edges = list(getattr(settings, 'PRODUCT_PRICE_BUCKETS', [0, 100, 500, 1000]))
+    return [(Decimal(lo), Decimal(hi) if hi is not None else None) for lo, hi in zip(edges, edges[1:] + [None])]
+
+
+def filtered_queryset(params, exclude=()):
+    # disjunctive faceting: عدد كل قيمة يحسب بكل الفلاتر ما عدا فلتر نفس الـ facet
+    data = {k: v for k, v in params.items() if k not in exclude}
+    # نفس المنتجات التي تظهر في القوائم (المفعلة فقط)
+    filterset = ProductFilter(data, queryset=Product.objects.filter(is_active=True))
+    if not filterset.is_valid():
+        return None
+    return filterset.qs
+
+
+def attribute_counts(params, facet):
+    param, relation, model = ATTRIBUTE_FACETS[facet]
+    queryset = filtered_queryset(params, exclude={param})
+    if queryset is None:
+        return []
+
+    through = getattr(Product, relation).through
+    column = f'{model._meta.model_name}_id'
+    # query واحد مجمّع على جدول الوسيط بدل query لكل قيمة
+    rows = (
+        through.objects
+        .filter(product_id__in=queryset.order_by().values('pk'))
+        .values(column)
+        .annotate(count=Count('product_id', distinct=True))
+    )
+    counts = {row[column]: row['count'] for row in rows}
+    return [
+        {'id': obj.id, 'name': obj.name, 'count': counts.get(obj.id, 0)}
+        for obj in model.objects.order_by('id').only('id', 'name')
+    ]
+
+
+def rating_counts(params):
+    queryset = filtered_queryset(params, exclude={'rating'})
+    if queryset is None:
+        return []
+    # نفس منطق filter_rating: النجمة v تعني متوسط في [v, v+1)
+    rows = (
+        Product.objects
+        .filter(pk__in=queryset.order_by().values('pk'), rating_count__gt=0)
+        .annotate(bucket=Floor('rating_avg'))
+        .values('bucket')
+        .annotate(count=Count('id'))
+    )
+    counts = {int(row['bucket']): row['count'] for row in rows}
+    return [{'rating': star, 'count': counts.get(star, 0)} for star in range(5, 0, -1)]
+
+
+def price_counts(params):
+    queryset = filtered_queryset(params, exclude={'price_min', 'price_max'})
+    if queryset is None:
+        return []
+
+    buckets = price_buckets()
+    aggregates = {}
+    for index, (low, high) in enumerate(buckets):
+        condition = Q(price__gte=low)
+        if high is not None:
+            condition &= Q(price__lt=high)
+        aggregates[f'b{index}'] = Count('id', filter=condition)
+
+    # كل الشرائح في query واحد عبر aggregates شرطية
+    result = Product.objects.filter(pk__in=queryset.order_by().values('pk')).aggregate(**aggregates)
+    return [
+        {'min': low, 'max': high, 'count': result[f'b{index}']}
+        for index, (low, high) in enumerate(buckets)
+    ]
+
+
+def compute_facets(params):
+    params = normalize_params(params)
+    queryset = filtered_queryset(params)
+    return {
+        'total': queryset.order_by().values('pk').distinct().count() if queryset is not None else 0,
+        'category': attribute_counts(params, 'category'),
+        'color': attribute_counts(params, 'color'),
+        'size': attribute_counts(params, 'size'),
+        'option': attribute_counts(params, 'option'),
+        'rating': rating_counts(params),
+        'price': price_counts(params),
+    }
+
+
+def get_facets(params):
+    params = normalize_params(params)
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    key = f'products:facets:{get_catalog_version()}:{digest}'
+
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(params)
+        cache.set(key, facets, FACETS_CACHE_TIMEOUT)
+    return facets
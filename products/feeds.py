@@ -0,0 +1,229 @@
+"""
+تصدير الكتالوج كاملًا للـ marketplaces وإعلانات Google (CSV / JSONL / XML بصيغة Google Shopping).
+
+المنتجات تُقرأ chunk بعد chunk بالـ keyset (created_at, id) والعلاقات تُجلب لكل chunk مرة واحدة، وكل منتج
+يتحول لسطر نصي ويُكتب فورًا، فالذاكرة ثابتة مهما كان حجم الكتالوج. كل chunk يُقرأ كاملًا قبل الكتابة:
+لا SELECT مفتوح (ولا قفل SHARED على SQLite) أثناء إرسال البيانات لعميل بطيء.
+
+/products/feed.<fmt> لا يقرأ قاعدة البيانات في كل طلب: يرسل ملفًا مولّدًا مسبقًا (PRODUCT_FEED_DIR)
+ويُعاد توليده إذا كان أقدم من PRODUCT_FEED_MAX_AGE.
+"""
+import csv
+import json
+import os
+import threading
+import time
+from urllib.parse import urljoin
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import reset_queries
+from django.db.models import Q
+from django.urls import reverse
+
+from .importer import LIST_SEPARATOR
+from .models import Category, Color, Product, Size
+
+
+CHUNK_SIZE = 500
+BUFFER_SIZE = 64 * 1024  # نجمع الأسطر الصغيرة قبل الإرسال
+FEED_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'xml': 'application/xml; charset=utf-8',
+}
+FEED_COLUMNS = [
+    'id', 'sku', 'title', 'description', 'link', 'image_link', 'additional_image_links',
+    'price', 'sale_price', 'availability', 'product_type', 'color', 'size',
+]
+FEED_RELATIONS = {'categories': Category, 'color': Color, 'size': Size}
+# Google يقبل حتى 10 صور إضافية
+MAX_ADDITIONAL_IMAGES = 10
+
+
+def feed_currency():
+    return getattr(settings, 'PRODUCT_FEED_CURRENCY', 'MAD')
+
+
+def absolute_url(path):
+    return urljoin(settings.MINE_DOMINE, path)
+
+
+def feed_products(chunk_size=CHUNK_SIZE):
+    """
+    (المنتج، {العلاقة: [أسماء]}) للمنتجات المفعلة، chunk بعد chunk: query للمنتجات + query لكل علاقة
+    على الجدول الوسيط فقط. الأسماء من قاموس في الذاكرة (التصنيفات والألوان والمقاسات قليلة).
+    """
+    names = {relation: dict(model.objects.values_list('pk', 'name')) for relation, model in FEED_RELATIONS.items()}
+    products = (
+        Product.objects.filter(is_active=True)
+        .only('id', 'sku', 'name', 'price', 'old_price', 'description_1', 'created_at', *Product.IMAGE_FIELDS)
+        .order_by('created_at', 'id')
+    )
+    last = None
+    while True:
+        # keyset على index (created_at, id): كل chunk query قصير، فلا قفل يبقى مفتوحًا بين الـ chunks
+        page = products if last is None else products.filter(
+            Q(created_at__gt=last.created_at) | Q(created_at=last.created_at, id__gt=last.pk)
+        )
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            break
+        last = chunk[-1]
+        relations = {product.pk: {relation: [] for relation in FEED_RELATIONS} for product in chunk}
+        for relation in FEED_RELATIONS:
+            field = Product._meta.get_field(relation)
+            source, target = field.m2m_field_name() + '_id', field.m2m_reverse_field_name() + '_id'
+            rows = (
+                field.remote_field.through.objects.filter(**{f'{source}__in': list(relations)})
+                .order_by('pk').values_list(source, target)
+            )
+            for product_id, value_id in rows:
+                if value_id in names[relation]:
+                    relations[product_id][relation].append(names[relation][value_id])
+        for product in chunk:
+            yield product, relations[product.pk]
+        if settings.DEBUG:
+            reset_queries()  # مع DEBUG=True يحتفظ Django بكل query (وكل واحد فيه 500 id)
+        if len(chunk) < chunk_size:
+            break
+
+
+def feed_item(product, relations):
+    """
+    dict واحد لكل منتج، نفس المفاتيح لكل الصيغ. السعر المشطوب (old_price) هو price عند Google
+    والسعر الحالي هو sale_price.
+    """
+    images = [
+        absolute_url(default_storage.url(image.name))
+        for image in (getattr(product, field) for field in Product.IMAGE_FIELDS)
+        if image
+    ]
+    currency = feed_currency()
+    on_sale = product.old_price is not None and product.old_price > product.price
+    return {
+        'id': str(product.pk),
+        'sku': product.sku or '',
+        'title': product.name,
+        'description': product.description_1 or '',
+        'link': absolute_url(reverse('Product_Details', args=[product.pk])),
+        'image_link': images[0] if images else '',
+        'additional_image_links': images[1:1 + MAX_ADDITIONAL_IMAGES],
+        'price': f"{product.old_price if on_sale else product.price:.2f} {currency}",
+        'sale_price': f"{product.price:.2f} {currency}" if on_sale else '',
+        'availability': 'in stock',
+        'product_type': relations['categories'],
+        'color': relations['color'],
+        'size': relations['size'],
+    }
+
+
+class _Echo:
+    # csv.writer يكتب هنا فيرجع السطر بدل كتابته
+    def write(self, value):
+        return value
+
+
+def csv_feed(products):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FEED_COLUMNS)
+    for product, relations in products:
+        item = feed_item(product, relations)
+        yield writer.writerow([
+            LIST_SEPARATOR.join(value) if isinstance(value, list) else value
+            for value in (item[column] for column in FEED_COLUMNS)
+        ])
+
+
+def jsonl_feed(products):
+    for product, relations in products:
+        yield json.dumps(feed_item(product, relations), ensure_ascii=False) + '\n'
+
+
+def xml_feed(products):
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0">\n<channel>\n'
+        f'<title>{escape(getattr(settings, "PRODUCT_FEED_TITLE", "Products"))}</title>\n'
+        f'<link>{escape(settings.MINE_DOMINE)}</link>\n'
+    )
+    for product, relations in products:
+        item = feed_item(product, relations)
+        tags = [
+            ('g:id', item['id']), ('title', item['title']), ('description', item['description']),
+            ('link', item['link']), ('g:image_link', item['image_link']),
+            *(('g:additional_image_link', url) for url in item['additional_image_links']),
+            ('g:price', item['price']), ('g:sale_price', item['sale_price']),
+            ('g:availability', item['availability']), ('g:condition', 'new'),
+            ('g:mpn', item['sku']),
+            # التصنيفات مستوى واحد (وليست شجرة): tag لكل تصنيف
+            *(('g:product_type', name) for name in item['product_type']),
+            ('g:color', '/'.join(item['color'])), ('g:size', ', '.join(item['size'])),
+        ]
+        yield '<item>\n' + ''.join(f'<{tag}>{escape(value)}</{tag}>\n' for tag, value in tags if value) + '</item>\n'
+    yield '</channel>\n</rss>\n'
+
+
+FEED_WRITERS = {'csv': csv_feed, 'jsonl': jsonl_feed, 'xml': xml_feed}
+
+
+def generate_feed(fmt, chunk_size=CHUNK_SIZE):
+    """
+    مولّد نصوص الـ feed بالصيغة المطلوبة (ValueError لصيغة غير معروفة)
+    """
+    if fmt not in FEED_WRITERS:
+        raise ValueError(f"unknown feed format {fmt!r}")
+    return buffered(FEED_WRITERS[fmt](feed_products(chunk_size)))
+
+
+def buffered(lines, size=BUFFER_SIZE):
+    buffer, length = [], 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def write_feed(fmt, path, chunk_size=CHUNK_SIZE):
+    """
+    الـ feed في ملف: يُكتب في .tmp ثم يُعاد تسميته، فالملف القديم يبقى صالحًا حتى ينتهي التصدير
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8', newline='') as handle:
+        for chunk in generate_feed(fmt, chunk_size):
+            handle.write(chunk)
+    os.replace(path + '.tmp', path)
+
+
+_build_locks = {fmt: threading.Lock() for fmt in FEED_FORMATS}
+
+
+def feed_path(fmt):
+    return os.path.join(settings.PRODUCT_FEED_DIR, f'feed.{fmt}')
+
+
+def get_feed_file(fmt):
+    """
+    مسار feed جاهز. ملف أقدم من PRODUCT_FEED_MAX_AGE يُعاد توليده مرة واحدة لكل process؛
+    الطلبات الأخرى أثناء التوليد تأخذ الملف القديم بدل أن تقرأ الكتالوج كلها معًا.
+    """
+    path = feed_path(fmt)
+    max_age = getattr(settings, 'PRODUCT_FEED_MAX_AGE', 3600)
+    exists = os.path.exists(path)
+    if exists and time.time() - os.path.getmtime(path) < max_age:
+        return path
+    lock = _build_locks[fmt]
+    if not lock.acquire(blocking=not exists):
+        return path
+    try:
+        # process آخر (أو طلب سبقنا للقفل) ربما ولّده للتو
+        if not os.path.exists(path) or time.time() - os.path.getmtime(path) >= max_age:
+            write_feed(fmt, path)
+    finally:
+        lock.release()
+    return path
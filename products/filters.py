@@ -1,19 +1,21 @@
 import django_filters
 from django_filters import rest_framework as filters
 from .models import Product
-from django.db.models import Avg, Q
+from .search import get_search_backend
+from django.db.models import F, Q
 from decimal import Decimal
 
 class ProductFilter(filters.FilterSet):
     # فلاتر موجودة عندك
-    category = filters.BaseInFilter(field_name="categories__id", lookup_expr="in")
-    option = filters.BaseInFilter(field_name="options__id", lookup_expr="in")
-    color = filters.BaseInFilter(field_name="color__id", lookup_expr="in")
-    size = filters.BaseInFilter(field_name="size__id", lookup_expr="in")
+    category = filters.BaseInFilter(field_name="categories__id", lookup_expr="in", distinct=True)
+    option = filters.BaseInFilter(field_name="options__id", lookup_expr="in", distinct=True)
+    color = filters.BaseInFilter(field_name="color__id", lookup_expr="in", distinct=True)
+    size = filters.BaseInFilter(field_name="size__id", lookup_expr="in", distinct=True)
     
     price_min = filters.NumberFilter(field_name="price", lookup_expr="gte")
     price_max = filters.NumberFilter(field_name="price", lookup_expr="lte")
-    name = filters.CharFilter(field_name="name", lookup_expr="icontains")
+    # بحث نصي في الاسم والوصف والتصنيفات والخصائص (products/search.py)
+    name = filters.CharFilter(method="filter_search")
 
     # فلتر التقييم
     rating = filters.NumberFilter(method="filter_rating")
@@ -26,7 +28,17 @@ class ProductFilter(filters.FilterSet):
         ]
 
     def filter_rating(self, queryset, name, value):
-        return queryset.annotate(
-            avg_rating=Avg("ratings__rating")
-        ).filter(avg_rating__isnull=False) \
-        .filter(avg_rating__gte=Decimal(value), avg_rating__lt=Decimal(value) + 1)
+        # avg >= value و avg < value + 1 بدون JOIN: sum >= value*count و sum < (value+1)*count
+        value = Decimal(value)
+        return queryset.filter(rating_count__gt=0).filter(
+            rating_sum__gte=F("rating_count") * value,
+            rating_sum__lt=F("rating_count") * (value + 1),
+        )
+
+    def filter_search(self, queryset, name, value):
+        results = get_search_backend().search(queryset, value)
+        request = self.request
+        if request is not None and request.GET.get("sort"):
+            # ترتيب صريح من المستخدم له الأولوية على ترتيب الصلة
+            return results.order_by(*queryset.query.order_by)
+        return results
@@ -0,0 +1,274 @@
+"""
+استيراد المنتجات بالجملة من CSV أو JSONL (python manage.py import_products).
+
+الملف يُقرأ سطرًا بسطر ويُكتب على دفعات: bulk_create للمنتجات، ثم صفوف الجداول الوسيطة
+للتصنيفات/الألوان/المقاسات/الخيارات بالجملة. الأسماء تتحول لـ ids من قاموس في الذاكرة
+(قليل: بالمئات). الذاكرة ثابتة مهما كان حجم الملف.
+
+الأعمدة: sku, name, price, old_price, discount, description_1..3, image_1..10 (اسم الملف داخل MEDIA_ROOT),
+is_active, sales_count, categories, options, color, size (أسماء مفصولة بـ | في CSV، أو list في JSONL).
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import reset_queries, transaction
+
+from website.images import VariantQueue
+from .cards import refresh_product_cards
+from .catalog import bump_catalog_version
+from .models import Category, Color, Option, Product, Size
+from .search import get_search_backend
+from .snapshot import build_snapshot, snapshot_enabled
+
+
+BATCH_SIZE = 1000
+LIST_SEPARATOR = '|'
+MAX_REPORTED_ERRORS = 50
+
+DECIMAL_FIELDS = ['price', 'old_price', 'discount']
+TEXT_FIELDS = ['name', 'description_1', 'description_2', 'description_3'] + Product.IMAGE_FIELDS
+IMPORT_FIELDS = DECIMAL_FIELDS + TEXT_FIELDS + ['is_active', 'sales_count']
+
+# عمود الملف → (علاقة M2M في Product، الموديل)
+RELATIONS = {
+    'categories': Category,
+    'options': Option,
+    'color': Color,
+    'size': Size,
+}
+RELATION_ALIASES = {'category': 'categories', 'option': 'options', 'colors': 'color', 'sizes': 'size'}
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(path, fmt=None):
+    """
+    (رقم السطر، dict) واحدًا واحدًا
+    """
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, newline='', encoding='utf-8-sig') as handle:
+        if fmt == 'csv':
+            for line, row in enumerate(csv.DictReader(handle), start=2):
+                yield line, row
+        else:
+            for line, raw in enumerate(handle, start=1):
+                if raw.strip():
+                    try:
+                        yield line, json.loads(raw)
+                    except ValueError as error:
+                        yield line, RowError(f"invalid JSON: {error}")
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class NameLookup:
+    """
+    اسم → id لتصنيف/لون/مقاس/خيار. الأسماء الجديدة تُنشأ (إلا مع create_missing=False).
+    """
+
+    def __init__(self, model, create_missing=True):
+        self.model = model
+        self.create_missing = create_missing
+        self.ids = {}
+        self.created = 0
+        for pk, name in model.objects.values_list('pk', 'name'):
+            self.ids.setdefault(name.strip().lower(), pk)
+
+    def resolve(self, names):
+        ids = []
+        for name in names:
+            key = name.strip().lower()
+            if not key:
+                continue
+            if key not in self.ids:
+                if not self.create_missing:
+                    raise RowError(f"unknown {self.model._meta.verbose_name} {name!r}")
+                self.ids[key] = self.model.objects.create(name=name.strip()).pk
+                self.created += 1
+            ids.append(self.ids[key])
+        return ids
+
+
+def split_names(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return str(value).split(LIST_SEPARATOR)
+
+
+class ProductImporter:
+    def __init__(self, update=False, create_missing=True, batch_size=BATCH_SIZE, process_images=True):
+        self.update = update
+        self.batch_size = batch_size
+        self.lookups = {relation: NameLookup(model, create_missing) for relation, model in RELATIONS.items()}
+        self.images = VariantQueue() if process_images else None
+        self.search = get_search_backend()
+        self.report = {'created': 0, 'updated': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+
+    # ____________________________ تحويل سطر ____________________________
+
+    def parse(self, row):
+        """
+        (sku، الحقول، {العلاقة: [أسماء]}) من سطر واحد؛ RowError لأي قيمة غير صالحة
+        """
+        if isinstance(row, RowError):
+            raise row
+        row = {RELATION_ALIASES.get(key, key): value for key, value in row.items() if key}
+        values = {}
+        for field in IMPORT_FIELDS:
+            if field not in row:
+                continue
+            raw = row[field]
+            raw = raw.strip() if isinstance(raw, str) else raw
+            if field in DECIMAL_FIELDS:
+                if raw in (None, ''):
+                    values[field] = None if field != 'price' else Decimal('0')
+                    continue
+                try:
+                    values[field] = Decimal(str(raw))
+                except InvalidOperation:
+                    raise RowError(f"{field}: {raw!r} is not a number")
+            elif field == 'is_active':
+                values[field] = raw if isinstance(raw, bool) else str(raw).lower() in TRUE_VALUES
+            elif field == 'sales_count':
+                try:
+                    values[field] = int(raw or 0)
+                except (TypeError, ValueError):
+                    raise RowError(f"sales_count: {raw!r} is not an integer")
+            else:
+                values[field] = raw or ''
+        sku = str(row.get('sku') or '').strip() or None
+        relations = {relation: split_names(row[relation]) for relation in RELATIONS if relation in row}
+        return sku, values, relations
+
+    def resolve(self, line, relations):
+        """
+        الأسماء → ids، فقط للأسطر التي ستُكتب فعلًا (السطر المتجاهَل لا ينشئ تصنيفات)
+        """
+        try:
+            return {relation: self.lookups[relation].resolve(names) for relation, names in relations.items()}
+        except RowError as error:
+            self.fail(line, error)
+            return None
+
+    def fail(self, line, error):
+        self.report['failed'] += 1
+        if len(self.report['errors']) < MAX_REPORTED_ERRORS:
+            self.report['errors'].append((line, str(error)))
+
+    # ____________________________ دفعة ____________________________
+
+    def import_batch(self, rows):
+        parsed = {}
+        unkeyed = []
+        for line, row in rows:
+            try:
+                sku, values, relations = self.parse(row)
+            except RowError as error:
+                self.fail(line, error)
+                continue
+            if sku is None:
+                unkeyed.append((line, values, relations))
+            else:
+                parsed[sku] = (line, values, relations)  # نفس sku مكرر في الدفعة: الأخير يفوز
+
+        existing = dict(Product.objects.filter(sku__in=parsed).values_list('sku', 'pk')) if parsed else {}
+        new, updated = [], []
+        rows = [(line, sku, values, relations) for sku, (line, values, relations) in parsed.items()]
+        rows += [(line, None, values, relations) for line, values, relations in unkeyed]
+        for line, sku, values, relations in rows:
+            if sku in existing and not self.update:
+                self.report['skipped'] += 1
+                continue
+            if sku not in existing and not values.get('name'):
+                self.fail(line, "name is required for new products")
+                continue
+            relations = self.resolve(line, relations)
+            if relations is None:
+                continue
+            if sku in existing:
+                # التحديث الجزئي مسموح: الأعمدة الناقصة تبقى كما هي
+                updated.append((Product(pk=existing[sku], sku=sku, **values), relations, set(values)))
+            else:
+                new.append((Product(sku=sku, **values), relations))
+
+        with transaction.atomic():
+            Product.objects.bulk_create([product for product, _ in new], batch_size=500)
+            # الأعمدة الموجودة في السطر فقط تتحدث؛ مجموعة لكل شكل سطر
+            groups = {}
+            for product, _, fields in updated:
+                groups.setdefault(frozenset(fields), []).append(product)
+            for fields, products in groups.items():
+                # الـ pk معروف مسبقًا (من sku)، فالتعارض يكون على id
+                Product.objects.bulk_create(
+                    products, batch_size=500, update_conflicts=True, unique_fields=['id'],
+                    update_fields=sorted(fields) + ['updated_at'],
+                )
+            self.write_relations(
+                [(product, relations) for product, relations in new]
+                + [(product, relations) for product, relations, _ in updated],
+                replace=[product.pk for product, _, _ in updated],
+            )
+
+        product_ids = [product.pk for product, _ in new] + [product.pk for product, _, _ in updated]
+        self.report['created'] += len(new)
+        self.report['updated'] += len(updated)
+        self.after_batch(product_ids, [product for product, _ in new] + [product for product, _, _ in updated])
+
+    def write_relations(self, items, replace):
+        for relation in RELATIONS:
+            field = Product._meta.get_field(relation)
+            through = field.remote_field.through
+            source, target = field.m2m_field_name() + '_id', field.m2m_reverse_field_name() + '_id'
+            touched = [product for product, relations in items if relation in relations]
+            if not touched:
+                continue
+            if replace:
+                # التحديث يستبدل العلاقة بالكامل (فقط للأعمدة الموجودة في الملف)
+                touched_ids = {product.pk for product in touched}
+                through.objects.filter(**{f'{source}__in': [pk for pk in replace if pk in touched_ids]}).delete()
+            through.objects.bulk_create(
+                [
+                    through(**{source: product.pk, target: value_id})
+                    for product, relations in items if relation in relations
+                    for value_id in set(relations[relation])
+                ],
+                batch_size=2000, ignore_conflicts=True,
+            )
+
+    def after_batch(self, product_ids, products):
+        """
+        bulk_create لا يطلق signals: نحدّث البطاقات وفهرس البحث لهذه الدفعة مباشرة،
+        ونرسل الصور للـ pool (بدون انتظار، إلا إذا امتلأ)
+        """
+        refresh_product_cards(product_ids)
+        self.search.index_products(product_ids)
+        if self.images is not None:
+            for product in products:
+                for field in Product.IMAGE_FIELDS:
+                    self.images.put(getattr(product, field).name)
+
+    def run(self, path, fmt=None):
+        for rows in batched(read_rows(path, fmt), self.batch_size):
+            self.import_batch(rows)
+            reset_queries()  # مع DEBUG=True يحتفظ Django بكل query في الذاكرة
+        bump_catalog_version()
+        if snapshot_enabled():
+            build_snapshot()
+        if self.images is not None:
+            done, failed = self.images.join()
+            self.report['images'] = done
+            self.report['image_errors'] = failed
+        self.report['created_attributes'] = {relation: lookup.created for relation, lookup in self.lookups.items()}
+        return self.report
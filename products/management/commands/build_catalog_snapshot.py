@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products import snapshot
+
+
+class Command(BaseCommand):
+    help = "Build the memory-mapped columnar catalog snapshot used by the product list views."
+
+    def handle(self, *args, **options):
+        if snapshot.np is None:
+            raise CommandError("numpy is not installed.")
+
+        started = time.perf_counter()
+        count = snapshot.build_snapshot()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot of {count} product(s) written to {snapshot.snapshot_root()} in {elapsed:.2f}s."
+        ))
@@ -0,0 +1,56 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products import similarity
+
+
+class Command(BaseCommand):
+    help = "Compute the similar-products neighbor lists (only products whose attributes or price changed, unless --full)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Recompute every product.")
+        parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: CPU count).")
+        parser.add_argument("--k", type=int, default=similarity.NEIGHBORS_COUNT, help="Neighbors per product.")
+        parser.add_argument(
+            "--benchmark", type=int, metavar="N", default=None,
+            help="Time a full build on N synthetic products without touching the database.",
+        )
+
+    def handle(self, *args, **options):
+        if similarity.np is None:
+            raise CommandError("numpy is not installed.")
+
+        if options["benchmark"]:
+            return self.benchmark(options["benchmark"], options["k"], options["workers"])
+
+        started = time.perf_counter()
+        count = similarity.build_similar_products(full=options["full"], k=options["k"], workers=options["workers"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Recomputed {count} neighbor list(s) in {elapsed:.2f}s."))
+
+    def benchmark(self, count, k, workers):
+        rng = random.Random(42)
+        token_sets, prices = [], []
+        for _ in range(count):
+            tokens = {f"c{rng.randrange(60)}" for _ in range(rng.randint(1, 3))}
+            tokens |= {f"k{rng.randrange(20)}" for _ in range(rng.randint(0, 3))}
+            tokens |= {f"s{rng.randrange(10)}" for _ in range(rng.randint(0, 3))}
+            tokens |= {f"o{rng.randrange(40)}" for _ in range(rng.randint(0, 2))}
+            token_sets.append(tokens)
+            prices.append(round(rng.lognormvariate(4, 1), 2))
+
+        started = time.perf_counter()
+        index = similarity.build_index(token_sets, prices)
+        indexed = time.perf_counter()
+        result = similarity.compute_neighbors(index, range(count), k=k, workers=workers)
+        finished = time.perf_counter()
+
+        filled = sum(1 for neighbors in result.values() if neighbors)
+        self.stdout.write(f"products:        {count}")
+        self.stdout.write(f"minhash + lsh:   {indexed - started:.2f}s")
+        self.stdout.write(f"neighbors:       {finished - indexed:.2f}s")
+        self.stdout.write(self.style.SUCCESS(
+            f"total:           {finished - started:.2f}s ({filled} products with neighbors)"
+        ))
@@ -0,0 +1,31 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand
+
+from products.feeds import CHUNK_SIZE, FEED_FORMATS, feed_path, generate_feed, write_feed
+
+
+class Command(BaseCommand):
+    help = "Export the active catalog as a CSV, JSONL or Google Shopping XML feed (run from cron to refresh the served feed)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(FEED_FORMATS), default="xml")
+        parser.add_argument(
+            "-o", "--output",
+            help="Output file, or - for stdout (default: the file served at /products/feed.<format>). "
+                 "Written to a temp file, then renamed.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        if output == "-":
+            for chunk in generate_feed(options["format"], options["chunk_size"]):
+                sys.stdout.write(chunk)
+            return
+
+        # الملف القديم يبقى صالحًا للـ marketplaces حتى ينتهي التصدير
+        output = output or feed_path(options["format"])
+        write_feed(options["format"], output, options["chunk_size"])
+        self.stderr.write(self.style.SUCCESS(f"Wrote {output} ({os.path.getsize(output)} bytes)."))
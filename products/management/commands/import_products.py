@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importer import BATCH_SIZE, ProductImporter
+
+
+class Command(BaseCommand):
+    help = "Bulk-import products from a CSV or JSONL file (streamed, in batches)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV (header row) or JSONL file.")
+        parser.add_argument("--format", choices=["csv", "jsonl"], default=None, help="Default: from the file extension.")
+        parser.add_argument("--update", action="store_true",
+                            help="Update products whose sku already exists (default: skip them).")
+        parser.add_argument("--no-create-missing", action="store_true",
+                            help="Reject rows naming an unknown category/color/size/option instead of creating it.")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--skip-images", action="store_true", help="Do not generate responsive image variants.")
+
+    def handle(self, *args, **options):
+        importer = ProductImporter(
+            update=options["update"],
+            create_missing=not options["no_create_missing"],
+            batch_size=options["batch_size"],
+            process_images=not options["skip_images"],
+        )
+        started = time.perf_counter()
+        try:
+            report = importer.run(options["path"], options["format"])
+        except FileNotFoundError as error:
+            raise CommandError(str(error))
+        elapsed = time.perf_counter() - started
+
+        for line, error in report["errors"]:
+            self.stderr.write(f"line {line}: {error}")
+        for name, error in report.get("image_errors", []):
+            self.stderr.write(f"{name}: {error}")
+        created_attributes = ", ".join(f"{count} {relation}" for relation, count in report["created_attributes"].items() if count)
+        if created_attributes:
+            self.stdout.write(f"Created {created_attributes}.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report['created']}, updated {report['updated']}, skipped {report['skipped']}, "
+            f"failed {report['failed']} product(s) in {elapsed:.1f}s."
+        ))
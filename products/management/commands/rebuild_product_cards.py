@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.cards import rebuild_product_cards
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized product cards used by the list views."
+
+    def handle(self, *args, **options):
+        count = rebuild_product_cards()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} product card(s)."))
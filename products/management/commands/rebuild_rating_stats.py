@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from products.rating_stats import rebuild_rating_stats
+
+
+class Command(BaseCommand):
+    help = "Verify the stored rating aggregates on Product and repair any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help="Only report products whose stored aggregates are wrong, don't fix them.",
+        )
+        parser.add_argument('--product', action='append', dest='products', help="Limit to a product id (repeatable).")
+
+    def handle(self, *args, **options):
+        fix = not options['verify']
+        drifted = rebuild_rating_stats(options['products'], fix=fix)
+
+        for product in drifted:
+            self.stdout.write(f"  {product.pk}: count={product.rating_count} sum={product.rating_sum}")
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Rating aggregates are in sync."))
+        elif fix:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {len(drifted)} product(s)."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} product(s) out of sync."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index from scratch."
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        count = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {count or 0} product(s) with {backend.__class__.__name__}."
+        ))
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_stats(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Rating = apps.get_model('products', 'Rating')
+
+    stats = {}
+    for row in Rating.objects.values('product_id', 'rating').annotate(n=Count('id')):
+        entry = stats.setdefault(row['product_id'], {'rating_count': 0, 'rating_sum': 0})
+        entry['rating_count'] += row['n']
+        entry['rating_sum'] += row['rating'] * row['n']
+        entry[f"rating_{row['rating']}_count"] = row['n']
+
+    for product_id, values in stats.items():
+        Product.objects.filter(pk=product_id).update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_color_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:05
+
+from django.db import migrations, models
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+
+def backfill_rating_avg(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Product.objects.filter(rating_count__gt=0).update(
+        rating_avg=Cast(F('rating_sum'), FloatField()) / F('rating_count')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_rating_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created_at', 'id'], name='product_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['sales_count', 'id'], name='product_bestseller_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['rating_avg', 'id'], name='product_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['discount', 'id'], name='product_discount_idx'),
+        ),
+        migrations.RunPython(backfill_rating_avg, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:20
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    Product = apps.get_model('products', 'Product')
+    pk = Product._meta.pk
+
+    # الـ DDL هنا وليس من products.search: الـ migration يبقى كما هو مهما تغير الكود لاحقًا
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS products_search USING fts5("
+            "product_id UNINDEXED, name, description, categories, attributes, "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS products_search_vocab USING fts5vocab(products_search, 'row')"
+        )
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS products_search_terms USING fts5(term, tokenize='trigram')"
+        )
+
+        rows = []
+        products = Product.objects.prefetch_related('categories', 'color', 'size', 'options')
+        for product in products:
+            descriptions = [product.description_1, product.description_2, product.description_3]
+            attributes = [o.name for o in product.color.all()] + [o.name for o in product.size.all()]
+            attributes += [o.name for o in product.options.all()]
+            rows.append((
+                pk.get_db_prep_value(product.pk, schema_editor.connection),
+                product.name,
+                ' '.join(d for d in descriptions if d),
+                ' '.join(c.name for c in product.categories.all()),
+                ' '.join(attributes),
+            ))
+        cursor.executemany(
+            "INSERT INTO products_search (product_id, name, description, categories, attributes) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            rows,
+        )
+        cursor.execute(
+            "INSERT INTO products_search_terms (term) "
+            "SELECT term FROM products_search_vocab WHERE length(term) >= 3"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS products_search_terms")
+        cursor.execute("DROP TABLE IF EXISTS products_search_vocab")
+        cursor.execute("DROP TABLE IF EXISTS products_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
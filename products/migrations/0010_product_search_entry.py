@@ -0,0 +1,43 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:40
+
+import django.db.models.deletion
+import products.models
+from django.db import migrations, models
+
+
+def configure_rank(apps, schema_editor):
+    # عمود rank في products_search يرجع bm25 بأوزان الأعمدة
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO products_search (products_search, rank) VALUES ('rank', %s)",
+            ['bm25(0.0, 10.0, 2.0, 4.0, 3.0)'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchEntry',
+            fields=[
+                ('product', models.OneToOneField(db_column='product_id', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='products.product')),
+                ('name', models.TextField()),
+                ('description', models.TextField()),
+                ('categories', models.TextField()),
+                ('attributes', models.TextField()),
+                ('document', products.models.SearchDocumentField(db_column='products_search')),
+                ('rank', models.FloatField(db_column='rank')),
+            ],
+            options={
+                'db_table': 'products_search',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(configure_rank, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+
+def backfill_cards(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductCard = apps.get_model('products', 'ProductCard')
+
+    cards = []
+    for product in Product.objects.prefetch_related('categories', 'options').iterator(chunk_size=500):
+        cards.append(ProductCard(
+            product_id=product.pk,
+            name=product.name,
+            price=product.price,
+            old_price=product.old_price,
+            discount=product.discount,
+            short_description=Truncator(product.description_1 or '').chars(160),
+            image=product.image_1.name or '',
+            categories=[
+                {'id': c.id, 'name': c.name, 'image': c.image.url if c.image else None}
+                for c in product.categories.all()
+            ],
+            options=[{'id': o.id, 'name': o.name} for o in product.options.all()],
+            rating_count=product.rating_count,
+            rating_sum=product.rating_sum,
+            sales_count=product.sales_count,
+            is_active=product.is_active,
+            created_at=product.created_at,
+        ))
+    ProductCard.objects.bulk_create(cards, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_product_search_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCard',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='products.product')),
+                ('name', models.CharField(max_length=300)),
+                ('price', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('old_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('discount', models.DecimalField(blank=True, decimal_places=2, max_digits=4, null=True)),
+                ('short_description', models.CharField(blank=True, max_length=255)),
+                ('image', models.CharField(blank=True, max_length=255)),
+                ('categories', models.JSONField(default=list)),
+                ('options', models.JSONField(default=list)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('sales_count', models.PositiveIntegerField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='card_newest_idx'), models.Index(fields=['discount'], name='card_discount_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_cards, migrations.RunPython.noop),
+    ]
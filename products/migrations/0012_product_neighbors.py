@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_product_card'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductNeighbors',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='neighbors', serialize=False, to='products.product')),
+                ('neighbor_ids', models.JSONField(default=list)),
+                ('fingerprint', models.CharField(max_length=40)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -3,11 +3,11 @@ import uuid
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.conf import settings
 from django.db import models
-from PIL import Image
-from io import BytesIO
-from django.core.files.base import ContentFile
+from website.images import TrackedImagesMixin
+from django.core.files.storage import default_storage
+from django.db.models import Lookup
 
-class Category(models.Model):
+class Category(TrackedImagesMixin, models.Model):
     name = models.CharField(max_length=200)
     image = models.ImageField(upload_to='category/')
 
@@ -17,28 +17,7 @@ class Category(models.Model):
     class Meta:
         verbose_name_plural = "Categories"
 
-    def save(self, *args, **kwargs):
-        if self.image:
-            # افتح الصورة
-            img = Image.open(self.image)
-
-            # حوّلها إلى RGB إذا كانت بصيغة أخرى (مثلاً PNG فيها شفافية)
-            if img.mode in ("RGBA", "P"):
-                img = img.convert("RGB")
-
-            # تصغير حجم الصورة (هنا أقصى عرض/ارتفاع = 800px)
-            img.thumbnail((800, 800), Image.Resampling.LANCZOS)
-
-            # ضغط الصورة وجودة 70%
-            buffer = BytesIO()
-            img.save(buffer, format='JPEG', quality=70)
-            buffer.seek(0)
-
-            # حفظ الصورة المصغرة في نفس الحقل
-            self.image.save(self.image.name, ContentFile(buffer.read()), save=False)
-
-        super().save(*args, **kwargs)
-
+    IMAGE_FIELDS = ['image']
 
 
 class Option(models.Model):
@@ -62,9 +41,11 @@ class Size(models.Model):
         return self.name
 
 
-class Product(models.Model):
+class Product(TrackedImagesMixin, models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=300)
+    # رقم المنتج في النظام الخارجي (manage.py import_products --update)
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     old_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     discount = models.DecimalField(max_digits=4, decimal_places=2, default=0, null=True, blank=True)
@@ -91,55 +72,48 @@ class Product(models.Model):
     color = models.ManyToManyField('Color', related_name='products', blank=True)
     size = models.ManyToManyField('Size', related_name='products', blank=True)
 
+    # إحصائيات التقييم محفوظة مع المنتج وتتحدث عبر signals (products/signals.py)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField(default=0, editable=False)  # للترتيب حسب التقييم
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    IMAGE_FIELDS = [f'image_{i}' for i in range(1, 11)]
+
     def __str__(self):
         return self.name
 
     def average_rating(self):
-        ratings = self.ratings.all()
-        if ratings.exists():
-            return round(sum(r.rating for r in ratings) / ratings.count(), 2)
+        if self.rating_count:
+            return round(self.rating_sum / self.rating_count, 2)
         return 0
 
     def total_reviews(self):
-        return self.ratings.count()
-
-    def compress_image(self, image_field):
-        if not image_field:
-            return None
-        
-        img = Image.open(image_field)
-        img = img.convert('RGB')  # للتأكد من نوع الصورة
-
-        # تحديد الحد الأقصى للعرض (مثلاً 800 بكسل)
-        max_width = 800
-        if img.width > max_width:
-            ratio = max_width / float(img.width)
-            new_height = int(float(img.height) * ratio)
-            img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-
-        # حفظ الصورة المضغوطة في ذاكرة مؤقتة
-        img_io = BytesIO()
-        img.save(img_io, format='JPEG', quality=70)  # الجودة 70% لضغط جيد دون فقد كبير
-        img_content = ContentFile(img_io.getvalue(), name=image_field.name)
-
-        return img_content
-
-    def save(self, *args, **kwargs):
-        # ضغط الصور قبل الحفظ
-        for field_name in ['image_1', 'image_2', 'image_3', 'image_4', 'image_5', 'image_6', 'image_7', 'image_8', 'image_9', 'image_10']:
-            image = getattr(self, field_name)
-            if image and hasattr(image, 'file'):
-                compressed_image = self.compress_image(image)
-                if compressed_image:
-                    setattr(self, field_name, compressed_image)
-
-        super().save(*args, **kwargs)
+        return self.rating_count
+
+    def ratings_breakdown(self):
+        # عدد التقييمات لكل نجمة من 1 إلى 5
+        return {i: getattr(self, f'rating_{i}_count') for i in range(1, 6)}
 
     class Meta:
         ordering = ['-created_at']
+        # فهارس الترتيب في /products-list/shop/?sort=... مع id كـ tiebreaker
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='product_newest_idx'),
+            models.Index(fields=['sales_count', 'id'], name='product_bestseller_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['rating_avg', 'id'], name='product_rating_idx'),
+            models.Index(fields=['discount', 'id'], name='product_discount_idx'),
+            # watermark الـ snapshot (products/snapshot.py): MAX(updated_at) بدون قراءة الجدول كله
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+        ]
 
 
 class Rating(models.Model):
@@ -160,3 +134,100 @@ class Rating(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+
+
+
+class ProductCard(models.Model):
+    """
+    نسخة مختصرة من المنتج لقوائم العرض (shop، الرئيسية، المفضلة...)، تتحدث عبر catalog_changed (products/cards.py)
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    name = models.CharField(max_length=300)
+    price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    old_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    discount = models.DecimalField(max_digits=4, decimal_places=2, null=True, blank=True)
+    short_description = models.CharField(max_length=255, blank=True)
+    image = models.CharField(max_length=255, blank=True)  # اسم ملف image_1 في الـ storage
+    categories = models.JSONField(default=list)  # [{"id", "name", "image"}]
+    options = models.JSONField(default=list)  # [{"id", "name"}]
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    sales_count = models.PositiveIntegerField(default=0)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField()
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def id(self):
+        return self.product_id
+
+    @property
+    def image_url(self):
+        return default_storage.url(self.image) if self.image else None
+
+    def average_rating(self):
+        if self.rating_count:
+            return round(self.rating_sum / self.rating_count, 2)
+        return 0
+
+    def total_reviews(self):
+        return self.rating_count
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='card_newest_idx'),
+            models.Index(fields=['discount'], name='card_discount_idx'),
+        ]
+
+
+
+class ProductNeighbors(models.Model):
+    """
+    قائمة المنتجات المشابهة محسوبة مسبقًا (products/similarity.py)
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='neighbors')
+    neighbor_ids = models.JSONField(default=list)  # من الأقرب للأبعد
+    fingerprint = models.CharField(max_length=40)  # الخصائص + السعر وقت الحساب
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.product_id} ({len(self.neighbor_ids)})"
+
+
+
+class SearchDocumentField(models.TextField):
+    """
+    العمود المخفي في جداول FTS5 الذي يحمل نفس اسم الجدول: products_search MATCH '...'
+    """
+
+
+@SearchDocumentField.register_lookup
+class SearchMatch(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class ProductSearchEntry(models.Model):
+    """
+    جدول FTS5 (products/search.py). الجدول ينشأ في migration 0009 وليس عبر Django.
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.DO_NOTHING, primary_key=True,
+        db_column='product_id', related_name='search_entry', db_constraint=False,
+    )
+    name = models.TextField()
+    description = models.TextField()
+    categories = models.TextField()
+    attributes = models.TextField()
+    document = SearchDocumentField(db_column='products_search')
+    rank = models.FloatField(db_column='rank')
+
+    class Meta:
+        managed = False
+        db_table = 'products_search'
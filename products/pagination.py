@@ -0,0 +1,163 @@
+import base64
+import json
+
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .models import Product
+
+
+# كل ترتيب له فهرس (انظر Product.Meta.indexes) و id كـ tiebreaker ثابت
+PRODUCT_SORTS = {
+    'newest': ('-created_at', '-id'),
+    'bestseller': ('-sales_count', '-id'),
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+    'rating': ('-rating_avg', '-id'),
+    'discount': ('-discount', '-id'),
+}
+
+
+def get_sort(request, default='newest'):
+    sort = request.query_params.get('sort') or default
+    return sort if sort in PRODUCT_SORTS else default
+
+
+def sort_ordering(sort):
+    """
+    ordering قابل للاستعمال في order_by، مع NULLS LAST للحقول التي تقبل null (مثل discount)
+    """
+    ordering = []
+    for key in PRODUCT_SORTS[sort]:
+        name = key.lstrip('-')
+        if Product._meta.get_field(name).null:
+            expression = F(name).desc(nulls_last=True) if key.startswith('-') else F(name).asc(nulls_first=True)
+            ordering.append(expression)
+        else:
+            ordering.append(key)
+    return ordering
+
+
+class ProductPagination(PageNumberPagination):
+    page_size = 12
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class ProductCursorPagination(BasePagination):
+    """
+    Keyset pagination: ?pagination=cursor&sort=price_asc ثم نتبع رابط next.
+    لا يوجد OFFSET ولا COUNT(*)، لذلك الصفحة 1000 بنفس تكلفة الصفحة الأولى.
+    العدد الكلي اختياري عبر ?include_count=true.
+    البحث (?name=) بدون sort صريح مرتب بالصلة (bm25) وليس بعمود: يبقى على PageNumberPagination.
+    """
+    cursor_query_param = 'cursor'
+    page_size = ProductPagination.page_size
+    page_size_query_param = ProductPagination.page_size_query_param
+    max_page_size = ProductPagination.max_page_size
+    invalid_cursor_message = 'Invalid cursor'
+
+    @classmethod
+    def is_requested(cls, request):
+        params = request.query_params
+        if params.get('name') and not params.get('sort'):
+            return False
+        return params.get('pagination') == 'cursor' or cls.cursor_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.sort = get_sort(request, getattr(view, 'default_sort', 'newest'))
+        self.fields = [key.lstrip('-') for key in PRODUCT_SORTS[self.sort]]
+        self.descending = PRODUCT_SORTS[self.sort][0].startswith('-')
+
+        self.count = None
+        if request.query_params.get('include_count') in ('1', 'true'):
+            self.count = queryset.count()
+
+        queryset = queryset.order_by(*sort_ordering(self.sort))
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded:
+            value, last_id = self.decode_cursor(encoded)
+            queryset = queryset.filter(self.after(value, last_id))
+
+        # نجلب عنصرًا زائدًا لنعرف هل توجد صفحة تالية
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def after(self, value, last_id):
+        field, _ = self.fields
+        lookup = 'lt' if self.descending else 'gt'
+        nullable = Product._meta.get_field(field).null
+
+        if value is None:
+            # NULLS LAST في التنازلي و NULLS FIRST في التصاعدي
+            condition = Q(**{f'{field}__isnull': True, f'id__{lookup}': last_id})
+            if not self.descending:
+                condition |= Q(**{f'{field}__isnull': False})
+            return condition
+
+        condition = Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'id__{lookup}': last_id})
+        if nullable and self.descending:
+            condition |= Q(**{f'{field}__isnull': True})
+        return condition
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, obj):
+        field, _ = self.fields
+        value = getattr(obj, field)
+        position = {'s': self.sort, 'v': None if value is None else str(value), 'id': str(obj.pk)}
+        return base64.urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, encoded):
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if position['s'] != self.sort:
+                raise ValueError
+            field = Product._meta.get_field(self.fields[0])
+            value = None if position['v'] is None else field.to_python(position['v'])
+            last_id = Product._meta.pk.to_python(position['id'])
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        return value, last_id
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, 'pagination', 'cursor')
+        url = remove_query_param(url, 'include_count')
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        payload = {'next': self.get_next_link(), 'previous': None, 'sort': self.sort}
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'sort': {'type': 'string', 'enum': list(PRODUCT_SORTS)},
+                'count': {'type': 'integer'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,105 @@
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Value, When
+from django.db.models.functions import Cast
+
+from .models import Product, Rating
+
+
+RATING_STATS_FIELDS = [
+    'rating_count', 'rating_sum',
+    'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+    'rating_avg',
+]
+
+
+def star_field(value):
+    return f'rating_{int(value)}_count'
+
+
+def average_after(sum_delta, count_delta):
+    # المتوسط الجديد محسوب داخل نفس الـ UPDATE (F تقرأ القيم قبل التحديث)
+    return Case(
+        When(rating_count__lte=-count_delta, then=Value(0.0)),
+        default=Cast(F('rating_sum') + sum_delta, FloatField()) / (F('rating_count') + count_delta),
+        output_field=FloatField(),
+    )
+
+
+def add_rating(product_id, value):
+    Product.objects.filter(pk=product_id).update(**{
+        'rating_count': F('rating_count') + 1,
+        'rating_sum': F('rating_sum') + int(value),
+        'rating_avg': average_after(int(value), 1),
+        star_field(value): F(star_field(value)) + 1,
+    })
+
+
+def remove_rating(product_id, value):
+    Product.objects.filter(pk=product_id, rating_count__gt=0).update(**{
+        'rating_count': F('rating_count') - 1,
+        'rating_sum': F('rating_sum') - int(value),
+        'rating_avg': average_after(-int(value), -1),
+        star_field(value): F(star_field(value)) - 1,
+    })
+
+
+def change_rating(product_id, old_value, new_value):
+    old_value, new_value = int(old_value), int(new_value)
+    if old_value == new_value:
+        return
+    # UPDATE واحد يكفي: ننقص النجمة القديمة ونزيد الجديدة
+    Product.objects.filter(pk=product_id).update(**{
+        'rating_sum': F('rating_sum') + (new_value - old_value),
+        'rating_avg': average_after(new_value - old_value, 0),
+        star_field(old_value): F(star_field(old_value)) - 1,
+        star_field(new_value): F(star_field(new_value)) + 1,
+    })
+
+
+def compute_rating_stats(product_ids=None):
+    """
+    حساب الإحصائيات من جدول Rating مباشرة: {product_id: {field: value}}
+    """
+    ratings = Rating.objects.all()
+    if product_ids is not None:
+        ratings = ratings.filter(product_id__in=product_ids)
+
+    stats = {}
+    for row in ratings.values('product_id', 'rating').annotate(n=Count('id')):
+        entry = stats.setdefault(row['product_id'], dict.fromkeys(RATING_STATS_FIELDS, 0))
+        entry['rating_count'] += row['n']
+        entry['rating_sum'] += row['rating'] * row['n']
+        entry[star_field(row['rating'])] += row['n']
+    for entry in stats.values():
+        entry['rating_avg'] = entry['rating_sum'] / entry['rating_count']
+    return stats
+
+
+def _differs(stored, expected):
+    if isinstance(expected, float):
+        return abs((stored or 0) - expected) > 1e-9
+    return stored != expected
+
+
+def rebuild_rating_stats(product_ids=None, fix=True):
+    """
+    مقارنة القيم المحفوظة مع الحساب الفعلي وإصلاح أي اختلاف.
+    ترجع قائمة المنتجات التي كان فيها اختلاف.
+    """
+    with transaction.atomic():
+        stats = compute_rating_stats(product_ids)
+        products = Product.objects.only('id', *RATING_STATS_FIELDS)
+        if product_ids is not None:
+            products = products.filter(pk__in=product_ids)
+
+        drifted = []
+        for product in products.iterator(chunk_size=1000):
+            expected = stats.get(product.pk) or dict.fromkeys(RATING_STATS_FIELDS, 0)
+            if any(_differs(getattr(product, field), value) for field, value in expected.items()):
+                for field, value in expected.items():
+                    setattr(product, field, value)
+                drifted.append(product)
+
+        if fix and drifted:
+            Product.objects.bulk_update(drifted, RATING_STATS_FIELDS, batch_size=500)
+    return drifted
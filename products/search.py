@@ -0,0 +1,261 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import ExpressionWrapper, F, FloatField, Q
+from django.db.models.functions import Cast
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+
+DEFAULT_SEARCH_BACKEND = 'products.search.SQLiteFTS5Backend'
+
+# وزن المبيعات في الترتيب: score = relevance + SALES_WEIGHT * sales / (sales + SALES_HALF)
+SALES_WEIGHT = 2.0
+SALES_HALF = 20.0
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    # نفس تطبيع unicode61 remove_diacritics: "Café" -> "cafe"
+    text = unicodedata.normalize('NFKD', (query or '').lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return TOKEN_RE.findall(text)
+
+
+def trigrams(word, padded=False):
+    # padded مثل pg_trgm: بداية ونهاية الكلمة لها وزن في التشابه
+    if padded:
+        word = f'  {word} '
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def product_document(product):
+    """
+    النص المفهرس لكل منتج، مقسم حسب الأعمدة (الاسم، الوصف، التصنيفات، الخصائص)
+    """
+    descriptions = [product.description_1, product.description_2, product.description_3]
+    attributes = [obj.name for obj in product.color.all()]
+    attributes += [obj.name for obj in product.size.all()]
+    attributes += [obj.name for obj in product.options.all()]
+    return {
+        'name': product.name or '',
+        'description': ' '.join(d for d in descriptions if d),
+        'categories': ' '.join(c.name for c in product.categories.all()),
+        'attributes': ' '.join(attributes),
+    }
+
+
+class BaseSearchBackend:
+    """
+    واجهة محرك البحث. أي backend جديد (Postgres, Elasticsearch...) يطبق هذه الدوال.
+    """
+
+    def index_products(self, product_ids):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def search(self, queryset, query):
+        """
+        ترجع queryset مفلتر بالبحث ومرتب حسب الصلة، بدون تنفيذ أي query
+        """
+        raise NotImplementedError
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """
+    بدون فهرس: icontains على كل الحقول. صالح لأي قاعدة بيانات.
+    """
+
+    def search(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset
+        for token in tokens:
+            queryset = queryset.filter(
+                Q(name__icontains=token)
+                | Q(description_1__icontains=token)
+                | Q(description_2__icontains=token)
+                | Q(description_3__icontains=token)
+                | Q(categories__name__icontains=token)
+                | Q(color__name__icontains=token)
+                | Q(size__name__icontains=token)
+                | Q(options__name__icontains=token)
+            )
+        return queryset.distinct().order_by('-sales_count', '-id')
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    """
+    فهرس FTS5 في نفس ملف SQLite، مع ترتيب BM25 ومطابقة تقريبية بالـ trigrams للأخطاء الإملائية.
+    """
+    table = 'products_search'
+    vocab_table = 'products_search_vocab'
+    terms_table = 'products_search_terms'
+
+    # أوزان bm25 حسب ترتيب الأعمدة: product_id, name, description, categories, attributes
+    column_weights = (0.0, 10.0, 2.0, 4.0, 3.0)
+    min_similarity = 0.3
+
+    def ensure_tables(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+            "product_id UNINDEXED, name, description, categories, attributes, "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.vocab_table} USING fts5vocab({self.table}, 'row')"
+        )
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.terms_table} USING fts5(term, tokenize='trigram')"
+        )
+        # عمود rank المخفي يرجع bm25 بهذه الأوزان
+        weights = ', '.join(str(w) for w in self.column_weights)
+        cursor.execute(
+            f"INSERT INTO {self.table} ({self.table}, rank) VALUES ('rank', %s)",
+            [f'bm25({weights})'],
+        )
+
+    def _db_ids(self, product_ids):
+        pk = Product._meta.pk
+        return [pk.get_db_prep_value(pk.to_python(product_id), connection) for product_id in product_ids]
+
+    def remove_products(self, product_ids):
+        ids = self._db_ids(product_ids)
+        if not ids:
+            return
+        # product_id عمود UNINDEXED: كل DELETE يمر على الجدول كاملًا، فنجمع الـ ids في IN واحد لكل 500
+        with connection.cursor() as cursor:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f"DELETE FROM {self.table} WHERE product_id IN ({placeholders})", chunk)
+
+    def index_products(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        products = Product.objects.filter(pk__in=product_ids).prefetch_related(
+            'categories', 'color', 'size', 'options'
+        )
+        rows = []
+        for product in products:
+            doc = product_document(product)
+            rows.append((
+                self._db_ids([product.pk])[0],
+                doc['name'], doc['description'], doc['categories'], doc['attributes'],
+            ))
+
+        with transaction.atomic():
+            self.remove_products(product_ids)
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {self.table} (product_id, name, description, categories, attributes) "
+                    "VALUES (%s, %s, %s, %s, %s)",
+                    rows,
+                )
+            self.sync_terms()
+
+    def sync_terms(self):
+        # الكلمات الجديدة فقط تدخل فهرس الـ trigrams
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {self.terms_table} (term) "
+                f"SELECT term FROM {self.vocab_table} "
+                f"WHERE length(term) >= 3 AND term NOT IN (SELECT term FROM {self.terms_table})"
+            )
+
+    def rebuild(self):
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                self.ensure_tables(cursor)
+                cursor.execute(f"DELETE FROM {self.table}")
+                cursor.execute(f"DELETE FROM {self.terms_table}")
+            ids = list(Product.objects.values_list('pk', flat=True))
+            for start in range(0, len(ids), 500):
+                self.index_products(ids[start:start + 500])
+            self.sync_terms()
+        return len(ids)
+
+    def has_term(self, token):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT 1 FROM {self.vocab_table} WHERE term >= %s AND term < %s LIMIT 1",
+                [token, token + '\uffff'],
+            )
+            return cursor.fetchone() is not None
+
+    def correct(self, token):
+        """
+        أقرب كلمة في الفهرس حسب تشابه الـ trigrams (Jaccard)، أو None
+        """
+        grams = trigrams(token)
+        if not grams:
+            return None
+        match = ' OR '.join('"%s"' % g.replace('"', '""') for g in grams)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT term FROM {self.terms_table} WHERE {self.terms_table} MATCH %s ORDER BY rank LIMIT 25",
+                [match],
+            )
+            candidates = [row[0] for row in cursor.fetchall()]
+
+        best, best_score = None, 0.0
+        padded = trigrams(token, padded=True)
+        for candidate in candidates:
+            other = trigrams(candidate, padded=True)
+            score = len(padded & other) / len(padded | other)
+            if score > best_score:
+                best, best_score = candidate, score
+        return best if best_score >= self.min_similarity else None
+
+    def build_match(self, tokens):
+        terms = []
+        for token in tokens:
+            if not self.has_term(token):
+                token = self.correct(token) or token
+            # prefix search: "phon" يطابق "phone" و "phones"
+            terms.append('"%s"*' % token.replace('"', '""'))
+        return ' '.join(terms)
+
+    def search(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset
+
+        match = self.build_match(tokens)
+        # rank = bm25 بأوزان الأعمدة (ضبطناها في ensure_tables)، سالب والأصغر أفضل؛ نعكسه ونضيف وزن المبيعات
+        sales = Cast('sales_count', FloatField())
+        score = -F('search_entry__rank') + SALES_WEIGHT * sales / (sales + SALES_HALF)
+        # JOIN مع جدول FTS داخل نفس الـ query، فيتجمع مع باقي فلاتر ProductFilter (حتى داخل subquery)
+        return queryset.filter(search_entry__document__match=match).annotate(
+            search_score=ExpressionWrapper(score, output_field=FloatField())
+        ).order_by('-search_score', '-id')
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path):
+    return import_string(path)()
+
+
+def get_search_backend():
+    path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', DEFAULT_SEARCH_BACKEND)
+    if path == DEFAULT_SEARCH_BACKEND and connection.vendor != 'sqlite':
+        path = 'products.search.SimpleSearchBackend'
+    return _load_backend(path)
+
+
+def reindex_changed_products(sender, product_ids, **kwargs):
+    backend = get_search_backend()
+    existing = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+    backend.remove_products(set(product_ids) - existing)
+    backend.index_products(existing)
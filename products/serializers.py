@@ -1,73 +1,82 @@
 from rest_framework import serializers
 from .models import *
 from orders.models import *
-class ProductShopSerializer(serializers.ModelSerializer):
+from .user_flags import get_product_flags
+from website.images import responsive_image
+
+
+def image_variants(image, request=None):
+    """
+    نسخ الصورة المتجاوبة (src / srcset / webp_srcset / width / height) أو None إذا لم تُولد بعد
+    """
+    info = responsive_image(image)
+    if info is None or request is None:
+        return info
+    absolute = lambda srcset: ', '.join(request.build_absolute_uri(entry) for entry in srcset.split(', '))
+    return {
+        **info,
+        'src': request.build_absolute_uri(info['src']),
+        'srcset': absolute(info['srcset']),
+        'webp_srcset': absolute(info['webp_srcset']),
+    }
+
+
+class ProductCardSerializer(serializers.ModelSerializer):
+    """
+    نفس شكل بيانات المنتج في القوائم، لكن من جدول ProductCard بدون أي query إضافي
+    """
+    id = serializers.UUIDField(source='product_id', read_only=True)
+    description_1 = serializers.CharField(source='short_description', read_only=True)
+    image_1 = serializers.SerializerMethodField()
+    image_1_variants = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
     total_reviews = serializers.SerializerMethodField()
-    categories = serializers.SerializerMethodField()
-    options = serializers.SerializerMethodField()
-    in_favorites = serializers.SerializerMethodField()
-    in_cart = serializers.SerializerMethodField()
 
     class Meta:
-        model = Product
+        model = ProductCard
         fields = [
             'id', 'name', 'price', 'old_price', 'discount',
-            'description_1', 'image_1',
+            'description_1', 'image_1', 'image_1_variants',
             'average_rating', 'total_reviews',
             'options', 'categories', 'sales_count',
-            'in_favorites',
-            'in_cart',
         ]
 
+    def get_image_1(self, obj):
+        url = obj.image_url
+        request = self.context.get('request')
+        if url and request:
+            return request.build_absolute_uri(url)
+        return url
+
+    def get_image_1_variants(self, obj):
+        return image_variants(obj.image, self.context.get('request'))
+
     def get_average_rating(self, obj):
         return obj.average_rating()
 
     def get_total_reviews(self, obj):
         return obj.total_reviews()
 
-    def get_categories(self, obj):
-        return [
-            {
-                "id": category.id,
-                "name": category.name,
-                "image": category.image.url if category.image else None
-            }
-            for category in obj.categories.all()
-        ]
 
-    def get_options(self, obj):
-        return [
-            {
-                "id": option.id,
-                "name": option.name
-            }
-            for option in obj.options.all()
-        ]
+class ProductShopSerializer(ProductCardSerializer):
+    in_favorites = serializers.SerializerMethodField()
+    in_cart = serializers.SerializerMethodField()
+
+    class Meta(ProductCardSerializer.Meta):
+        fields = ProductCardSerializer.Meta.fields + ['in_favorites', 'in_cart']
+
+    def get_product_flags(self):
+        flags = self.context.get('product_flags')
+        if flags is None:
+            flags = get_product_flags(self.context.get('request'))
+            self.context['product_flags'] = flags
+        return flags
 
     def get_in_favorites(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            user = request.user
-            # ابحث عن wishlist لهذا المستخدم
-            wishlist_obj = wishlist.objects.filter(user=user).first()
-            if wishlist_obj:
-                return wishlistItem.objects.filter(wishlist=wishlist_obj, product=obj).exists()
-        return False
+        return obj.product_id in self.get_product_flags()['favorites']
 
     def get_in_cart(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            user = request.user
-            # ابحث عن cart لهذا المستخدم (الغير مكتملة أو غير المرتبطة بالطلب)
-            cart_obj = Cart.objects.filter(user=user).first()
-            if cart_obj:
-                return CartItem.objects.filter(
-                    cart=cart_obj,
-                    product=obj,
-                    is_ordered=False
-                ).exists()
-        return False
+        return obj.product_id in self.get_product_flags()['cart']
 
 
 
@@ -97,11 +106,22 @@ class ProductDetileserializers(serializers.ModelSerializer):
     options = OptionSerializer(many=True, read_only=True)
     color = ColorSerializer(many=True, read_only=True)
     size = SizeSerializer(many=True, read_only=True)
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = '__all__'
 
+    def get_image_variants(self, obj):
+        # {'image_1': {...}, ...} للصور الموجودة التي لها نسخ جاهزة
+        request = self.context.get('request')
+        variants = {}
+        for field in Product.IMAGE_FIELDS:
+            info = image_variants(getattr(obj, field), request)
+            if info is not None:
+                variants[field] = info
+        return variants
+
 class RatingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Rating
@@ -0,0 +1,115 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Category, Color, Option, Product, Rating, Size
+from . import rating_stats
+from .catalog import bump_catalog_version, catalog_changed, sales_changed, schedule_catalog_change
+from .cards import refresh_changed_cards, refresh_sales_counts
+from .search import reindex_changed_products
+from .snapshot import refresh_snapshot, refresh_snapshot_sales
+
+
+def _stored_rating(instance):
+    # نقرأ القيم من القاعدة: الـ instance قد يكون قديمًا (عُدّل التقييم من instance آخر)
+    return Rating.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+
+
+@receiver(pre_save, sender=Rating)
+def rating_saving(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    current = None if instance._state.adding else _stored_rating(instance)
+    instance._stats_snapshot = current or (None, None)
+
+
+@receiver(post_save, sender=Rating)
+def rating_saved(sender, instance, created, **kwargs):
+    if kwargs.get('raw'):
+        return
+
+    old_product_id, old_value = getattr(instance, '_stats_snapshot', (None, None))
+    with transaction.atomic():
+        if created:
+            rating_stats.add_rating(instance.product_id, instance.rating)
+        elif old_product_id is None or old_value is None:
+            # الصف لم يكن في القاعدة (pk محدد يدويًا مثلًا) → نعيد الحساب لهذا المنتج فقط
+            rating_stats.rebuild_rating_stats([instance.product_id])
+        elif old_product_id != instance.product_id:
+            rating_stats.remove_rating(old_product_id, old_value)
+            rating_stats.add_rating(instance.product_id, instance.rating)
+        else:
+            rating_stats.change_rating(instance.product_id, old_value, instance.rating)
+    schedule_catalog_change({old_product_id or instance.product_id, instance.product_id})
+
+
+@receiver(pre_delete, sender=Rating)
+def rating_deleting(sender, instance, **kwargs):
+    current = _stored_rating(instance)
+    if current is not None:
+        instance._stats_snapshot = current
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    old_product_id, old_value = getattr(instance, '_stats_snapshot', (None, None))
+    rating_stats.remove_rating(old_product_id or instance.product_id, old_value or instance.rating)
+    schedule_catalog_change([old_product_id or instance.product_id])
+
+
+# ________________________________________________________________________
+#
+#   تغييرات الكتالوج → البطاقات، فهرس البحث، نسخة الكاش، snapshot (products/catalog.py)
+#   والمبيعات (sales_changed) → البطاقات و snapshot فقط
+# ________________________________________________________________________
+
+
+catalog_changed.connect(refresh_changed_cards, dispatch_uid='products_catalog_cards')
+catalog_changed.connect(reindex_changed_products, dispatch_uid='products_search_reindex')
+catalog_changed.connect(bump_catalog_version, dispatch_uid='products_catalog_version')
+catalog_changed.connect(refresh_snapshot, dispatch_uid='products_catalog_snapshot')
+sales_changed.connect(refresh_sales_counts, dispatch_uid='products_sales_cards')
+sales_changed.connect(refresh_snapshot_sales, dispatch_uid='products_sales_snapshot')
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    schedule_catalog_change([instance.pk])
+
+
+def product_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if not reverse:
+        if action != 'pre_clear':
+            schedule_catalog_change([instance.pk])
+    elif action == 'pre_clear':
+        schedule_catalog_change(instance.products.values_list('pk', flat=True))
+    elif pk_set:
+        schedule_catalog_change(pk_set)
+
+
+for _field in ('categories', 'options', 'color', 'size'):
+    m2m_changed.connect(
+        product_relations_changed,
+        sender=getattr(Product, _field).through,
+        dispatch_uid=f'products_catalog_{_field}',
+    )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Option)
+@receiver(post_save, sender=Color)
+@receiver(post_save, sender=Size)
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Option)
+@receiver(pre_delete, sender=Color)
+@receiver(pre_delete, sender=Size)
+def attribute_changed(sender, instance, **kwargs):
+    # تغيير اسم تصنيف/لون... يغير نص كل المنتجات المرتبطة به
+    if kwargs.get('raw') or kwargs.get('created'):
+        return
+    schedule_catalog_change(instance.products.values_list('pk', flat=True))
@@ -0,0 +1,243 @@
+"""
+قوائم "منتجات مشابهة" محسوبة مسبقًا (ProductNeighbors).
+
+التشابه = Jaccard تقريبي (MinHash) على مجموعة الخصائص (تصنيفات، ألوان، مقاسات، خيارات)
++ قرب السعر. المرشحون يأتون من LSH buckets ثم نافذة سعرية داخل كل bucket حتى يبقى الحساب محدودًا.
+يُشغّل عبر: python manage.py build_similar_products
+"""
+import hashlib
+import math
+import os
+import uuid
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # numpy اختياري: بدونه تبقى صفحة المنتج على الـ query العادي
+    np = None
+
+from .models import Product, ProductNeighbors
+
+
+NEIGHBORS_COUNT = 8
+NUM_PERM = 64
+BANDS = 16  # 16 band × 4 صفوف: منتجان بـ Jaccard 0.5 يلتقيان في bucket باحتمال ~0.65
+PRICE_WINDOW = 40  # كم جار في السعر نأخذ من كل bucket كبير
+PRICE_WEIGHT = 0.25
+MIN_POOL_SIZE = 2000  # أقل من هذا لا يستحق process pool
+SIGNATURE_CHUNK = 5000
+
+_PRIME = (1 << 31) - 1
+
+# بادئة كل نوع خاصية حتى لا يختلط category 3 مع color 3
+ATTRIBUTE_RELATIONS = {
+    'c': 'categories',
+    'k': 'color',
+    's': 'size',
+    'o': 'options',
+}
+
+
+def load_attributes():
+    """
+    {product_id: (set من الخصائص، السعر)} بـ query واحد لكل جدول وسيط
+    """
+    data = {pk: (set(), float(price or 0)) for pk, price in Product.objects.values_list('pk', 'price')}
+    for prefix, relation in ATTRIBUTE_RELATIONS.items():
+        field = Product._meta.get_field(relation)
+        links = field.remote_field.through.objects.values_list('product_id', field.m2m_reverse_name())
+        for product_id, value_id in links.iterator(chunk_size=5000):
+            if product_id in data:
+                data[product_id][0].add(f'{prefix}{value_id}')
+    return data
+
+
+def fingerprint(tokens, price):
+    raw = ','.join(sorted(tokens)) + f'|{price:.2f}'
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def minhash_signatures(token_sets):
+    """
+    مصفوفة (n × NUM_PERM) من uint32. المنتج بدون خصائص يأخذ صفًا من القيمة القصوى.
+    """
+    rng = np.random.default_rng(20240601)  # ثابت: نفس التوقيعات في كل تشغيل وكل process
+    a = rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+    b = rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+    signatures = np.full((len(token_sets), NUM_PERM), np.iinfo(np.uint32).max, dtype=np.uint32)
+    # على دفعات حتى تبقى مصفوفة (NUM_PERM × tokens) صغيرة في الذاكرة
+    for chunk_start in range(0, len(token_sets), SIGNATURE_CHUNK):
+        chunk = token_sets[chunk_start:chunk_start + SIGNATURE_CHUNK]
+        lengths = np.array([len(tokens) for tokens in chunk], dtype=np.int64)
+        if not lengths.sum():
+            continue
+        hashes = np.fromiter(
+            (zlib.crc32(token.encode()) for tokens in chunk for token in tokens),
+            dtype=np.uint64, count=int(lengths.sum()),
+        )
+        permuted = ((a[:, None] * hashes[None, :] + b[:, None]) % _PRIME).astype(np.uint32)
+        filled = np.nonzero(lengths)[0]
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))[filled]
+        signatures[chunk_start + filled] = np.minimum.reduceat(permuted, offsets, axis=1).T
+    return signatures
+
+
+class NeighborIndex:
+    """
+    كل ما يحتاجه الحساب، في مصفوفات numpy فقط (تنتقل للـ workers مرة واحدة)
+    """
+
+    def __init__(self, signatures, prices, empty):
+        self.signatures = signatures
+        self.prices = np.log1p(np.maximum(prices, 0))
+        self.empty = empty
+
+        count = len(signatures)
+        rows = NUM_PERM // BANDS
+        self.order = np.empty((BANDS, count), dtype=np.int64)
+        self.position = np.empty((BANDS, count), dtype=np.int64)
+        self.start = np.empty((BANDS, count), dtype=np.int64)
+        self.end = np.empty((BANDS, count), dtype=np.int64)
+        for band in range(BANDS):
+            chunk = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+            keys = np.unique(chunk.view(np.dtype((np.void, chunk.dtype.itemsize * rows))).ravel(), return_inverse=True)[1]
+            keys = keys.ravel()
+            keys[empty] = keys.max(initial=0) + 1 + np.arange(int(empty.sum()))  # بدون خصائص = bucket لوحده
+            # مرتب حسب bucket ثم السعر: جيران السعر متجاورون داخل كل bucket
+            order = np.lexsort((self.prices, keys))
+            sorted_keys = keys[order]
+            boundaries = np.flatnonzero(np.diff(sorted_keys)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [count]))
+            bucket_of = np.repeat(np.arange(len(starts)), ends - starts)
+
+            self.order[band] = order
+            self.position[band, order] = np.arange(count)
+            self.start[band, order] = starts[bucket_of]
+            self.end[band, order] = ends[bucket_of]
+
+    def candidates(self, index):
+        found = []
+        for band in range(BANDS):
+            position = self.position[band, index]
+            low = max(self.start[band, index], position - PRICE_WINDOW)
+            high = min(self.end[band, index], position + PRICE_WINDOW + 1)
+            found.append(self.order[band, low:high])
+        found = np.unique(np.concatenate(found))
+        return found[(found != index) & ~self.empty[found]]
+
+    def neighbors(self, index, k):
+        if self.empty[index]:
+            return []
+        candidates = self.candidates(index)
+        if not len(candidates):
+            return []
+        jaccard = (self.signatures[candidates] == self.signatures[index]).mean(axis=1)
+        price = np.exp(-np.abs(self.prices[candidates] - self.prices[index]))
+        score = (1 - PRICE_WEIGHT) * jaccard + PRICE_WEIGHT * price
+        keep = jaccard > 0
+        candidates, score = candidates[keep], score[keep]
+        best = np.lexsort((candidates, -score))[:k]
+        return candidates[best].tolist()
+
+
+_worker_index = None
+
+
+def _init_worker(index):
+    global _worker_index
+    _worker_index = index
+
+
+def _compute_chunk(args):
+    targets, k = args
+    return [(target, _worker_index.neighbors(target, k)) for target in targets]
+
+
+def compute_neighbors(index, targets, k=NEIGHBORS_COUNT, workers=None):
+    """
+    {موقع المنتج: [مواقع الجيران]} لكل target، في process pool إذا كان العدد كبيرًا
+    """
+    targets = list(targets)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(targets) < MIN_POOL_SIZE:
+        return {target: index.neighbors(target, k) for target in targets}
+
+    size = math.ceil(len(targets) / (workers * 4))
+    chunks = [(targets[i:i + size], k) for i in range(0, len(targets), size)]
+    result = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(index,)) as pool:
+        for rows in pool.map(_compute_chunk, chunks):
+            result.update(rows)
+    return result
+
+
+def build_index(token_sets, prices):
+    signatures = minhash_signatures(token_sets)
+    empty = np.array([not tokens for tokens in token_sets], dtype=bool)
+    return NeighborIndex(signatures, np.asarray(prices, dtype=np.float64), empty)
+
+
+def build_similar_products(full=False, k=NEIGHBORS_COUNT, workers=None):
+    """
+    يعيد حساب قوائم الجيران للمنتجات التي تغيرت خصائصها أو سعرها (أو الكل مع full)،
+    ولمن قد يتأثر بها: من كانت في قائمته، ومن يشاركها bucket.
+    ترجع عدد القوائم المحسوبة.
+    """
+    data = load_attributes()
+    ids = list(data)
+    if not ids:
+        return 0
+    token_sets = [data[pk][0] for pk in ids]
+    prices = [data[pk][1] for pk in ids]
+    fingerprints = [fingerprint(tokens, price) for tokens, price in zip(token_sets, prices)]
+    position = {pk: i for i, pk in enumerate(ids)}
+
+    index = build_index(token_sets, prices)
+
+    stored = {
+        row[0]: (row[1], row[2])
+        for row in ProductNeighbors.objects.values_list('product_id', 'fingerprint', 'neighbor_ids')
+    }
+    if full:
+        targets = set(range(len(ids)))
+    else:
+        changed = {i for i, pk in enumerate(ids) if stored.get(pk, (None,))[0] != fingerprints[i]}
+        changed_ids = {str(ids[i]) for i in changed}
+        targets = set(changed)
+        for i in changed:
+            targets.update(index.candidates(i).tolist())
+        # من كانت في قائمته منتجات تغيرت أو حُذفت يُعاد حسابه
+        current = {str(pk) for pk in ids}
+        for pk, (_, neighbor_ids) in stored.items():
+            if pk not in position:
+                continue
+            if changed_ids.intersection(neighbor_ids) or not current.issuperset(neighbor_ids):
+                targets.add(position[pk])
+
+    if not targets:
+        return 0
+
+    result = compute_neighbors(index, sorted(targets), k=k, workers=workers)
+    rows = [
+        ProductNeighbors(
+            product_id=ids[i],
+            neighbor_ids=[str(ids[j]) for j in neighbors],
+            fingerprint=fingerprints[i],
+        )
+        for i, neighbors in result.items()
+    ]
+    ProductNeighbors.objects.bulk_create(
+        rows, batch_size=1000,
+        update_conflicts=True, unique_fields=['product'], update_fields=['neighbor_ids', 'fingerprint', 'updated_at'],
+    )
+    return len(rows)
+
+
+def get_similar_ids(product_id, limit=NEIGHBORS_COUNT):
+    ids = ProductNeighbors.objects.filter(product_id=product_id).values_list('neighbor_ids', flat=True).first()
+    if ids is None:
+        return None
+    return [uuid.UUID(pk) for pk in ids[:limit]]
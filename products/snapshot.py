@@ -0,0 +1,401 @@
+"""
+نسخة عمودية (columnar) من الكتالوج في ملفات .npy مفتوحة بـ mmap.
+
+كل workers تبع gunicorn يفتحون نفس الملفات، فنظام التشغيل يحتفظ بنسخة واحدة في الذاكرة.
+ProductShop يستعملها للفلترة + الترتيب + التقسيم لصفحات، ثم يجلب من قاعدة البيانات فقط ids الصفحة.
+
+كل نسخة تحمل watermark قاعدة البيانات (عدد المنتجات + آخر updated_at). إذا اختلف عن القاعدة الحالية
+(bulk_create بدون signals، قاعدة جديدة أو مُفرغة...) أو لم تُبنَ النسخة بعد، ترجع القوائم لـ ORM
+ويُعاد البناء في الخلفية، وليس داخل الطلب.
+"""
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Max
+
+try:
+    import numpy as np
+except ImportError:  # numpy اختياري: بدونه ترجع القوائم لـ ORM
+    np = None
+
+from .models import Product
+
+
+logger = logging.getLogger(__name__)
+
+# بُعد الفلتر في ProductFilter → علاقة M2M في Product
+DIMENSIONS = {
+    'category': 'categories',
+    'option': 'options',
+    'color': 'color',
+    'size': 'size',
+}
+
+SUPPORTED_PARAMS = set(DIMENSIONS) | {'price_min', 'price_max', 'rating'}
+IGNORED_PARAMS = {'page', 'page_size', 'sort', 'pagination', 'format'}
+
+_local = threading.local()
+_building = threading.Lock()
+
+
+def snapshot_root():
+    root = getattr(settings, 'PRODUCT_SNAPSHOT_DIR', None) or os.path.join(settings.BASE_DIR, '.catalog_snapshot')
+    # ملف منفصل لكل قاعدة بيانات
+    name = os.path.basename(str(connection.settings_dict['NAME'])) or 'default'
+    return os.path.join(root, name)
+
+
+def snapshot_enabled():
+    if np is None or not getattr(settings, 'PRODUCT_SNAPSHOT_ENABLED', False):
+        return False
+    # قاعدة بيانات في الذاكرة (الاختبارات) لا معنى لمشاركتها عبر ملف
+    is_in_memory = getattr(connection, 'is_in_memory_db', None)
+    return not (is_in_memory and is_in_memory())
+
+
+@contextmanager
+def build_lock(root):
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, '.lock'), 'w') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _timestamp(value):
+    return int(value.timestamp() * 1_000_000) if value else 0
+
+
+def database_watermark():
+    """
+    (عدد المنتجات، آخر updated_at): query واحد على الفهارس
+    """
+    row = Product.objects.aggregate(count=Count('*'), updated=Max('updated_at'))
+    return np.array([row['count'], _timestamp(row['updated'])], dtype=np.int64)
+
+
+def _load_rows(product_ids=None):
+    products = Product.objects.only(
+        'id', 'price', 'discount', 'sales_count', 'created_at', 'rating_avg', 'rating_count', 'is_active'
+    )
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    rows = {product.pk: product for product in products.iterator(chunk_size=2000)}
+
+    members = {dimension: {} for dimension in DIMENSIONS}
+    for dimension, relation in DIMENSIONS.items():
+        field = Product._meta.get_field(relation)
+        through = field.remote_field.through
+        column = field.m2m_reverse_name()
+        links = through.objects.all()
+        if product_ids is not None:
+            links = links.filter(product_id__in=product_ids)
+        for product_id, value_id in links.values_list('product_id', column).iterator(chunk_size=5000):
+            members[dimension].setdefault(product_id, set()).add(value_id)
+    return rows, members
+
+
+def build_snapshot(only_if_stale=False):
+    """
+    بناء كامل: ملفات جديدة في مجلد جديد، ثم تبديل CURRENT بشكل atomic.
+    only_if_stale: لا شيء إذا بنى process آخر نسخة مطابقة للقاعدة أثناء انتظار القفل
+    """
+    root = snapshot_root()
+    with build_lock(root):
+        # الـ watermark قبل القراءة: أي تغيير أثناء البناء يجعل النسخة قديمة فتُبنى من جديد
+        watermark = database_watermark()
+        name = _read_current(root)
+        if only_if_stale and name is not None:
+            current = CatalogSnapshot(os.path.join(root, name))
+            if current.matches(watermark):
+                return len(current)
+        rows, members = _load_rows()
+        ids = sorted(rows, key=lambda pk: pk.bytes)
+        count = len(ids)
+
+        columns = {
+            'ids': np.array([pk.bytes for pk in ids], dtype='V16'),
+            'price': np.array([float(rows[pk].price or 0) for pk in ids], dtype=np.float64),
+            'discount': np.array(
+                [np.nan if rows[pk].discount is None else float(rows[pk].discount) for pk in ids], dtype=np.float64
+            ),
+            'sales_count': np.array([rows[pk].sales_count for pk in ids], dtype=np.int64),
+            'created_at': np.array([_timestamp(rows[pk].created_at) for pk in ids], dtype=np.int64),
+            'rating_avg': np.array([rows[pk].rating_avg or 0 for pk in ids], dtype=np.float64),
+            'rating_count': np.array([rows[pk].rating_count for pk in ids], dtype=np.int64),
+            'is_active': np.array([rows[pk].is_active for pk in ids], dtype=bool),
+            'deleted': np.zeros(count, dtype=bool),
+            # ids مرتبة بالـ bytes = نفس ترتيب SQLite لعمود uuid (char(32) hex)
+            'id_rank': np.arange(count, dtype=np.int64),
+            'watermark': watermark,
+        }
+
+        position = {pk: index for index, pk in enumerate(ids)}
+        for dimension in DIMENSIONS:
+            values = sorted({v for linked in members[dimension].values() for v in linked})
+            value_index = {value: index for index, value in enumerate(values)}
+            bits = np.zeros((len(values), count), dtype=bool)
+            for product_id, linked in members[dimension].items():
+                if product_id in position:
+                    for value in linked:
+                        bits[value_index[value], position[product_id]] = True
+            columns[f'{dimension}_values'] = np.array(values, dtype=np.int64)
+            columns[f'{dimension}_bits'] = np.packbits(bits, axis=1) if count else np.zeros((len(values), 0), np.uint8)
+
+        name = f'v{int(time.time() * 1000)}'
+        target = os.path.join(root, name)
+        os.makedirs(target)
+        for column, array in columns.items():
+            np.save(os.path.join(target, f'{column}.npy'), array)
+        with open(os.path.join(target, 'meta.json'), 'w') as handle:
+            json.dump({'count': count, 'built_at': time.time()}, handle)
+
+        current = os.path.join(root, 'CURRENT')
+        previous = _read_current(root)
+        with open(current + '.tmp', 'w') as handle:
+            handle.write(name)
+        os.replace(current + '.tmp', current)
+
+        # نحذف النسخ القديمة ما عدا السابقة مباشرة (قد يكون worker آخر ما زال يقرأها)
+        for entry in os.listdir(root):
+            if entry.startswith('v') and entry not in (name, previous):
+                shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+    return count
+
+
+def _read_current(root):
+    try:
+        with open(os.path.join(root, 'CURRENT')) as handle:
+            return handle.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class CatalogSnapshot:
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.columns = {}
+        for filename in os.listdir(path):
+            if filename.endswith('.npy'):
+                self.columns[filename[:-4]] = np.load(os.path.join(path, filename), mmap_mode=mode)
+        self._positions = None
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def __len__(self):
+        return len(self.columns['ids'])
+
+    def matches(self, watermark):
+        return 'watermark' in self.columns and bool((self['watermark'] == watermark).all())
+
+    @property
+    def positions(self):
+        if self._positions is None:
+            self._positions = {uuid.UUID(bytes=bytes(raw)): index for index, raw in enumerate(self['ids'])}
+        return self._positions
+
+    def membership(self, dimension, value_ids):
+        values = self[f'{dimension}_values']
+        rows = np.nonzero(np.isin(values, value_ids))[0]
+        if not len(rows):
+            return np.zeros(len(self), dtype=bool)
+        packed = np.bitwise_or.reduce(self[f'{dimension}_bits'][rows], axis=0)
+        return np.unpackbits(packed, count=len(self)).astype(bool)
+
+    def filter(self, params):
+        mask = ~np.asarray(self['deleted']) & np.asarray(self['is_active'])
+        for dimension in DIMENSIONS:
+            raw = params.get(dimension)
+            if raw:
+                value_ids = [int(v) for v in str(raw).split(',') if v.strip()]
+                mask &= self.membership(dimension, value_ids)
+
+        price = self['price']
+        if params.get('price_min') not in (None, ''):
+            mask &= price >= float(params['price_min'])
+        if params.get('price_max') not in (None, ''):
+            mask &= price <= float(params['price_max'])
+
+        if params.get('rating') not in (None, ''):
+            value = float(params['rating'])
+            average = self['rating_avg']
+            mask &= (self['rating_count'] > 0) & (average >= value) & (average < value + 1)
+        return np.nonzero(mask)[0]
+
+    def sort(self, rows, ordering):
+        """
+        ordering من PRODUCT_SORTS، مثل ('-price', '-id')
+        """
+        keys = []
+        for key in reversed(ordering):  # lexsort: آخر مفتاح هو الأساسي
+            descending = key.startswith('-')
+            name = key.lstrip('-')
+            column = self['id_rank' if name == 'id' else name][rows].astype(np.float64)
+            # NULL (NaN) في الأخير للتنازلي وفي الأول للتصاعدي، مثل sort_ordering
+            column = np.where(np.isnan(column), -np.inf, column)
+            keys.append(-column if descending else column)
+        return rows[np.lexsort(keys)]
+
+    def query(self, params, ordering):
+        rows = self.sort(self.filter(params), ordering)
+        return [uuid.UUID(bytes=bytes(raw)) for raw in self['ids'][rows]]
+
+    def patch_sales(self, product_ids):
+        """
+        عمود sales_count فقط (بعد الطلبات). منتج غير موجود في النسخة يُترك للبناء القادم.
+        """
+        column = self['sales_count']
+        for product_id, sales_count in Product.objects.filter(pk__in=product_ids).values_list('pk', 'sales_count'):
+            index = self.positions.get(product_id)
+            if index is not None:
+                column[index] = sales_count
+        column.flush()
+
+    def patch(self, product_ids):
+        """
+        تحديث في المكان (نفس الملف، يراه كل الـ workers فورًا).
+        ترجع False إذا كان لازم بناء كامل (منتج جديد، قيمة تصنيف جديدة، أو تغيير آخر لم يصل عبر signals).
+        """
+        watermark = database_watermark()
+        rows, members = _load_rows(product_ids)
+        updates = []
+        for product_id in product_ids:
+            index = self.positions.get(product_id)
+            if product_id not in rows:
+                if index is not None:
+                    updates.append((index, None))
+                continue
+            if index is None:
+                return False
+            for dimension in DIMENSIONS:
+                if not members[dimension].get(product_id, set()) <= set(self[f'{dimension}_values'].tolist()):
+                    return False
+            updates.append((index, rows[product_id]))
+
+        deleted = [index for index, product in updates if product is None and not self['deleted'][index]]
+        # كل منتج في القاعدة موجود في النسخة؟ وإلا أُضيف منتج بدون signal (bulk_create...)
+        if watermark[0] != len(self) - int(np.count_nonzero(self['deleted'])) - len(deleted):
+            return False
+
+        for index, product in updates:
+            if product is None:
+                self['deleted'][index] = True
+                continue
+            self['price'][index] = float(product.price or 0)
+            self['discount'][index] = np.nan if product.discount is None else float(product.discount)
+            self['sales_count'][index] = product.sales_count
+            self['rating_avg'][index] = product.rating_avg or 0
+            self['rating_count'][index] = product.rating_count
+            self['is_active'][index] = product.is_active
+            byte, bit = divmod(index, 8)
+            mask = np.uint8(1 << (7 - bit))
+            for dimension in DIMENSIONS:
+                linked = members[dimension].get(product.pk, set())
+                bits = self[f'{dimension}_bits']
+                for row, value in enumerate(self[f'{dimension}_values'].tolist()):
+                    if value in linked:
+                        bits[row, byte] |= mask
+                    else:
+                        bits[row, byte] &= ~mask
+
+        self['watermark'][:] = watermark
+        for array in self.columns.values():
+            array.flush()
+        return True
+
+
+def _build_in_background():
+    try:
+        build_snapshot(only_if_stale=True)
+    except Exception:
+        logger.exception("Catalog snapshot build failed")
+    finally:
+        connection.close()
+        _building.release()
+
+
+def schedule_build():
+    """
+    بناء كامل خارج الطلب: thread واحد على الأكثر لكل process (والقفل على الملف بين الـ processes)
+    """
+    if not getattr(settings, 'PRODUCT_SNAPSHOT_ASYNC', True):
+        build_snapshot(only_if_stale=True)
+        return
+    if _building.acquire(blocking=False):
+        threading.Thread(target=_build_in_background, name='catalog-snapshot', daemon=True).start()
+
+
+def get_snapshot():
+    """
+    النسخة الحالية لهذا الـ process إذا كانت مطابقة لقاعدة البيانات، وإلا None (ويبدأ البناء في الخلفية).
+    تُعاد قراءتها إذا غيّر process آخر CURRENT
+    """
+    if not snapshot_enabled():
+        return None
+    root = snapshot_root()
+    name = _read_current(root)
+    if name is None:
+        schedule_build()
+        return None
+
+    cached = getattr(_local, 'snapshots', {}).get(root)
+    if cached is None or cached[0] != name:
+        try:
+            cached = (name, CatalogSnapshot(os.path.join(root, name)))
+        except FileNotFoundError:
+            return None
+        _local.snapshots = {**getattr(_local, 'snapshots', {}), root: cached}
+    if not cached[1].matches(database_watermark()):
+        schedule_build()
+        return None
+    return cached[1]
+
+
+def refresh_snapshot(sender=None, product_ids=(), **kwargs):
+    """
+    receiver لـ catalog_changed: patch في المكان إن أمكن، وإلا بناء كامل في الخلفية
+    """
+    if not snapshot_enabled():
+        return
+    root = snapshot_root()
+    name = _read_current(root)
+    if name is None:
+        return  # لم تُبنَ بعد؛ أول طلب يبدأ البناء
+    with build_lock(root):
+        if _read_current(root) == name:
+            snapshot = CatalogSnapshot(os.path.join(root, name), mode='r+')
+            if snapshot.patch(list(product_ids)):
+                return
+    schedule_build()
+
+
+def refresh_snapshot_sales(sender=None, product_ids=(), **kwargs):
+    """
+    receiver لـ sales_changed
+    """
+    if not snapshot_enabled():
+        return
+    root = snapshot_root()
+    name = _read_current(root)
+    if name is None:
+        return
+    with build_lock(root):
+        if _read_current(root) == name:
+            CatalogSnapshot(os.path.join(root, name), mode='r+').patch_sales(list(product_ids))
+
+
+def can_answer(params):
+    keys = {key for key, value in params.items() if value not in (None, '')}
+    return not (keys - SUPPORTED_PARAMS - IGNORED_PARAMS)
@@ -1,3 +1,835 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from contextlib import suppress
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Avg, Count, Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image, ImageFile
+from rest_framework_simplejwt.tokens import AccessToken
+
+from orders.models import Cart, CartItem, wishlist, wishlistItem
+from . import feeds, similarity, snapshot
+from .cards import CARD_FIELDS, SHORT_DESCRIPTION_LENGTH, build_card
+from .catalog import catalog_changed, schedule_sales_change
+from .facets import get_facets
+from .filters import ProductFilter
+from .models import Category, Color, Option, Product, ProductCard, Rating, Size
+from .pagination import PRODUCT_SORTS, ProductCursorPagination, sort_ordering
+from .rating_stats import rebuild_rating_stats
+from .search import SALES_HALF, SALES_WEIGHT, SQLiteFTS5Backend
+
+
+def image_upload(name, size=(640, 480)):
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 40, 40)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ImageChangeDetectionTests(TestCase):
+    """
+    حفظ المنتج من الـ admin بدون رفع صورة جديدة لا يفك (decode) أي صورة
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_VARIANTS_ASYNC=False)
+        self.settings_override.enable()
+        admin = get_user_model().objects.create_superuser(
+            email='staff@example.com', username='staff', password='password',
+        )
+        self.client.force_login(admin)
+        self.product = Product.objects.create(
+            name='Chair', price=100, description_1='Wooden chair', image_1=image_upload('chair.jpg'),
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def admin_save(self, **files):
+        data = {
+            'name': self.product.name,
+            'price': '120.00',
+            'discount': '0',
+            'description_1': self.product.description_1,
+            'is_active': 'on',
+            'sales_count': '0',
+            **files,
+        }
+        opened, decoded = [], []
+        real_open, real_load = Image.open, ImageFile.ImageFile.load
+
+        def counting_open(fp, *args, **kwargs):
+            opened.append(getattr(fp, 'name', fp))
+            return real_open(fp, *args, **kwargs)
+
+        def counting_load(image):
+            # tile فارغ = الصورة مفكوكة مسبقًا، load لا يفعل شيئًا
+            if image.tile:
+                # الملف على القرص (التحقق من الرفع في الـ form يكون من الذاكرة)
+                decoded.append(getattr(image, 'filename', '') or '<upload>')
+            return real_load(image)
+
+        with mock.patch('PIL.Image.open', counting_open), \
+                mock.patch.object(ImageFile.ImageFile, 'load', counting_load):
+            response = self.client.post(f'/admin/products/product/{self.product.pk}/change/', data)
+        self.assertEqual(response.status_code, 302)
+        return opened, decoded
+
+    def test_save_without_upload_does_not_decode(self):
+        opened, decoded = self.admin_save()
+        self.assertEqual(opened, [])
+        self.assertEqual(decoded, [])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, 120)
+
+    def test_save_with_new_upload_decodes_only_that_image(self):
+        opened, decoded = self.admin_save(image_2=image_upload('table.jpg'))
+        self.product.refresh_from_db()
+        # الـ form يتحقق من الملف المرفوع في الذاكرة، ثم النسخ تُولد للصورة الجديدة فقط
+        self.assertEqual([name for name in decoded if name != '<upload>'], [self.product.image_2.path])
+        self.assertNotIn(self.product.image_1.path, opened)
+
+    def test_repeated_model_save_does_not_decode(self):
+        product = Product.objects.get(pk=self.product.pk)
+        with mock.patch.object(ImageFile.ImageFile, 'load') as load:
+            product.save()
+            product.save()
+        load.assert_not_called()
+
+
+class ImportProductsTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        Category.objects.create(name='Shoes')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def run_import(self, name, content, *args):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as handle:
+            handle.write(content)
+        call_command('import_products', path, '--skip-images', *args, stdout=StringIO(), stderr=StringIO())
+
+    def test_csv_import_and_sku_upsert(self):
+        self.run_import('products.csv', (
+            'sku,name,price,categories,color\n'
+            'A1,Red shoe,10.50,shoes,Red|Blue\n'
+            'A2,Broken,not-a-price,,\n'
+            ',Without sku,3,Shoes,\n'
+        ))
+        product = Product.objects.get(sku='A1')
+        self.assertEqual(product.price, Decimal('10.50'))
+        self.assertEqual([c.name for c in product.categories.all()], ['Shoes'])
+        self.assertEqual(sorted(c.name for c in product.color.all()), ['Blue', 'Red'])
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertTrue(ProductCard.objects.filter(product=product).exists())
+
+        update = '{"sku": "A1", "price": "12", "color": ["Green"]}\n'
+        self.run_import('update.jsonl', update)
+        self.assertEqual(Product.objects.get(sku='A1').price, Decimal('10.50'))  # بدون --update: يُتجاهل
+
+        self.run_import('update.jsonl', update, '--update')
+        product.refresh_from_db()
+        self.assertEqual((product.name, product.price), ('Red shoe', Decimal('12')))
+        self.assertEqual([c.name for c in product.color.all()], ['Green'])
+        self.assertEqual([c.name for c in product.categories.all()], ['Shoes'])  # العمود غير موجود: لا يتغير
+        self.assertEqual(ProductCard.objects.get(product=product).price, Decimal('12'))
+
+
+@override_settings(MINE_DOMINE='https://shop.example.com/', PRODUCT_FEED_CURRENCY='MAD')
+class ProductFeedTests(TestCase):
+    def setUp(self):
+        shoes = Category.objects.create(name='Shoes')
+        red = Color.objects.create(name='Red', code='#f00')
+        for i in range(3):
+            product = Product.objects.create(
+                name=f'Shoe {i} & co', sku=f'S{i}', price=80, old_price=100 if i == 0 else None,
+                description_1='Leather', image_1=f'products/shoe{i}.jpg', image_2='products/side.jpg',
+            )
+            product.categories.add(shoes)
+            product.color.add(red)
+        Product.objects.create(name='Hidden', price=1, description_1='-', image_1='products/x.jpg', is_active=False)
+        shutil.rmtree(settings.PRODUCT_FEED_DIR, ignore_errors=True)
+
+    def get_feed(self, fmt):
+        response = self.client.get(f'/products/feed.{fmt}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_xml_feed(self):
+        # عدد الـ queries ثابت: الأسماء (3) + المنتجات + الجداول الوسيطة (3) لكل chunk
+        with self.assertNumQueries(7):
+            root = ElementTree.fromstring(self.get_feed('xml'))
+        g = '{http://base.google.com/ns/1.0}'
+        items = root.findall('channel/item')
+        self.assertEqual([item.findtext(g + 'mpn') for item in items], ['S0', 'S1', 'S2'])
+        first = items[0]
+        self.assertEqual(first.findtext('title'), 'Shoe 0 & co')
+        self.assertEqual(first.findtext(g + 'price'), '100.00 MAD')
+        self.assertEqual(first.findtext(g + 'sale_price'), '80.00 MAD')
+        self.assertEqual(first.findtext(g + 'image_link'), 'https://shop.example.com/media/products/shoe0.jpg')
+        self.assertEqual(first.findtext(g + 'additional_image_link'), 'https://shop.example.com/media/products/side.jpg')
+        self.assertTrue(first.findtext('link').startswith('https://shop.example.com/product-details/'))
+        self.assertEqual(first.findtext(g + 'product_type'), 'Shoes')
+        self.assertIsNone(items[1].find(g + 'sale_price'))
+
+    def test_csv_and_jsonl_feeds(self):
+        rows = list(csv.DictReader(StringIO(self.get_feed('csv'))))
+        self.assertEqual([row['sku'] for row in rows], ['S0', 'S1', 'S2'])
+        self.assertEqual((rows[1]['price'], rows[1]['color']), ('80.00 MAD', 'Red'))
+        lines = [json.loads(line) for line in self.get_feed('jsonl').splitlines()]
+        self.assertEqual(lines[0]['product_type'], ['Shoes'])
+        self.assertEqual(self.client.get('/products/feed.pdf').status_code, 404)
+
+    def test_keyset_chunks_visit_each_product_once(self):
+        # نفس created_at لعدة منتجات: الـ keyset يعتمد على id بعدها
+        Product.objects.update(created_at=Product.objects.earliest('created_at').created_at)
+        for i in range(3, 8):
+            Product.objects.create(name=f'Shoe {i}', sku=f'S{i}', price=80, description_1='-', image_1='')
+        expected = list(Product.objects.filter(is_active=True).order_by('created_at', 'id').values_list('pk', flat=True))
+        for chunk_size in (1, 2, 3, 8, 500):
+            self.assertEqual([product.pk for product, _ in feeds.feed_products(chunk_size)], expected, chunk_size)
+
+    @override_settings(PRODUCT_FEED_MAX_AGE=60)
+    def test_feed_is_served_from_a_generated_file(self):
+        self.assertIn('S2', self.get_feed('csv'))
+        Product.objects.filter(sku='S2').update(sku='S2-new')
+        # الملف ما زال حديثًا: لا query واحد
+        with self.assertNumQueries(0):
+            self.assertNotIn('S2-new', self.get_feed('csv'))
+
+        path = feeds.feed_path('csv')
+        os.utime(path, (time.time() - 120,) * 2)
+        self.assertIn('S2-new', self.get_feed('csv'))
+
+        Product.objects.filter(sku='S2-new').update(sku='S2-cron')
+        call_command('export_products_feed', '--format', 'csv', stderr=StringIO())
+        self.assertIn('S2-cron', self.get_feed('csv'))
+
+
+class ProductCursorPaginationTests(TestCase):
+    def setUp(self):
+        self.categories = [Category.objects.create(name=name) for name in ('Chairs', 'Tables')]
+        self.colors = [Color.objects.create(name=name, code='#000') for name in ('Red', 'Blue')]
+        for i in range(23):
+            product = Product.objects.create(
+                name=f'Item {i}', description_1='-', image_1='',
+                price=[10, 25, 25, 40][i % 4],
+                discount=None if i % 3 == 0 else [0, 5][i % 2],  # NULL ومكررات
+                sales_count=i % 2,
+                rating_avg=[0, 3.5, 3.5][i % 3],
+                is_active=i != 7,
+            )
+            # بعض المنتجات في تصنيفين: JOIN يكرر الصفوف لولا distinct
+            product.categories.add(*self.categories[:1 + (i % 4 == 0)] if i % 2 else self.categories[1:])
+            product.color.add(*self.colors[:1 + i % 3 // 2])
+        Product.objects.filter(sales_count=1).update(created_at=Product.objects.earliest('created_at').created_at)
+
+    def expected(self, params, sort):
+        queryset = ProductFilter(params, queryset=Product.objects.filter(is_active=True)).qs
+        return [str(pk) for pk in queryset.order_by(*sort_ordering(sort)).values_list('pk', flat=True)]
+
+    def walk(self, params):
+        """
+        كل الصفحات باتباع رابط next فقط
+        """
+        ids = []
+        response = self.client.get('/products/products-list/shop/', {**params, 'pagination': 'cursor', 'page_size': 3})
+        while True:
+            self.assertEqual(response.status_code, 200, params)
+            data = response.json()
+            ids += [row['id'] for row in data['results']]
+            if not data['next']:
+                return ids
+            self.assertNotIn('include_count', data['next'])
+            response = self.client.get(data['next'])
+
+    def test_every_sort_visits_each_product_once(self):
+        chairs, tables = self.categories
+        # ترتيب تصاعدي على حقل يقبل null: NULLS FIRST
+        with mock.patch.dict(PRODUCT_SORTS, {'discount_asc': ('discount', 'id')}):
+            for params in (
+                {},
+                {'category': f'{chairs.pk},{tables.pk}'},
+                {'category': str(chairs.pk), 'color': f'{self.colors[0].pk},{self.colors[1].pk}'},
+                {'color': str(self.colors[1].pk), 'price_min': '20'},
+            ):
+                for sort in PRODUCT_SORTS:
+                    ids = self.walk({**params, 'sort': sort})
+                    self.assertEqual(len(ids), len(set(ids)), (params, sort))
+                    self.assertEqual(ids, self.expected(params, sort), (params, sort))
+
+    def test_cursor_and_count(self):
+        params = {'pagination': 'cursor', 'sort': 'discount', 'page_size': 5, 'include_count': 'true'}
+        data = self.client.get('/products/products-list/shop/', params).json()
+        self.assertEqual(data['count'], Product.objects.filter(is_active=True).count())
+        self.assertEqual(data['sort'], 'discount')
+        self.assertEqual(len(data['results']), 5)
+
+        # الـ cursor يحمل آخر (قيمة، id) والترتيب
+        paginator = ProductCursorPagination()
+        paginator.sort, paginator.fields = 'discount', ['discount', 'id']
+        for product in Product.objects.filter(pk__in=[row['id'] for row in data['results']]):
+            cursor = paginator.encode_cursor(product)
+            self.assertNotIn('=', cursor)
+            self.assertEqual(paginator.decode_cursor(cursor), (product.discount, product.pk))
+
+        cursor = paginator.encode_cursor(Product.objects.first())
+        without_count = self.client.get('/products/products-list/shop/', {'sort': 'discount', 'cursor': cursor}).json()
+        self.assertNotIn('count', without_count)
+        # cursor من ترتيب آخر أو معطوب: 404 وليس 500
+        for bad in (cursor, 'not-a-cursor', cursor[:-4]):
+            response = self.client.get('/products/products-list/shop/', {'sort': 'price_asc', 'cursor': bad})
+            self.assertEqual(response.status_code, 404, bad)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "FTS5 is SQLite only")
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.backend = SQLiteFTS5Backend()
+        lamps = Category.objects.create(name='Lighting')
+        # الـ index يتحدث بعد الـ commit (catalog_changed)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.desk = self.create('Desk lamp', 'Adjustable arm', lamps)
+            self.floor = self.create('Floor lamp', 'Adjustable arm', lamps)
+            self.shade = self.create('Linen shade', 'Fits any lamp base', lamps)
+            self.table = self.create('Oak table', 'Solid wood')
+
+    def create(self, name, description, *categories):
+        product = Product.objects.create(name=name, price=10, description_1=description, image_1='')
+        product.categories.add(*categories)
+        return product
+
+    def search(self, query):
+        return list(self.backend.search(Product.objects.all(), query))
+
+    def test_bm25_blended_with_sales(self):
+        results = self.search('lamp')
+        self.assertEqual(set(results), {self.desk, self.floor, self.shade})
+        # الاسم وزنه أكبر من الوصف
+        self.assertEqual(results[-1], self.shade)
+
+        Product.objects.filter(pk=self.floor.pk).update(sales_count=60)
+        results = self.search('lamp')
+        self.assertEqual(results[:2], [self.floor, self.desk])
+        desk, floor = results[1], results[0]
+        # نفس النص: الفرق في الـ score هو وزن المبيعات فقط
+        self.assertAlmostEqual(floor.search_score - desk.search_score, SALES_WEIGHT * 60 / (60 + SALES_HALF))
+
+        Product.objects.filter(pk=self.desk.pk).update(sales_count=200)
+        self.assertEqual(self.search('lamp')[:2], [self.desk, self.floor])
+
+    def test_search_keeps_relevance_order_with_cursor(self):
+        Product.objects.filter(pk=self.floor.pk).update(sales_count=60)
+        expected = [str(product.pk) for product in self.search('lamp')]
+        data = self.client.get('/products/products-list/shop/', {'name': 'lamp', 'pagination': 'cursor'}).json()
+        # ترتيب الصلة لا يمكن تقسيمه بـ keyset: page-number بنفس ترتيب البحث
+        self.assertEqual([row['id'] for row in data['results']], expected)
+        self.assertEqual(data['count'], 3)
+
+    def test_typo_is_corrected_with_trigrams(self):
+        self.assertEqual(self.backend.correct('lampe'), 'lamp')
+        self.assertEqual(set(self.search('lampe')), {self.desk, self.floor, self.shade})
+        self.assertEqual(self.search('tabel oak'), [self.table])
+        self.assertEqual(self.search('xyzzy'), [])
+        # نفس البحث عبر API (فلتر name في ProductFilter)
+        data = self.client.get('/products/products-list/shop/', {'name': 'adjustabel', 'page_size': 10}).json()
+        self.assertEqual({row['id'] for row in data['results']}, {str(self.desk.pk), str(self.floor.pk)})
+
+    def test_index_follows_product_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.table.name = 'Walnut desk'
+            self.table.save()
+        self.assertEqual(self.search('walnut'), [self.table])
+        self.assertEqual(self.search('oak'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.desk.categories.add(Category.objects.create(name='Office'))
+        self.assertEqual(self.search('office'), [self.desk])
+
+        pk = self.floor.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.floor.delete()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM products_search WHERE product_id = %s", [pk.hex])
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+        # rebuild من الصفر يعطي نفس النتائج
+        self.backend.rebuild()
+        self.assertEqual(set(self.search('lamp')), {self.desk, self.shade})
+        self.assertEqual(self.search('walnut'), [self.table])
+
+
+class RatingStatsTests(TestCase):
+    def setUp(self):
+        self.chair = Product.objects.create(name='Chair', price=10, description_1='-', image_1='')
+        self.table = Product.objects.create(name='Table', price=20, description_1='-', image_1='')
+
+    def rate(self, product, value, name='Sara'):
+        return Rating.objects.create(product=product, name=name, rating=value)
+
+    def assert_in_sync(self):
+        for product in (self.chair, self.table):
+            product.refresh_from_db()
+            ratings = Rating.objects.filter(product=product)
+            fresh = ratings.aggregate(count=Count('id'), total=Sum('rating'), avg=Avg('rating'))
+            self.assertEqual((product.rating_count, product.rating_sum), (fresh['count'], fresh['total'] or 0))
+            self.assertAlmostEqual(product.rating_avg, fresh['avg'] or 0)
+            for star in range(1, 6):
+                self.assertEqual(getattr(product, f'rating_{star}_count'), ratings.filter(rating=star).count())
+        self.assertEqual(rebuild_rating_stats(fix=False), [])
+
+    def test_incremental_updates_match_aggregate(self):
+        first = self.rate(self.chair, 5)
+        second = self.rate(self.chair, 2)
+        self.rate(self.table, 4)
+        self.assert_in_sync()
+
+        first.rating = 3
+        first.save()
+        self.assert_in_sync()
+
+        # نقل التقييم لمنتج آخر
+        second.product = self.table
+        second.save()
+        self.assert_in_sync()
+
+        # القيمة القديمة غير محملة (deferred): تُقرأ من القاعدة قبل الحفظ
+        deferred = Rating.objects.only('id').get(pk=first.pk)
+        deferred.rating = 1
+        deferred.save()
+        self.assert_in_sync()
+
+        first.delete()
+        self.assert_in_sync()
+        Rating.objects.filter(product=self.table).delete()
+        self.assert_in_sync()
+        self.assertEqual((self.table.rating_count, self.table.rating_avg), (0, 0))
+
+    def test_stale_instance_save_uses_stored_value(self):
+        rating = self.rate(self.chair, 5)
+        stale = Rating.objects.get(pk=rating.pk)
+        rating.rating = 3
+        rating.save()
+        # الـ instance الثاني حُمّل والتقييم 5: الفرق يُحسب من 3 (القيمة في القاعدة) وليس من 5
+        stale.rating = 1
+        stale.save()
+        self.assert_in_sync()
+
+    def test_rebuild_command_repairs_drift(self):
+        for value in (5, 4, 4):
+            self.rate(self.chair, value)
+        Product.objects.filter(pk=self.chair.pk).update(rating_count=7, rating_avg=1.5, rating_4_count=0)
+        Product.objects.filter(pk=self.table.pk).update(rating_sum=9)
+
+        out = StringIO()
+        call_command('rebuild_rating_stats', '--verify', stdout=out)
+        self.assertIn('2 product(s) out of sync', out.getvalue())
+        self.assertEqual(Product.objects.get(pk=self.chair.pk).rating_count, 7)
+
+        out = StringIO()
+        call_command('rebuild_rating_stats', '--product', str(self.table.pk), stdout=out)
+        self.assertIn('Repaired 1 product(s)', out.getvalue())
+        self.assertEqual(Product.objects.get(pk=self.chair.pk).rating_count, 7)
+
+        call_command('rebuild_rating_stats', stdout=StringIO())
+        self.assert_in_sync()
+        out = StringIO()
+        call_command('rebuild_rating_stats', stdout=out)
+        self.assertIn('in sync', out.getvalue())
+
+
+class ProductCardTests(TestCase):
+    def setUp(self):
+        self.chairs = Category.objects.create(name='Chairs')
+        self.outdoor = Category.objects.create(name='Outdoor')
+        self.wood = Option.objects.create(name='Wood')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = Product.objects.create(
+                name='Chair', price=100, description_1='A' * 400, image_1='',
+            )
+            self.product.categories.add(self.chairs)
+
+    def change(self):
+        # البطاقة تتحدث بعد الـ commit (catalog_changed)
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def assert_card_matches(self):
+        card = ProductCard.objects.get(pk=self.product.pk)
+        product = Product.objects.prefetch_related('categories', 'options').get(pk=self.product.pk)
+        expected = build_card(product)
+        for field in CARD_FIELDS:
+            self.assertEqual(getattr(card, field), getattr(expected, field), field)
+        self.assertEqual([c['name'] for c in card.categories], [c.name for c in product.categories.all()])
+        self.assertEqual((card.rating_count, card.rating_sum), (product.rating_count, product.rating_sum))
+        return card
+
+    def test_card_follows_product_relations_and_ratings(self):
+        card = self.assert_card_matches()
+        self.assertEqual(len(card.short_description), SHORT_DESCRIPTION_LENGTH)
+
+        with self.change():
+            self.product.price = 80
+            self.product.old_price = 100
+            self.product.save()
+        self.assertEqual(self.assert_card_matches().price, Decimal('80'))
+
+        with self.change():
+            self.product.categories.add(self.outdoor)
+            self.product.options.set([self.wood])
+        self.assertEqual(len(self.assert_card_matches().options), 1)
+
+        # من الجهة الأخرى للعلاقة، وتغيير اسم التصنيف
+        with self.change():
+            self.chairs.products.remove(self.product)
+            self.outdoor.name = 'Garden'
+            self.outdoor.save()
+        self.assertEqual(self.assert_card_matches().categories[0]['name'], 'Garden')
+        with self.change():
+            self.wood.delete()
+        self.assertEqual(self.assert_card_matches().options, [])
+
+        with self.change():
+            rating = Rating.objects.create(product=self.product, name='Sara', rating=4)
+            Rating.objects.create(product=self.product, name='Omar', rating=2)
+        self.assertEqual(self.assert_card_matches().average_rating(), 3)
+        with self.change():
+            rating.delete()
+        self.assertEqual(self.assert_card_matches().rating_count, 1)
+
+        with self.change():
+            self.product.delete()
+        self.assertFalse(ProductCard.objects.exists())
+
+
+@override_settings(PRODUCT_SNAPSHOT_ENABLED=False)
+class ProductFlagsTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products = [
+                Product.objects.create(name=f'Stool {i}', price=10 + i, description_1='-', image_1='') for i in range(6)
+            ]
+        self.user = get_user_model().objects.create_user(email='flags@example.com', username='flags')
+        favorites = wishlist.objects.create(user=self.user)
+        cart = Cart.objects.create(user=self.user)
+        for product in self.products[:2]:
+            wishlistItem.objects.create(wishlist=favorites, product=product)
+        CartItem.objects.create(cart=cart, product=self.products[1], quantity=1)
+        CartItem.objects.create(cart=cart, product=self.products[2], quantity=1, is_ordered=True)
+
+    def shop(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/products/products-list/shop/', {'page_size': 10}).json()
+        flags = {row['id']: (row['in_favorites'], row['in_cart']) for row in data['results']}
+        tables = [query['sql'] for query in queries if 'orders_wishlistitem' in query['sql'] or 'orders_cartitem' in query['sql']]
+        return flags, tables
+
+    def test_flags_for_authenticated_user(self):
+        self.client.cookies['access_token'] = str(AccessToken.for_user(self.user))
+        flags, flag_queries = self.shop()
+        p = [str(product.pk) for product in self.products]
+        self.assertEqual(flags[p[0]], (True, False))
+        self.assertEqual(flags[p[1]], (True, True))
+        # المطلوب سابقًا (is_ordered) ليس في السلة
+        self.assertEqual(flags[p[2]], (False, False))
+        self.assertEqual(flags[p[3]], (False, False))
+        # query واحد للمفضلة وواحد للسلة مهما كان عدد البطاقات
+        self.assertEqual(len(flag_queries), 2)
+
+    def test_anonymous_user_has_no_flags_and_no_queries(self):
+        flags, flag_queries = self.shop()
+        self.assertEqual(len(flags), len(self.products))
+        self.assertEqual(set(flags.values()), {(False, False)})
+        self.assertEqual(flag_queries, [])
+
+
+@unittest.skipIf(similarity.np is None, "numpy is not installed")
+class SimilarProductsTests(TestCase):
+    def setUp(self):
+        chairs, tables = Category.objects.create(name='Chairs'), Category.objects.create(name='Tables')
+        red, blue = Color.objects.create(name='Red', code='#f00'), Color.objects.create(name='Blue', code='#00f')
+        self.chairs = self.create(chairs, red, prices=(100, 110, 130, 400))
+        self.tables = self.create(tables, blue, prices=(300, 320))
+        self.plain = Product.objects.create(name='Plain', price=100, description_1='-', image_1='')
+
+    def create(self, category, color, prices):
+        products = []
+        for price in prices:
+            product = Product.objects.create(name=f'{category} {price}', price=price, description_1='-', image_1='')
+            product.categories.add(category)
+            product.color.add(color)
+            products.append(product)
+        return products
+
+    def similar(self, product):
+        return similarity.get_similar_ids(product.pk)
+
+    def test_neighbors_share_attributes_and_are_ordered_by_price(self):
+        self.assertIsNone(self.similar(self.chairs[0]))
+        self.assertEqual(similarity.build_similar_products(workers=1), 7)
+
+        # نفس الخصائص (Jaccard = 1): الأقرب في السعر أولًا، ولا شيء بدون خاصية مشتركة
+        self.assertEqual(self.similar(self.chairs[0]), [p.pk for p in self.chairs[1:]])
+        self.assertEqual(self.similar(self.chairs[3]), [p.pk for p in reversed(self.chairs[:3])])
+        self.assertEqual(self.similar(self.tables[0]), [self.tables[1].pk])
+        self.assertEqual(self.similar(self.plain), [])
+        self.assertEqual(similarity.get_similar_ids(self.chairs[0].pk, limit=1), [self.chairs[1].pk])
+
+    def test_incremental_build_only_recomputes_affected_products(self):
+        similarity.build_similar_products(workers=1)
+        self.assertEqual(similarity.build_similar_products(workers=1), 0)
+
+        moved = self.tables[1]
+        moved.categories.set(self.chairs[0].categories.all())
+        moved.color.set(self.chairs[0].color.all())
+        Product.objects.filter(pk=moved.pk).update(price=105)
+        self.chairs[3].delete()
+
+        recomputed = similarity.build_similar_products(workers=1)
+        self.assertLess(recomputed, 6)
+        self.assertEqual(self.similar(self.chairs[0]), [moved.pk, self.chairs[1].pk, self.chairs[2].pk])
+        self.assertEqual(self.similar(self.tables[0]), [])
+        self.assertNotIn(self.chairs[3].pk, self.similar(self.chairs[2]))
+
+    def test_process_pool_gives_same_neighbors(self):
+        data = similarity.load_attributes()
+        token_sets = [tokens for tokens, _ in data.values()]
+        index = similarity.build_index(token_sets, [price for _, price in data.values()])
+        targets = range(len(token_sets))
+        expected = similarity.compute_neighbors(index, targets, workers=1)
+        with mock.patch.object(similarity, 'MIN_POOL_SIZE', 0):
+            self.assertEqual(similarity.compute_neighbors(index, targets, workers=2), expected)
+
+
+class CatalogChangeTests(TestCase):
+    def setUp(self):
+        self.sent = []
+        catalog_changed.connect(self.receiver)
+        self.addCleanup(catalog_changed.disconnect, self.receiver)
+
+    def receiver(self, sender, product_ids, **kwargs):
+        self.sent.append(set(product_ids))
+
+    def create_product(self, name):
+        product = Product.objects.create(name=name, price=10, description_1='-', image_1='')
+        product.categories.add(Category.objects.create(name=f'{name} category'))
+        product.color.add(Color.objects.create(name='Red', code='#f00'))
+        return product
+
+    def test_changes_in_one_transaction_are_sent_once(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks, transaction.atomic():
+            first = self.create_product('Chair')
+            second = self.create_product('Table')
+            first.price = 12
+            first.save()
+        self.assertGreater(len(callbacks), 1)
+        self.assertEqual(len(self.sent), 1)
+        self.assertLessEqual({first.pk, second.pk}, self.sent[0])
+        self.assertEqual(ProductCard.objects.filter(pk__in=[first.pk, second.pk]).count(), 2)
+
+    def test_rolled_back_changes_are_not_sent(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with suppress(RuntimeError), transaction.atomic():
+                rolled_back = self.create_product('Chair')
+                raise RuntimeError
+        self.assertEqual(self.sent, [])
+
+        # الـ commit التالي يرسل تغييراته كالعادة؛ المنتج الملغى لا أثر له
+        with self.captureOnCommitCallbacks(execute=True):
+            product = self.create_product('Table')
+        self.assertEqual(len(self.sent), 1)
+        self.assertIn(product.pk, self.sent[0])
+        self.assertNotIn(rolled_back.pk, self.sent[0])
+        self.assertTrue(ProductCard.objects.filter(pk=product.pk).exists())
+        self.assertFalse(ProductCard.objects.filter(pk=rolled_back.pk).exists())
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.categories = [Category.objects.create(name=name) for name in ('Chairs', 'Tables', 'Lamps')]
+        self.colors = [Color.objects.create(name=name, code='#000') for name in ('Red', 'Blue')]
+        self.sizes = [Size.objects.create(name=name) for name in ('S', 'L')]
+        self.options = [Option.objects.create(name='Wood')]
+        for i in range(24):
+            product = Product.objects.create(
+                name=f'Item {i}', price=40 * i, description_1='-', image_1='',
+                rating_count=i % 3, rating_sum=(i % 3) * (1 + i % 5), rating_avg=1 + i % 5 if i % 3 else 0,
+            )
+            # بعض المنتجات في تصنيفين: العدد distinct وليس عدد الصفوف في الجدول الوسيط
+            product.categories.add(*self.categories[i % 3:i % 3 + 1 + (i % 4 == 0)])
+            product.color.add(self.colors[i % 2])
+            if i % 5:
+                product.size.add(self.sizes[i % 2])
+            if i % 2:
+                product.options.add(*self.options)
+        hidden = Product.objects.create(name='Hidden', price=50, description_1='-', image_1='', is_active=False)
+        hidden.categories.add(*self.categories)
+        self.active = Product.objects.filter(is_active=True)
+
+    def count(self, params):
+        return ProductFilter(params, queryset=self.active).qs.order_by().values('pk').distinct().count()
+
+    def assert_matches_orm(self, params):
+        facets = get_facets(params)
+        self.assertEqual(facets['total'], self.count(params))
+        for facet in ('category', 'color', 'size', 'option'):
+            for entry in facets[facet]:
+                expected = self.count({**params, facet: str(entry['id'])})
+                self.assertEqual(entry['count'], expected, (facet, entry['name'], params))
+        for entry in facets['rating']:
+            self.assertEqual(entry['count'], self.count({**params, 'rating': entry['rating']}), params)
+        without_price = {k: v for k, v in params.items() if k not in ('price_min', 'price_max')}
+        for entry in facets['price']:
+            matched = ProductFilter(without_price, queryset=self.active).qs.filter(price__gte=entry['min'])
+            if entry['max'] is not None:
+                matched = matched.filter(price__lt=entry['max'])
+            self.assertEqual(entry['count'], matched.order_by().values('pk').distinct().count(), params)
+
+    def test_counts_match_orm_for_combined_filters(self):
+        chairs, tables, _ = self.categories
+        for params in (
+            {},
+            {'category': f'{chairs.pk},{tables.pk}'},
+            {'category': str(chairs.pk), 'color': str(self.colors[0].pk), 'price_min': '100'},
+            {'size': str(self.sizes[1].pk), 'option': str(self.options[0].pk), 'rating': '3'},
+            {'color': f'{self.colors[1].pk}', 'price_min': '80', 'price_max': '600', 'rating': '2'},
+        ):
+            self.assert_matches_orm(params)
+
+    def test_cache_is_invalidated_by_catalog_changed(self):
+        params = {'category': str(self.categories[0].pk)}
+        total = get_facets(params)['total']
+        with self.assertNumQueries(0):
+            self.assertEqual(get_facets({'category': str(self.categories[0].pk)})['total'], total)
+
+        product = Product.objects.create(name='New chair', price=10, description_1='-', image_1='')
+        product.categories.add(self.categories[0])
+        self.assertEqual(get_facets(params)['total'], total)  # الـ commit لم يحدث بعد: النسخة القديمة
+        catalog_changed.send(sender=None, product_ids={product.pk})
+        self.assertEqual(get_facets(params)['total'], total + 1)
+
+
+@unittest.skipIf(snapshot.np is None, "numpy is not installed")
+@override_settings(PRODUCT_SNAPSHOT_ENABLED=True, PRODUCT_SNAPSHOT_ASYNC=False)
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        shutil.rmtree(snapshot.snapshot_root(), ignore_errors=True)
+        self.categories = [Category.objects.create(name=name) for name in ('Chairs', 'Tables', 'Lamps')]
+        self.colors = [Color.objects.create(name=name, code='#000') for name in ('Red', 'Blue')]
+        self.sizes = [Size.objects.create(name='M')]
+        for i in range(30):
+            product = Product.objects.create(
+                name=f'Item {i}', description_1='-', image_1='',
+                price=[10, 25, 25, 40, 99][i % 5],  # أسعار مكررة: الترتيب يعتمد على id
+                discount=None if i % 4 == 0 else [0, 5, 5][i % 3],
+                sales_count=i % 3,
+                rating_count=i % 2, rating_sum=(i % 2) * (1 + i % 5), rating_avg=(1 + i % 5) if i % 2 else 0,
+                is_active=i % 7 != 3,
+            )
+            product.categories.add(*self.categories[i % 3:i % 3 + 1 + (i % 5 == 0)])
+            product.color.add(self.colors[i % 2])
+            if i % 3 == 0:
+                product.size.add(*self.sizes)
+        # نفس created_at لعدة منتجات (قبل البناء: update لا يغير updated_at)
+        Product.objects.filter(sales_count=1).update(created_at=Product.objects.earliest('created_at').created_at)
+        snapshot.build_snapshot()
+
+    def list_ids(self, params, use_snapshot, from_snapshot=None):
+        """
+        كل الصفحات (page_size=4)، مع التأكد أن الإجابة جاءت فعلًا من الـ snapshot أو من ORM
+        """
+        ids, page = [], 1
+        with override_settings(PRODUCT_SNAPSHOT_ENABLED=use_snapshot), \
+                mock.patch.object(snapshot.CatalogSnapshot, 'query', autospec=True,
+                                  side_effect=snapshot.CatalogSnapshot.query) as query:
+            while True:
+                data = self.client.get('/products/products-list/shop/', {**params, 'page': page, 'page_size': 4}).json()
+                ids += [row['id'] for row in data['results']]
+                if not data['next']:
+                    break
+                page += 1
+        self.assertEqual(query.called, use_snapshot if from_snapshot is None else from_snapshot)
+        self.assertEqual(len(ids), data['count'])
+        return ids
+
+    def test_snapshot_matches_orm(self):
+        chairs, tables, _ = self.categories
+        for params in (
+            {},
+            {'category': f'{chairs.pk},{tables.pk}'},
+            {'category': str(chairs.pk), 'color': str(self.colors[1].pk)},
+            {'size': str(self.sizes[0].pk), 'price_min': '20', 'price_max': '50'},
+            {'rating': '3'},
+        ):
+            for sort in PRODUCT_SORTS:
+                params = {**params, 'sort': sort}
+                expected = self.list_ids(params, False)
+                self.assertTrue(expected, params)
+                self.assertEqual(self.list_ids(params, True), expected, params)
+        hidden = set(map(str, Product.objects.filter(is_active=False).values_list('pk', flat=True)))
+        self.assertFalse(hidden & set(self.list_ids({}, True)))
+
+    def test_stale_snapshot_falls_back_to_orm(self):
+        self.assertIsNotNone(snapshot.get_snapshot())
+        new = Product.objects.bulk_create([Product(name='Bulk', price=1, description_1='-', image_1='')])[0]
+        with mock.patch('products.snapshot.schedule_build') as schedule:
+            self.assertIsNone(snapshot.get_snapshot())
+            schedule.assert_called_once_with()
+            self.assertEqual(self.list_ids({'sort': 'price_asc'}, True, from_snapshot=False)[0], str(new.pk))
+        snapshot.schedule_build()
+        self.assertEqual(self.list_ids({'sort': 'price_asc'}, True)[0], str(new.pk))
+
+    def test_admin_changes_patch_in_place(self):
+        product = Product.objects.filter(is_active=True).order_by('price').first()
+        with mock.patch('products.snapshot.schedule_build') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.price = 1000
+                product.save()
+            with self.captureOnCommitCallbacks(execute=True):
+                Product.objects.filter(is_active=False).first().delete()
+        schedule.assert_not_called()
+        self.assertEqual(self.list_ids({'sort': 'price_desc'}, True)[0], str(product.pk))
+
+    def test_sales_change_patches_only_the_sales_column(self):
+        product = Product.objects.filter(is_active=True).order_by('sales_count', 'id').first()
+        with mock.patch('products.snapshot.schedule_build') as schedule, \
+                mock.patch.object(catalog_changed, 'send') as changed:
+            with self.captureOnCommitCallbacks(execute=True):
+                Product.objects.filter(pk=product.pk).update(sales_count=500)
+                schedule_sales_change([product.pk])
+        schedule.assert_not_called()
+        changed.assert_not_called()
+        self.assertEqual(self.list_ids({'sort': 'bestseller'}, True)[0], str(product.pk))
+
+    @override_settings(PRODUCT_SNAPSHOT_ASYNC=True)
+    def test_missing_snapshot_is_built_outside_the_request(self):
+        shutil.rmtree(snapshot.snapshot_root())
+        with mock.patch.object(snapshot.threading, 'Thread') as thread, \
+                mock.patch('products.snapshot.build_snapshot') as build:
+            ids = self.list_ids({}, True, from_snapshot=False)
+        snapshot._building.release()
+        self.assertEqual(len(ids), Product.objects.filter(is_active=True).count())
+        build.assert_not_called()
+        # thread واحد لكل process مهما كان عدد الطلبات أثناء البناء
+        thread.assert_called_once()
+        self.assertEqual(thread.call_args.kwargs['target'], snapshot._build_in_background)
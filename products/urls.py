@@ -3,8 +3,10 @@ from .views import *
 
 urlpatterns = [
     path('products-list/shop/', ProductShop.as_view(), name='api-products-list'),
+    path('products-list/facets/', ProductFacets.as_view(), name='api-products-facets'),
     path('details/<str:pk>/', ProductDetail.as_view(), name='products-details'),
     path('product/<str:pk>/stats-description/', ProductRatingStatsAndDescription.as_view(), name='product-stats-description'),
     path('ratings/add/', AddRating.as_view(), name='add-rating'),
+    path('feed.<str:fmt>', product_feed, name='product-feed'),
     path('api/bestseller/', BestsellerProductListAPIView.as_view(), name='BestsellerProductListAPIView'),
 ]
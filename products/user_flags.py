@@ -0,0 +1,43 @@
+from orders.models import CartItem, wishlistItem
+
+
+EMPTY_FLAGS = {'favorites': frozenset(), 'cart': frozenset()}
+
+
+def load_product_flags(user):
+    """
+    جلب ids المنتجات الموجودة في wishlist و cart الخاصة بالمستخدم (query واحد لكل واحدة)
+    """
+    if not user or not user.is_authenticated:
+        return EMPTY_FLAGS
+
+    favorites = wishlistItem.objects.filter(wishlist__user=user).values_list('product_id', flat=True)
+    cart = CartItem.objects.filter(cart__user=user, is_ordered=False).values_list('product_id', flat=True)
+    return {'favorites': frozenset(favorites), 'cart': frozenset(cart)}
+
+
+def get_product_flags(request):
+    """
+    نفس النتيجة طوال الـ request: تُحسب مرة واحدة وتُخزن على الـ request
+    """
+    if request is None:
+        return EMPTY_FLAGS
+
+    # DRF Request يلف HttpRequest، نخزن على الأصلي حتى تشترك فيه الـ views والـ templates
+    http_request = getattr(request, '_request', request)
+    flags = getattr(http_request, '_product_flags', None)
+    if flags is None:
+        flags = load_product_flags(getattr(request, 'user', None))
+        http_request._product_flags = flags
+    return flags
+
+
+class ProductFlagsMixin:
+    """
+    للـ views التي تعرض بطاقات المنتجات: تمرر in_favorites / in_cart للـ serializer عبر context
+    """
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['product_flags'] = get_product_flags(self.request)
+        return context
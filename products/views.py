@@ -2,42 +2,99 @@ from rest_framework import generics
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from .models import Product
 from .serializers import *
 from .filters import ProductFilter  
+from .user_flags import ProductFlagsMixin
+from .facets import get_facets
+from .pagination import PRODUCT_SORTS, ProductPagination, ProductCursorPagination, get_sort, sort_ordering
+from . import snapshot
+from .cards import get_cards
+from .feeds import FEED_FORMATS, get_feed_file
 from django.shortcuts import get_object_or_404
-from django.db.models import Avg, Count, Q
+from django.http import FileResponse, Http404
+from django.views.decorators.http import require_safe
 from rest_framework import status
+from website.throttling import TokenBucketThrottle
 
 
-class ProductPagination(PageNumberPagination):
-    page_size = 12
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+# الحقول التي يحتاجها الترتيب و cursor pagination
+CARD_SORT_FIELDS = ['id', 'created_at', 'sales_count', 'price', 'rating_avg', 'discount']
 
-class ProductShop(generics.ListAPIView):
-    queryset = Product.objects.all().order_by('-created_at')
+
+class ProductListAPIView(ProductFlagsMixin, generics.ListAPIView):
+    """
+    قاعدة مشتركة لقوائم المنتجات: ?sort=newest|bestseller|price_asc|price_desc|rating|discount
+    و ?pagination=cursor لاستعمال keyset pagination بدل رقم الصفحة.
+    """
     serializer_class = ProductShopSerializer
     permission_classes = [AllowAny]
     pagination_class = ProductPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = ProductFilter
+    default_sort = 'newest'
 
-    def get_queryset(self):
-        return Product.objects.annotate(avg_rating=Avg('ratings__rating')).all()
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if ProductCursorPagination.is_requested(self.request):
+                self._paginator = ProductCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
-class BestsellerProductListAPIView(generics.ListAPIView):
-    queryset = Product.objects.all().order_by('-sales_count')
-    serializer_class = ProductShopSerializer
-    permission_classes = [AllowAny]
-    pagination_class = ProductPagination
-    filter_backends = [DjangoFilterBackend]
-    filterset_class = ProductFilter
-    
     def get_queryset(self):
-        return Product.objects.annotate(avg_rating=Avg('ratings__rating')).all()
+        sort = get_sort(self.request, self.default_sort)
+        # الفلترة والترتيب فقط على products_product؛ بيانات العرض تأتي من ProductCard
+        return Product.objects.filter(is_active=True).only(*CARD_SORT_FIELDS).order_by(*sort_ordering(sort))
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_from_snapshot(request)
+        if page is None:
+            queryset = self.filter_queryset(self.get_queryset())
+            page = [product.pk for product in self.paginate_queryset(queryset)]
+
+        # بطاقات الصفحة فقط، query واحد بالمفتاح الأساسي وبنفس الترتيب
+        serializer = self.get_serializer(get_cards(page), many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def paginate_from_snapshot(self, request):
+        """
+        فلترة + ترتيب + تقسيم من الـ snapshot (products/snapshot.py) إن أمكن، وإلا None
+        """
+        params = request.query_params
+        if ProductCursorPagination.is_requested(request) or not snapshot.can_answer(params):
+            return None
+        if not ProductFilter(params, queryset=Product.objects.none()).is_valid():
+            return None  # نترك ORM يرجع 400 بنفس الأخطاء
+
+        catalog = snapshot.get_snapshot()
+        if catalog is None:
+            return None
+        try:
+            ids = catalog.query(params, PRODUCT_SORTS[get_sort(request, self.default_sort)])
+        except ValueError:
+            return None
+        return self.paginate_queryset(ids)
+
+
+class ProductShop(ProductListAPIView):
+    default_sort = 'newest'
+
+
+class BestsellerProductListAPIView(ProductListAPIView):
+    default_sort = 'bestseller'
+
+
+class ProductFacets(APIView):
+    """
+    عدد المنتجات لكل تصنيف/لون/مقاس/خيار/تقييم/شريحة سعر، بنفس باراميترات ProductFilter
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response(get_facets(request.query_params))
 
 
 class ProductDetail(APIView):
@@ -47,20 +104,11 @@ class ProductDetail(APIView):
         product = get_object_or_404(Product, id=pk)
         serializer = ProductDetileserializers(product)
 
-        # إحصائيات التقييم
-        ratings_stats = product.ratings.values('rating').annotate(count=Count('rating'))
-        ratings_dict = {i: 0 for i in range(1, 6)}  # تهيئة الأرقام من 1 إلى 5
-        for stat in ratings_stats:
-            ratings_dict[stat['rating']] = stat['count']
-
-        total_reviews = sum(ratings_dict.values())
-        avg_rating = product.ratings.aggregate(avg=Avg('rating'))['avg'] or 0
-
-        # إضافة النتائج للـ serializer data
+        # إضافة إحصائيات التقييم المحفوظة مع المنتج للـ serializer data
         data = serializer.data
-        data['ratings_breakdown'] = ratings_dict
-        data['total_reviews'] = total_reviews
-        data['average_rating'] = round(avg_rating, 2)
+        data['ratings_breakdown'] = product.ratings_breakdown()
+        data['total_reviews'] = product.total_reviews()
+        data['average_rating'] = product.average_rating()
 
         return Response(data)
 
@@ -71,14 +119,11 @@ class ProductRatingStatsAndDescription(APIView):
     def get(self, request, pk):
         product = get_object_or_404(Product, id=pk)
 
-        ratings = product.ratings.all()
-        average_rating = ratings.aggregate(avg=Avg('rating'))['avg'] or 0
-        total_ratings = ratings.count()
+        average_rating = product.average_rating()
+        total_ratings = product.total_reviews()
 
         # توزيع التقييمات حسب النجوم 1-5
-        ratings_count = {}
-        for i in range(1, 6):
-            ratings_count[str(i)] = ratings.filter(rating=i).count()
+        ratings_count = {str(star): count for star, count in product.ratings_breakdown().items()}
 
         # حساب النسب المئوية لتعبئة الشرائط (bars) في العرض - بالنسبة لكل نجمة
         # تجنب القسمة على صفر:
@@ -90,7 +135,7 @@ class ProductRatingStatsAndDescription(APIView):
                 ratings_percentage[star] = 0
 
         data = {
-            "average_rating": round(average_rating, 2),
+            "average_rating": average_rating,
             "total_ratings": total_ratings,
             "ratings_count": ratings_count,
             "ratings_percentage": ratings_percentage,
@@ -103,6 +148,8 @@ class ProductRatingStatsAndDescription(APIView):
 
 class AddRating(APIView):
     permission_classes = [AllowAny]  # يمكن تغييره إلى IsAuthenticated
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'ratings'
 
     def post(self, request):
         user = request.user if request.user.is_authenticated else None
@@ -128,3 +175,13 @@ class AddRating(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@require_safe
+def product_feed(request, fmt):
+    """
+    الكتالوج كاملًا كـ feed (/products/feed.csv | feed.jsonl | feed.xml) من ملف مولّد مسبقًا
+    """
+    if fmt not in FEED_FORMATS:
+        raise Http404("Unknown feed format")
+    return FileResponse(open(get_feed_file(fmt), 'rb'), content_type=FEED_FORMATS[fmt])
@@ -8,6 +8,12 @@ const PASSWORD_RESET_REQUEST = API_BASE + 'password-reset/request/';
 const PASSWORD_RESET_VERIFY = API_BASE + 'password-reset/verify/';
 const PASSWORD_RESET_RESET = API_BASE + 'password-reset/reset/';
 
+// الرجوع للصفحة التي طلبت تسجيل الدخول (مثلًا /login/?next=/checkout/)، فقط داخل الموقع
+function nextPage() {
+    const next = new URLSearchParams(window.location.search).get('next');
+    return next && next.startsWith('/') && !next.startsWith('//') ? next : '/';
+}
+
 // دالة عامة لعمل fetch مع نظام التجديد
 async function fetchWithAuth(url, options = {}) {
     try {
@@ -238,7 +244,7 @@ document.getElementById('loginForm')?.addEventListener('submit', async function(
         
         if (response.ok) {
             showMessage('login-message', 'Login successful! Redirecting...', 'success');
-            setTimeout(() => window.location.href = '/', 1500);
+            setTimeout(() => window.location.href = nextPage(), 1500);
         } else {
             const errorMessage = data.detail || 'Login failed. Please check your credentials.';
             showMessage('login-message', errorMessage, 'error');
@@ -269,19 +269,32 @@ function renderProductDetails(data) {
 /**
  * Render product images and initialize Swiper
  */
+// <picture> مع WebP/JPEG srcset إذا كانت النسخ المتجاوبة جاهزة، وإلا الصورة الأصلية
+function productImageHTML(image, alt, sizes, loading) {
+    const v = image.variants;
+    if (!v) {
+        return `<img src="${image.src}" alt="${alt}" loading="${loading}">`;
+    }
+    return `<picture style="display: contents">` +
+        `<source type="image/webp" srcset="${v.webp_srcset}" sizes="${sizes}">` +
+        `<img src="${v.src}" srcset="${v.srcset}" sizes="${sizes}" width="${v.width}" height="${v.height}" alt="${alt}" loading="${loading}" decoding="async">` +
+        `</picture>`;
+}
+
 function renderProductImages(data) {
     try {
         const images = [];
+        const variants = data.image_variants || {};
         for (let i = 1; i <= 10; i++) {
             const imageKey = `image_${i}`;
             if (data[imageKey]) {
-                images.push(data[imageKey]);
+                images.push({ src: data[imageKey], variants: variants[imageKey] });
             }
         }
 
         if (images.length === 0) {
             console.warn('No images found for product');
-            images.push('/static/imges/istockphoto-1147544807-612x612.jpg');
+            images.push({ src: '/static/imges/istockphoto-1147544807-612x612.jpg' });
         }
 
         const mainWrapper = document.getElementById('main-image-wrapper');
@@ -295,15 +308,15 @@ function renderProductImages(data) {
         mainWrapper.innerHTML = '';
         thumbsWrapper.innerHTML = '';
 
-        images.forEach((src, index) => {
+        images.forEach((image, index) => {
             const mainSlide = document.createElement('div');
             mainSlide.className = 'swiper-slide';
-            mainSlide.innerHTML = `<img src="${src}" alt="Product image ${index + 1}" loading="${index === 0 ? 'eager' : 'lazy'}">`;
+            mainSlide.innerHTML = productImageHTML(image, `Product image ${index + 1}`, '(max-width: 768px) 100vw, 50vw', index === 0 ? 'eager' : 'lazy');
             mainWrapper.appendChild(mainSlide);
 
             const thumbSlide = document.createElement('div');
             thumbSlide.className = 'swiper-slide';
-            thumbSlide.innerHTML = `<img src="${src}" alt="Thumbnail ${index + 1}" loading="lazy">`;
+            thumbSlide.innerHTML = productImageHTML(image, `Thumbnail ${index + 1}`, '100px', 'lazy');
             thumbsWrapper.appendChild(thumbSlide);
         });
 
@@ -761,6 +774,7 @@ function updateCartCounter() {
     if (cartCounter) {
         const currentCount = parseInt(cartCounter.textContent) || 0;
         cartCounter.textContent = currentCount + 1;
+        cartCounter.hidden = false;
     }
 }
 
@@ -625,6 +625,7 @@ class ShopManager {
                 this.updateProductCount();
                 this.hidePagination();
             } else {
+                this.loadFacets();
                 const data = await this.fetchProducts();
                 const products = this.ensureArray(data.results || data);
                 this.renderProducts(products);
@@ -661,6 +662,49 @@ class ShopManager {
         return responseData;
     }
 
+    // عدد المنتجات بجانب كل فلتر (products/products-list/facets/)
+    async loadFacets() {
+        try {
+            const params = this.buildProductParams();
+            params.delete('page');
+            params.delete('sort');
+            const url = `${mainDomain}/products/products-list/facets/?${params.toString()}`;
+            const response = await this.makeRequest(url);
+            this.renderFacetCounts(await response.json());
+        } catch (error) {
+            console.warn('Failed to load filter counts:', error);
+        }
+    }
+
+    renderFacetCounts(facets) {
+        if (!facets || typeof facets !== 'object') return;
+
+        const setCount = (input, count) => {
+            if (!input) return;
+            const label = document.querySelector(`label[for="${input.id}"]`);
+            if (!label) return;
+            let badge = label.querySelector('.facet-count');
+            if (!badge) {
+                badge = document.createElement('span');
+                badge.className = 'facet-count';
+                label.appendChild(badge);
+            }
+            badge.textContent = `(${count})`;
+            label.closest('.filter-item, .rating-filter-box')
+                ?.classList.toggle('facet-empty', count === 0 && !input.checked);
+        };
+
+        ['category', 'color', 'size', 'option'].forEach(name => {
+            this.ensureArray(facets[name]).forEach(item => {
+                setCount(document.querySelector(`input[name="${name}"][value="${item.id}"]`), item.count);
+            });
+        });
+
+        this.ensureArray(facets.rating).forEach(item => {
+            setCount(document.getElementById(`rating_${item.rating}`), item.count);
+        });
+    }
+
     buildProductParams() {
         const params = new URLSearchParams();
         
@@ -707,17 +751,9 @@ class ShopManager {
     }
 
     addSortingParams(params) {
+        // نفس القيم المدعومة في الـ API: newest, bestseller, price_asc, price_desc, rating, discount
         if (this.currentFilters.sort && this.currentFilters.sort !== 'default') {
-            const sortMap = {
-                'price_asc': 'price',
-                'price_desc': '-price',
-                'rating': '-average_rating'
-            };
-            
-            const ordering = sortMap[this.currentFilters.sort];
-            if (ordering) {
-                params.append('ordering', ordering);
-            }
+            params.append('sort', this.currentFilters.sort);
         }
     }
 
@@ -809,6 +845,23 @@ class ShopManager {
         `;
     }
 
+    // <picture> مع WebP/JPEG srcset إذا كانت النسخ المتجاوبة جاهزة، وإلا الصورة الأصلية
+    createImageHTML(variants, fallbackUrl, alt) {
+        if (!variants) {
+            // النسخ لم تُولد بعد: صورة مصغرة عند الطلب من /image/ بدل الأصلية
+            const src = fallbackUrl.includes('/media/') ? fallbackUrl.replace('/media/', '/image/') + '?w=400' : fallbackUrl;
+            return `<img src="${src}" alt="${alt}" loading="lazy" decoding="async">`;
+        }
+        const sizes = '(max-width: 600px) 50vw, 300px';
+        return `
+            <picture style="display: contents">
+                <source type="image/webp" srcset="${variants.webp_srcset}" sizes="${sizes}">
+                <img src="${variants.src}" srcset="${variants.srcset}" sizes="${sizes}"
+                     width="${variants.width}" height="${variants.height}"
+                     alt="${alt}" loading="lazy" decoding="async">
+            </picture>`;
+    }
+
     createProductHTML(product) {
         const hasDiscount = product.old_price && product.discount && parseFloat(product.discount) > 0;
         const displayPrice = product.price || 0;
@@ -825,7 +878,7 @@ class ShopManager {
         return `
             <div class="product-box" data-product-id="${product.id}">
                 <div class="shop-img" onclick="shopManager.viewProductDetails('${product.id}')">
-                    <img src="${imageUrl}" alt="${this.escapeHtml(fullName)}" loading="lazy">
+                    ${this.createImageHTML(product.image_1_variants, imageUrl, this.escapeHtml(fullName))}
                     ${hasDiscount ? `<div class="discount-badge">-${product.discount}%</div>` : ''}
                 </div>
                 <div class="shop-wishlist ${isInWishlist ? 'wishlist-active' : ''}" onclick="shopManager.addToWishlist('${product.id}')">
@@ -4,6 +4,8 @@ from .models import CustomUser
 from orders.models import  *
 from website.models import *
 from products.models import *
+from products.cards import get_cards
+from products.serializers import ProductCardSerializer
 from django.contrib.auth import get_user_model, login
 User = get_user_model()
 
@@ -73,7 +75,14 @@ class WishlistItemSerializer(serializers.ModelSerializer):
 
     def get_product(self, obj):
         request = self.context.get("request")
-        return ProductSerializer(obj.product, context={"request": request}).data
+        # البطاقات محملة مسبقًا في الـ view (product_cards) حتى لا نجلب المنتج كاملًا لكل عنصر
+        cards = self.context.get("product_cards")
+        card = cards.get(obj.product_id) if cards is not None else None
+        if card is None:
+            card = next(iter(get_cards([obj.product_id])), None)
+        if card is None:
+            return None
+        return ProductCardSerializer(card, context={"request": request}).data
 
 
 class AdminReplySerializer(serializers.ModelSerializer):
@@ -1,9 +1,14 @@
+import logging
+
 # Django
 from django.contrib.auth import get_user_model, login, logout
 from django.contrib.auth.models import update_last_login
+from django.core.exceptions import ValidationError
 # tables
 from orders.models import Order ,CartItem,wishlist,wishlistItem
+from orders.guest_cart import load_guest_cart, merge_guest_cart, save_guest_cart
 from website.models import Profile
+from products.cards import get_cards
 from .models import CustomUser
 from .serializers import *
 
@@ -17,7 +22,8 @@ from rest_framework.authentication import SessionAuthentication, BasicAuthentica
 # JWT (SimpleJWT)
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import TokenError
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework_simplejwt.views import TokenObtainPairView
 
 # Djoser
@@ -37,6 +43,7 @@ from rest_framework_simplejwt.exceptions import TokenError
 from djoser.views import UserViewSet
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 class CustomUserViewSet(UserViewSet):
     serializer_class = CustomUserCreateSerializer
@@ -155,6 +162,16 @@ class CookieTokenObtainPairView(TokenObtainPairView):
                 secure=False,
                 max_age=7 * 24 * 3600
             )
+
+            # سلة الزائر (cookie) تنتقل لسلة الحساب، ثم يُحذف الـ cookie
+            guest_lines = load_guest_cart(request)
+            if guest_lines:
+                try:
+                    merge_guest_cart(AccessToken(access)[jwt_settings.USER_ID_CLAIM], guest_lines)
+                except Exception:
+                    # سلة تالفة لا تمنع تسجيل الدخول: نسجل الخطأ ونحذف الـ cookie
+                    logger.exception("Guest cart merge failed on login")
+                save_guest_cart(res, [])
             
             return res
         
@@ -212,6 +229,7 @@ class UserProfileDetaile(APIView):
         user_wishlist, _ = wishlist.objects.get_or_create(user=user)
         wishlist_count = wishlistItem.objects.filter(wishlist=user_wishlist).count()
         wishlist_user = wishlistItem.objects.filter(wishlist=user_wishlist)
+        product_cards = {card.product_id: card for card in get_cards(wishlist_user.values_list('product_id', flat=True))}
 
         messages = Contact.objects.filter(user=user)
         data = {
@@ -219,7 +237,7 @@ class UserProfileDetaile(APIView):
             "orders": OrderSerializer(orders, many=True, context={"request": request}).data,
             "wishlist_count": wishlist_count,
             "wishlist_items": WishlistItemSerializer(
-                wishlist_user, many=True, context={"request": request}
+                wishlist_user, many=True, context={"request": request, "product_cards": product_cards}
             ).data,
             "messages_count": messages.count(),
             "messages": ContactSerializer(messages, many=True).data,  # هنا بيانات الرسائل كاملة مع الردود
@@ -262,35 +280,19 @@ class UserProfileDetaile(APIView):
             profile, created = Profile.objects.get_or_create(user=user)
 
 
-            # تحديث بيانات user
-            profile_fields = ['phone_number', 'address', 'city', 'country', 'profile_img','first_name','last_name','email']  # لاحظ هنا عدلت avatar لـ profile_img حسب الحقل الجديد
+            # تحديث بيانات profile بـ save واحد (الصورة تُعالج فقط إذا رُفع ملف جديد)
+            profile_fields = ['phone_number', 'address', 'city', 'country', 'profile_img','first_name','last_name','email']
             for field in profile_fields:
-                if field in request.data:
-                    if field == 'profile_img' and request.FILES.get('avatar'):
-                        setattr(profile, field, request.FILES['avatar'])
-                    elif field != 'profile_img':
-                        value = request.data.getlist(field)[0]
-                        setattr(profile, field, value)
-            profile.save()
-            print(request.data)
-            if profile:
-                profile_fields = ['phone_number', 'address', 'city', 'country', 'profile_img', 'first_name', 'last_name','email']
-                for field in profile_fields:
-                    if field == 'profile_img' and request.FILES.get('profile_img'):
-                        setattr(profile, field, request.FILES['profile_img'])
-                    elif field != 'profile_img' and field in request.data:
-                        setattr(profile, field, request.data[field])
+                if field == 'profile_img':
+                    image = request.FILES.get('profile_img') or request.FILES.get('avatar')
+                    if image:
+                        setattr(profile, field, image)
+                elif field in request.data:
+                    setattr(profile, field, request.data[field])
+            try:
                 profile.save()
-                print("Profile updated:", profile)
-            else:
-                profile = Profile.objects.create(
-                    user=user,
-                    email=request.data.get('email', ''),
-                    phone_number=request.data.get('phone_number', ''),
-                    address=request.data.get('address', ''),
-                    city=request.data.get('city', ''),
-                    country=request.data.get('country', ''),
-                    profile_img=request.FILES.get('profile_img')
-                )
+            except ValidationError as error:
+                # صورة كبيرة جدًا أو ليست صورة (website/images.py)
+                return Response({"error": error.message_dict}, status=status.HTTP_400_BAD_REQUEST)
 
             return Response({"message": "Profile updated successfully"}, status=status.HTTP_200_OK)
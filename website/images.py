@@ -0,0 +1,541 @@
+"""
+نسخ متجاوبة (responsive variants) للصور المرفوعة: عروض ثابتة بصيغتي JPEG و WebP.
+
+الرفع يُحفظ كما هو؛ النسخ تُولّد بعد الـ commit في process pool (أو عبر manage.py build_image_variants)
+تحت media/variants/<مسار الصورة>/ مع manifest.json. القوالب والـ serializers
+تقرأ الـ manifest، وإذا لم يوجد بعد نرجع للصورة الأصلية.
+"""
+import hashlib
+import json
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.utils._os import safe_join
+from django.db import models, transaction
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'variants'
+MANIFEST_NAME = 'manifest.json'
+FORMATS = {'jpeg': 'jpg', 'webp': 'webp'}
+
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+MAX_PIXELS = 40_000_000  # ~ صورة 8000×5000
+RESIZE_FORMATS = {'jpeg': ('jpg', 'image/jpeg'), 'webp': ('webp', 'image/webp'), 'png': ('png', 'image/png')}
+RESIZE_WIDTHS = [100, 200, 300, 400, 600, 800, 1200, 1600]
+RESIZE_QUALITIES = [50, 65, 75, 85]
+
+_pool = None
+_pool_lock = threading.Lock()
+_in_flight = set()
+_resize_semaphore = None
+
+
+def variant_widths():
+    return sorted(getattr(settings, 'IMAGE_VARIANT_WIDTHS', [200, 400, 800, 1200]))
+
+
+def variant_quality():
+    return getattr(settings, 'IMAGE_VARIANT_QUALITY', 80)
+
+
+def _name(image):
+    # ImageFieldFile أو اسم الملف مباشرة (ProductCard.image)
+    return getattr(image, 'name', image) or ''
+
+
+def variants_dir(name):
+    # الامتداد يبقى في اسم المجلد: a.png و a.jpg لا يتشاركان نفس النسخ
+    return os.path.join(VARIANTS_DIR, name)
+
+
+def variant_name(name, width, fmt):
+    return os.path.join(variants_dir(name), f'{width}.{FORMATS[fmt]}')
+
+
+# ________________________________________________________________________
+#
+#   استقبال وفك الصور بذاكرة محدودة (كل الموديلات، النسخ، التصغير، optimize_media)
+# ________________________________________________________________________
+
+
+def max_upload_bytes():
+    return getattr(settings, 'IMAGE_MAX_UPLOAD_BYTES', MAX_UPLOAD_BYTES)
+
+
+def max_pixels():
+    return getattr(settings, 'IMAGE_MAX_PIXELS', MAX_PIXELS)
+
+
+def inspect_image(source):
+    """
+    (الصيغة، العرض، الارتفاع) من الـ header فقط، بدون decode.
+    source: مسار أو ملف (يرجع لمكانه بعد القراءة). ValidationError للملف الكبير أو decompression bomb.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        size = os.path.getsize(source)
+    else:
+        size = getattr(source, 'size', None)
+    if size is not None and size > max_upload_bytes():
+        raise ValidationError(
+            f"Image files must be at most {max_upload_bytes() // (1024 * 1024)} MB.", code='image_too_large',
+        )
+
+    position = None if isinstance(source, (str, os.PathLike)) else source.tell()
+    try:
+        with Image.open(source) as image:
+            fmt, (width, height) = image.format, image.size
+    except (OSError, Image.DecompressionBombError) as error:
+        raise ValidationError("Upload a valid image.", code='invalid_image') from error
+    finally:
+        if position is not None:
+            source.seek(position)
+
+    if fmt not in ALLOWED_FORMATS:
+        raise ValidationError(f"Unsupported image format: {fmt}.", code='invalid_image')
+    if width * height > max_pixels():
+        raise ValidationError(
+            f"Image is {width}×{height}; at most {max_pixels():,} pixels are allowed.", code='image_too_many_pixels',
+        )
+    return fmt, width, height
+
+
+def decode_image(path, width=None, max_side=None):
+    """
+    فك صورة لتصغيرها إلى width (عرض الصورة كما تُعرض) أو max_side (أطول ضلع).
+    الحدود تُفحص من الـ header أولًا، و JPEG يُفك مباشرة بمقياس 1/2 أو 1/4 أو 1/8 (draft):
+    صورة هاتف 6000×4000 لنسخة 1200 تحتاج ~4.5MB بدل ~72MB.
+    ترجع الصورة بنفس الـ mode، الاتجاه مصحح، مع info الأصلية (icc_profile...).
+    """
+    inspect_image(path)
+    with Image.open(path) as source:
+        orientation = source.getexif().get(0x0112, 1)
+        source_width, source_height = source.size
+        shown_width = source_height if orientation in (5, 6, 7, 8) else source_width
+        scale = 1.0
+        if width:
+            scale = min(scale, width / shown_width)
+        if max_side:
+            scale = min(scale, max_side / max(source.size))
+        if scale < 1 and source.format == 'JPEG':
+            source.draft(source.mode if source.mode in ('RGB', 'L') else 'RGB', (
+                math.ceil(source_width * scale), math.ceil(source_height * scale),
+            ))
+        info = dict(source.info)
+        image = ImageOps.exif_transpose(source)
+    image.info.update(info)
+    return image
+
+
+def flatten(image):
+    """
+    RGB: الشفافية تصبح خلفية بيضاء (JPEG لا يدعم alpha)
+    """
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image if image.mode == 'RGB' else image.convert('RGB')
+
+
+def render_variants(source_path, target_dir, widths, quality):
+    """
+    يعمل داخل process منفصل: PIL فقط، بدون ORM.
+    يكتب كل النسخ ثم manifest.json في الأخير (وجوده = النسخ جاهزة).
+    """
+    # width/height في الـ manifest للنسبة فقط؛ draft يحافظ على العرض >= أكبر نسخة
+    image = flatten(decode_image(source_path, width=max(widths)))
+    width, height = image.size
+    targets = sorted({min(w, width) for w in widths})
+    os.makedirs(target_dir, exist_ok=True)
+    for target in targets:
+        resized = image if target == width else image.resize(
+            (target, max(1, round(height * target / width))), Image.Resampling.LANCZOS, reducing_gap=3.0,
+        )
+        # بدون exif=... فالـ metadata لا تُنسخ
+        for fmt, ext in FORMATS.items():
+            path = os.path.join(target_dir, f'{target}.{ext}')
+            options = {'quality': quality}
+            if fmt == 'jpeg':
+                options.update(optimize=True, progressive=True)
+            else:
+                options.update(method=4)
+            resized.save(path + '.tmp', format=fmt.upper(), **options)
+            os.replace(path + '.tmp', path)
+
+    manifest = {'width': width, 'height': height, 'widths': targets}
+    manifest_path = os.path.join(target_dir, MANIFEST_NAME)
+    with open(manifest_path + '.tmp', 'w') as handle:
+        json.dump(manifest, handle)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return manifest
+
+
+def variant_job(name):
+    """
+    (المسار الأصلي، مجلد النسخ، العروض، الجودة): كل ما يحتاجه render_variants
+    """
+    return (
+        os.path.join(settings.MEDIA_ROOT, name),
+        os.path.join(settings.MEDIA_ROOT, variants_dir(name)),
+        variant_widths(),
+        variant_quality(),
+    )
+
+
+def has_variants(name):
+    return os.path.exists(os.path.join(settings.MEDIA_ROOT, variants_dir(name), MANIFEST_NAME))
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: الـ workers لا يرثون اتصالات قاعدة البيانات أو threads من Django
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def _submit(names):
+    pool = get_pool()
+    for name in names:
+        if name in _in_flight:
+            continue
+        _in_flight.add(name)
+        future = pool.submit(render_variants, *variant_job(name))
+        future.add_done_callback(lambda f, name=name: _finished(name, f))
+
+
+def _finished(name, future):
+    _in_flight.discard(name)
+    if future.exception() is not None:
+        logger.error("Image variants failed for %s: %s", name, future.exception())
+
+
+def schedule_variants(images):
+    """
+    توليد النسخ في الخلفية بعد الـ commit للصور التي ليس لها نسخ بعد
+    """
+    names = {_name(image) for image in images}
+    names = [name for name in names if name and not has_variants(name)]
+    if not names:
+        return
+    if not getattr(settings, 'IMAGE_VARIANTS_ASYNC', True):
+        for name in names:
+            render_variants(*variant_job(name))
+        return
+    transaction.on_commit(lambda: _submit(names))
+
+
+def image_field_names():
+    """
+    أسماء كل الصور المستعملة في قاعدة البيانات (كل ImageField في كل الموديلات)
+    """
+    names = set()
+    for model in apps.get_models():
+        fields = [f.name for f in model._meta.concrete_fields if isinstance(f, models.ImageField)]
+        for field in fields:
+            names.update(model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).values_list(field, flat=True))
+    return names
+
+
+class VariantQueue:
+    """
+    إرسال صور كثيرة للـ pool بعدد محدود من المهام المعلقة (الذاكرة لا تكبر مع عدد الصور)
+    """
+
+    def __init__(self, force=False, window=None):
+        self.pool = get_pool()
+        self.force = force
+        self.window = window or getattr(settings, 'IMAGE_WORKERS', 2) * 4
+        self.pending = {}
+        self.done = 0
+        self.failed = []
+
+    def put(self, name):
+        if not name or name in self.pending.values() or (not self.force and has_variants(name)):
+            return
+        self.pending[self.pool.submit(render_variants, *variant_job(name))] = name
+        if len(self.pending) >= self.window:
+            self._collect(wait(self.pending, return_when=FIRST_COMPLETED).done)
+
+    def _collect(self, futures):
+        for future in futures:
+            name = self.pending.pop(future)
+            if future.exception() is None:
+                self.done += 1
+            else:
+                self.failed.append((name, future.exception()))
+
+    def join(self):
+        self._collect(wait(self.pending).done)
+        return self.done, self.failed
+
+
+def build_variants(names, force=False):
+    """
+    توليد النسخ (للصور التي ليس لها نسخ، أو كلها مع force) في الـ pool وانتظار النتيجة.
+    ترجع (عدد الناجحة، [(الاسم، الخطأ)]).
+    """
+    queue = VariantQueue(force=force)
+    for name in names:
+        queue.put(name)
+    return queue.join()
+
+
+class TrackedImagesMixin:
+    """
+    للموديلات التي فيها صور: تتذكر أسماء الصور كما جاءت من قاعدة البيانات،
+    وبعد save تجدول النسخ فقط للحقول التي رُفع فيها ملف جديد فعلًا.
+    Django لا يكتب فوق ملف موجود (اسم جديد لكل رفع)، فتغير الاسم = تغير المحتوى.
+    """
+    IMAGE_FIELDS = []
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_images()
+        return instance
+
+    def _remember_images(self):
+        # __dict__ حتى لا نسبب query لحقل deferred
+        self._stored_images = {field: _name(self.__dict__.get(field)) for field in self.IMAGE_FIELDS}
+
+    def changed_image_fields(self):
+        stored = getattr(self, '_stored_images', {})
+        changed = []
+        for field in self.IMAGE_FIELDS:
+            if field not in self.__dict__:
+                continue  # deferred = لم يُلمس
+            image = getattr(self, field)
+            if not image:
+                continue
+            if not getattr(image, '_committed', True) or stored.get(field) != image.name:
+                changed.append(field)
+        return changed
+
+    def check_uploads(self, exclude=()):
+        """
+        ValidationError {الحقل: ...} لأي صورة مرفوعة جديدة تتجاوز الحدود (من الـ header فقط)
+        """
+        errors = {}
+        for field in self.changed_image_fields():
+            image = getattr(self, field)
+            if field in exclude or getattr(image, '_committed', True):
+                continue
+            try:
+                inspect_image(image.file)
+            except ValidationError as error:
+                errors[field] = error.messages
+        if errors:
+            raise ValidationError(errors)
+
+    def clean_fields(self, exclude=None):
+        # الأدمن والـ ModelForm: الخطأ يظهر تحت حقل الصورة
+        errors = {}
+        for check in (super().clean_fields, self.check_uploads):
+            try:
+                check(exclude or ())
+            except ValidationError as error:
+                errors = error.update_error_dict(errors)
+        if errors:
+            raise ValidationError(errors)
+
+    def save(self, *args, **kwargs):
+        changed = self.changed_image_fields()
+        self.check_uploads()
+        super().save(*args, **kwargs)
+        # الصورة تُحفظ كما رُفعت؛ النسخ المتجاوبة تُولد في الخلفية
+        schedule_variants(getattr(self, field) for field in changed)
+        self._remember_images()
+
+
+@lru_cache(maxsize=4096)
+def _read_manifest(path, mtime):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def get_manifest(name):
+    path = os.path.join(settings.MEDIA_ROOT, variants_dir(name), MANIFEST_NAME)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return _read_manifest(path, mtime)
+
+
+def original_url(image):
+    name = _name(image)
+    return default_storage.url(name) if name else None
+
+
+def responsive_image(image):
+    """
+    {'src', 'srcset', 'webp_srcset', 'width', 'height'} أو None إذا النسخ غير جاهزة
+    """
+    name = _name(image)
+    manifest = get_manifest(name) if name else None
+    if manifest is None:
+        return None
+
+    def srcset(fmt):
+        return ', '.join(
+            f'{settings.MEDIA_URL}{variant_name(name, w, fmt)} {w}w'.replace(os.sep, '/') for w in manifest['widths']
+        )
+
+    largest = manifest['widths'][-1]
+    return {
+        'src': f'{settings.MEDIA_URL}{variant_name(name, largest, "jpeg")}'.replace(os.sep, '/'),
+        'srcset': srcset('jpeg'),
+        'webp_srcset': srcset('webp'),
+        'width': manifest['width'],
+        'height': manifest['height'],
+    }
+
+
+# ________________________________________________________________________
+#
+#   تصغير عند الطلب: /image/<اسم الصورة>?w=200&q=75&fmt=webp
+# ________________________________________________________________________
+
+
+class ResizeBusy(Exception):
+    """
+    كل أماكن التصغير في هذا الـ process مشغولة
+    """
+
+
+def resize_widths():
+    return sorted(getattr(settings, 'IMAGE_RESIZE_WIDTHS', RESIZE_WIDTHS))
+
+
+def snap_width(width):
+    """
+    أقرب عرض مسموح أكبر أو يساوي المطلوب: عدد محدود من النسخ لكل صورة في الكاش
+    """
+    widths = resize_widths()
+    return next((w for w in widths if w >= width), widths[-1])
+
+
+def resize_qualities():
+    return sorted(getattr(settings, 'IMAGE_RESIZE_QUALITIES', RESIZE_QUALITIES))
+
+
+def snap_quality(quality):
+    """
+    مثل snap_width: أقرب جودة مسموحة أكبر أو تساوي المطلوبة، بدل نسخة لكل قيمة من 1 إلى 100
+    """
+    qualities = resize_qualities()
+    return next((q for q in qualities if q >= quality), qualities[-1])
+
+
+def resize_cache_dir():
+    return getattr(settings, 'IMAGE_CACHE_DIR', None) or os.path.join(settings.BASE_DIR, '.image_cache')
+
+
+def source_path(name):
+    """
+    المسار الحقيقي داخل MEDIA_ROOT، أو ValueError لأي مسار يخرج منه (../)
+    """
+    try:
+        return safe_join(settings.MEDIA_ROOT, name)
+    except Exception:
+        raise ValueError(name)
+
+
+@lru_cache(maxsize=4096)
+def _content_hash(path, mtime, size):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def derivative_key(path, width, quality, fmt):
+    """
+    المفتاح = hash محتوى الصورة الأصلية + المعاملات: صورة جديدة بنفس الاسم تعطي مفتاحًا جديدًا
+    """
+    stat = os.stat(path)
+    source = _content_hash(path, stat.st_mtime_ns, stat.st_size)
+    return hashlib.sha256(f'{source}:{width}:{quality}:{fmt}'.encode()).hexdigest()[:40]
+
+
+def derivative_path(key, fmt):
+    return os.path.join(resize_cache_dir(), key[:2], f'{key}.{RESIZE_FORMATS[fmt][0]}')
+
+
+def _get_semaphore():
+    global _resize_semaphore
+    with _pool_lock:
+        if _resize_semaphore is None:
+            _resize_semaphore = threading.BoundedSemaphore(getattr(settings, 'IMAGE_RESIZE_CONCURRENCY', 2))
+        return _resize_semaphore
+
+
+def resize_image(path, target, width, quality, fmt):
+    """
+    الفك عبر decode_image: فحص الحدود من الـ header، و JPEG بـ draft قريب من العرض المطلوب
+    """
+    image = decode_image(path, width=width)
+    if fmt == 'png':
+        image = image.convert('RGBA') if image.mode not in ('RGB', 'RGBA') else image
+    else:
+        image = flatten(image)
+
+    if image.width > width:  # بدون تكبير
+        image = image.resize(
+            (width, max(1, round(image.height * width / image.width))), Image.Resampling.LANCZOS, reducing_gap=3.0,
+        )
+
+    options = {'quality': quality}
+    if fmt == 'jpeg':
+        options.update(optimize=True, progressive=True)
+    elif fmt == 'webp':
+        options.update(method=4)
+    else:
+        options = {'optimize': True}
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temporary = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+    image.save(temporary, format=fmt.upper(), **options)
+    os.replace(temporary, target)
+
+
+def get_derivative(name, width, quality, fmt, timeout=10):
+    """
+    (مسار الملف المصغر، المفتاح). من الكاش إن وجد، وإلا يُولد تحت semaphore.
+    FileNotFoundError إذا الصورة غير موجودة، ResizeBusy إذا انتظرنا timeout بدون مكان.
+    """
+    path = source_path(name)
+    key = derivative_key(path, width, quality, fmt)
+    target = derivative_path(key, fmt)
+    if os.path.exists(target):
+        return target, key
+
+    semaphore = _get_semaphore()
+    if not semaphore.acquire(timeout=timeout):
+        raise ResizeBusy(name)
+    try:
+        # ربما ولده طلب آخر بينما كنا ننتظر
+        if not os.path.exists(target):
+            resize_image(path, target, width, quality, fmt)
+    finally:
+        semaphore.release()
+    return target, key
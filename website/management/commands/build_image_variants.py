@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from website.images import build_variants, image_field_names
+
+
+class Command(BaseCommand):
+    help = "Generate the responsive image variants for every uploaded image that does not have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Regenerate variants that already exist.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        done, failed = build_variants(sorted(image_field_names()), force=options["force"])
+        elapsed = time.perf_counter() - started
+        for name, error in failed:
+            self.stderr.write(f"{name}: {error}")
+        self.stdout.write(self.style.SUCCESS(f"Generated variants for {done} image(s) in {elapsed:.2f}s."))
@@ -0,0 +1,56 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from website import media_library
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-encode oversized images in MEDIA_ROOT, strip EXIF and merge identical files "
+        "(rewriting FileField and ImageField references). Safe to interrupt and re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report the bytes that would be saved.")
+        parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: CPU count).")
+        parser.add_argument("--max-dimension", type=int, default=media_library.MAX_DIMENSION)
+        parser.add_argument("--max-kb", type=int, default=media_library.MAX_BYTES // 1024,
+                            help="Re-encode files larger than this even if their dimensions are fine.")
+        parser.add_argument("--quality", type=int, default=media_library.QUALITY)
+        parser.add_argument(
+            "--state", default=os.path.join(settings.BASE_DIR, ".optimize_media.jsonl"),
+            help="Progress file used to resume an interrupted run.",
+        )
+        parser.add_argument("--restart", action="store_true", help="Ignore the progress file and scan everything.")
+
+    def handle(self, *args, **options):
+        if options["restart"] and os.path.exists(options["state"]) and not options["dry_run"]:
+            os.remove(options["state"])
+
+        started = time.perf_counter()
+        report = media_library.MediaOptimizer(
+            state_path=None if options["restart"] and options["dry_run"] else options["state"],
+            workers=options["workers"],
+            max_dimension=options["max_dimension"],
+            max_bytes=options["max_kb"] * 1024,
+            quality=options["quality"],
+            dry_run=options["dry_run"],
+        ).run()
+        elapsed = time.perf_counter() - started
+
+        for name, error in report["failed"]:
+            self.stderr.write(f"{name}: {error}")
+        saved = report["bytes_before"] - report["bytes_after"]
+        verb = "Would save" if options["dry_run"] else "Saved"
+        self.stdout.write(
+            f"Scanned {report['scanned']} image(s), {report['skipped']} unchanged since the last run.\n"
+            f"Re-encoded {report['optimized']}: {report['bytes_before'] / 1e6:.1f} MB -> {report['bytes_after'] / 1e6:.1f} MB.\n"
+            f"Duplicates: {report['duplicates']} file(s), {report['duplicate_bytes'] / 1e6:.1f} MB, "
+            f"{report['references_rewritten']} reference(s) rewritten."
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {(saved + report['duplicate_bytes']) / 1e6:.1f} MB in {elapsed:.1f}s."
+        ))
@@ -0,0 +1,271 @@
+"""
+تحسين مكتبة media الموجودة (python manage.py optimize_media).
+
+1. كل صورة تُفحص في process pool: إذا كانت أكبر من الحد (أبعاد أو حجم) أو فيها EXIF
+   يُعاد ترميزها بنفس الصيغة (نفس الاسم، فلا تتغير أي روابط).
+2. الصور المتطابقة (نفس الـ hash بعد التحسين) تُدمج: نحتفظ بملف واحد ونعدل كل FileField
+   (ومنه ImageField) يشير للنسخ الأخرى، ثم نحذفها.
+
+التقدم يُكتب سطرًا بسطر في ملف state، فالتشغيل المقطوع يكمل من حيث توقف.
+"""
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction
+from PIL import Image
+
+from .images import VARIANTS_DIR, decode_image, variants_dir
+
+
+EXTENSIONS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP'}
+MAX_DIMENSION = 1600
+MAX_BYTES = 300 * 1024
+QUALITY = 82
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_media(root):
+    """
+    أسماء الصور (نسبية لـ MEDIA_ROOT)، بدون مجلد النسخ المتجاوبة
+    """
+    for directory, subdirectories, files in os.walk(root):
+        if directory == root and VARIANTS_DIR in subdirectories:
+            subdirectories.remove(VARIANTS_DIR)
+        subdirectories.sort()
+        for filename in sorted(files):
+            if os.path.splitext(filename)[1].lower() in EXTENSIONS:
+                yield os.path.relpath(os.path.join(directory, filename), root)
+
+
+def optimize_file(path, max_dimension, max_bytes, quality, dry_run):
+    """
+    يعمل داخل الـ worker. يرجع (الحجم قبل، الحجم بعد، hash المحتوى النهائي).
+    صورة واحدة فقط في الذاكرة لكل worker، مفكوكة عبر decode_image (حدود + draft).
+    """
+    before = os.path.getsize(path)
+    fmt = EXTENSIONS[os.path.splitext(path)[1].lower()]
+    with Image.open(path) as source:
+        has_exif = bool(source.getexif())
+        too_large = max(source.size) > max_dimension
+        if not (has_exif or too_large or before > max_bytes) or getattr(source, 'is_animated', False):
+            return before, before, file_hash(path)
+
+    image = decode_image(path, max_side=max_dimension)
+    icc_profile = image.info.get('icc_profile')
+    image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    options = {'icc_profile': icc_profile} if icc_profile else {}
+    if fmt == 'JPEG':
+        options.update(quality=quality, optimize=True, progressive=True)
+    elif fmt == 'WEBP':
+        options.update(quality=quality, method=6)
+    else:
+        options.update(optimize=True)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **options)
+    data = buffer.getvalue()
+    # أكبر من الأصل ولا يوجد EXIF نحذفه → نبقي الأصل
+    if len(data) >= before and not has_exif:
+        return before, before, file_hash(path)
+    if not dry_run:
+        with open(path + '.tmp', 'wb') as handle:
+            handle.write(data)
+        os.replace(path + '.tmp', path)
+    return before, len(data), hashlib.sha256(data).hexdigest()
+
+
+def _optimize_job(args):
+    name, path, *options = args
+    try:
+        return name, optimize_file(path, *options), None
+    except Exception as error:
+        return name, None, str(error)
+
+
+def run_pool(jobs, workers, window):
+    """
+    مثل pool.map لكن بعدد محدود من المهام المعلقة، فالذاكرة لا تكبر مع عدد الملفات
+    """
+    # spawn مثل website/images.py: الـ workers لا يرثون اتصالات قاعدة البيانات
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        pending = set()
+        for job in jobs:
+            pending.add(pool.submit(_optimize_job, job))
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in pending:
+            yield future.result()
+
+
+def load_state(path):
+    """
+    {الاسم: {'size', 'mtime', 'hash'}} من تشغيل سابق
+    """
+    state = {}
+    if path and os.path.exists(path):
+        with open(path) as handle:
+            for line in handle:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # سطر ناقص من تشغيل انقطع
+                state[entry['name']] = entry
+    return state
+
+
+def file_references():
+    """
+    [(model, اسم الحقل)] لكل FileField في المشروع (ImageField منها، و StoreSettings.logo مثلًا)
+    """
+    return [
+        (model, field.name)
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.FileField)
+    ]
+
+
+def referenced_names(names):
+    """
+    من هذه الأسماء: التي ما زال أي FileField يشير إليها
+    """
+    names = set(names)
+    found = set()
+    for model, field in file_references():
+        found.update(model.objects.filter(**{f'{field}__in': names}).values_list(field, flat=True))
+    return found
+
+
+def rewrite_references(replacements):
+    """
+    كل FileField يشير لنسخة مكررة يصبح يشير للملف المحتفظ به. ترجع عدد الصفوف المعدلة.
+    """
+    from products.catalog import schedule_catalog_change
+    from products.models import Category, Product
+
+    updated = 0
+    with transaction.atomic():
+        for model, field in file_references():
+            for duplicate, kept in replacements.items():
+                rows = model.objects.filter(**{field: duplicate})
+                # update() لا يطلق signals: ProductCard و snapshot و البحث تتحدث عبر catalog_changed
+                if model is Product:
+                    schedule_catalog_change(list(rows.values_list('pk', flat=True)))
+                elif model is Category:
+                    # صورة التصنيف محفوظة في بطاقات منتجاته
+                    schedule_catalog_change(list(
+                        Product.objects.filter(categories__in=rows).values_list('pk', flat=True).distinct()
+                    ))
+                updated += rows.update(**{field: kept})
+    return updated
+
+
+class MediaOptimizer:
+    def __init__(self, root=None, state_path=None, workers=None, max_dimension=MAX_DIMENSION,
+                 max_bytes=MAX_BYTES, quality=QUALITY, dry_run=False):
+        self.root = root or settings.MEDIA_ROOT
+        self.state_path = state_path
+        self.workers = workers or os.cpu_count() or 1
+        self.options = (max_dimension, max_bytes, quality, dry_run)
+        self.dry_run = dry_run
+        self.report = {
+            'scanned': 0, 'skipped': 0, 'optimized': 0, 'failed': [],
+            'bytes_before': 0, 'bytes_after': 0,
+            'duplicates': 0, 'duplicate_bytes': 0, 'references_rewritten': 0,
+        }
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def optimize(self):
+        """
+        المرحلة 1: إعادة الترميز. ترجع {الاسم: (الحجم بعد، hash)} لكل الصور.
+        """
+        state = load_state(self.state_path)
+        files = {}
+        jobs = []
+        for name in scan_media(self.root):
+            self.report['scanned'] += 1
+            stat = os.stat(self.path(name))
+            entry = state.get(name)
+            if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+                self.report['skipped'] += 1
+                files[name] = (entry['size'], entry['hash'])
+                continue
+            jobs.append((name, self.path(name), *self.options))
+
+        log = None if self.dry_run or not self.state_path else open(self.state_path, 'a')
+        try:
+            for name, result, error in run_pool(jobs, self.workers, window=self.workers * 4):
+                if error is not None:
+                    self.report['failed'].append((name, error))
+                    continue
+                before, after, digest = result
+                self.report['bytes_before'] += before
+                self.report['bytes_after'] += after
+                if after < before:
+                    self.report['optimized'] += 1
+                files[name] = (after, digest)
+                if log is not None:
+                    stat = os.stat(self.path(name))
+                    entry = {'name': name, 'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': digest}
+                    log.write(json.dumps(entry) + '\n')
+                    log.flush()
+        finally:
+            if log is not None:
+                log.close()
+        return files
+
+    def deduplicate(self, files):
+        """
+        المرحلة 2: ملف واحد لكل محتوى. نحتفظ بأول اسم أبجديًا (ثابت بين التشغيلات).
+        """
+        groups = {}
+        for name, (size, digest) in files.items():
+            groups.setdefault(digest, []).append(name)
+
+        replacements = {}
+        for names in groups.values():
+            kept, *duplicates = sorted(names)
+            for duplicate in duplicates:
+                replacements[duplicate] = kept
+                self.report['duplicates'] += 1
+                self.report['duplicate_bytes'] += files[duplicate][0]
+
+        if not replacements or self.dry_run:
+            return replacements
+
+        self.report['references_rewritten'] = rewrite_references(replacements)
+        # لا نحذف ملفًا ما زال مستعملًا (مثلًا صف أضيف أثناء التشغيل)
+        for duplicate in referenced_names(replacements):
+            del replacements[duplicate]
+            self.report['duplicates'] -= 1
+            self.report['duplicate_bytes'] -= files[duplicate][0]
+        for duplicate in replacements:
+            os.remove(self.path(duplicate))
+            shutil.rmtree(os.path.join(self.root, variants_dir(duplicate)), ignore_errors=True)
+        return replacements
+
+    def run(self):
+        files = self.optimize()
+        self.deduplicate(files)
+        return self.report
@@ -6,9 +6,7 @@ import uuid
 from django.contrib.auth import get_user_model
 from django.conf import settings
 from django.db import models
-from PIL import Image
-from io import BytesIO
-from django.core.files.base import ContentFile
+from .images import TrackedImagesMixin
 
 
 User = get_user_model()
@@ -39,45 +37,22 @@ class StoreSettings(models.Model):
 
 
 
-class StoreHeroImage(models.Model):
+class StoreHeroImage(TrackedImagesMixin, models.Model):
     image = models.ImageField(upload_to='hero_images/', verbose_name="صورة السلايدر")
     slide_name = models.CharField(max_length=255, verbose_name="عنوان السلايدر")
     slide_description = models.TextField(verbose_name="وصف السلايدر", blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    IMAGE_FIELDS = ['image']
+
     def __str__(self):
         return self.slide_name
-    
-    def save(self, *args, **kwargs):
-        # حفظ الصورة الأصلية مؤقتاً
-        img = Image.open(self.image)
-        img = img.convert("RGB")  # تأكد أن الصورة بصيغة RGB
-
-        # تغيير الحجم إذا كانت كبيرة جداً (مثلاً 1200px كحد أقصى للعرض)
-        max_width = 1200
-        if img.width > max_width:
-            ratio = max_width / float(img.width)
-            height = int(float(img.height) * ratio)
-            img = img.resize((max_width, height), Image.Resampling.LANCZOS)
-
-        # ضغط الصورة وجودة عالية نسبياً (80%)
-        buffer = BytesIO()
-        img.save(buffer, format="JPEG", quality=80)
-        buffer.seek(0)
-
-        # استبدال الصورة المضغوطة بالصورة الأصلية
-        self.image.save(self.image.name, ContentFile(buffer.read()), save=False)
-
-        super().save(*args, **kwargs)
-
-
-
 
 
 def profile_img_upload_path(instance, filename):
     return f'profiles/user_{instance.user.id}/{filename}'
 
-class Profile(models.Model):
+class Profile(TrackedImagesMixin, models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
     
@@ -99,19 +74,7 @@ class Profile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-
-        if self.profile_img:
-            img_path = self.profile_img.path
-            img = Image.open(img_path)
-
-            # تغيير حجم الصورة إذا كانت كبيرة (مثلاً عرض 400px كحد أقصى)
-            max_size = (400, 400)
-            img.thumbnail(max_size, Image.LANCZOS)
-
-            # ضغط الصورة وحفظها بجودة أقل لتقليل الحجم
-            img.save(img_path, format='JPEG', quality=70)
+    IMAGE_FIELDS = ['profile_img']
 
     def __str__(self):
         return self.user.username
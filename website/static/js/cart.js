@@ -199,6 +199,14 @@ document.addEventListener('DOMContentLoaded', function() {
         }, 3000);
     }
 
+    // رابط مصغر من /image/ بدل الصورة الأصلية الكاملة (فقط لصور media)
+    function thumbnailUrl(url, width) {
+        if (!url || !url.includes('/media/')) {
+            return url;
+        }
+        return url.replace('/media/', '/image/') + `?w=${width}`;
+    }
+
     function formatPrice(price) {
         const validPrice = isNaN(parseFloat(price)) ? 0 : parseFloat(price);
         return `${currencySymbol}${validPrice.toFixed(2)}`;
@@ -259,6 +267,7 @@ document.addEventListener('DOMContentLoaded', function() {
             const items = cartData.items || [];
             renderCartItems(items);
             updateCartSummary(cartData);
+            loadBoughtTogether(items);
         } catch (error) {
             if (error.message === 'AUTHENTICATION_REQUIRED') {
                 showAuthRequired();
@@ -273,6 +282,41 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Frequently bought together (co-purchase suggestions for the whole cart)
+    const boughtTogetherSection = document.querySelector('.bought-together');
+    const boughtTogetherGrid = document.querySelector('.bought-together-grid');
+
+    async function loadBoughtTogether(items) {
+        if (!boughtTogetherSection) return;
+        if (!items || items.length === 0) {
+            boughtTogetherSection.hidden = true;
+            return;
+        }
+        try {
+            const data = await makeApiRequest(`${API_BASE_URL}/bought-together/cart/`);
+            renderBoughtTogether(data.results || []);
+        } catch (error) {
+            boughtTogetherSection.hidden = true;
+            console.error('Failed to load suggestions:', error);
+        }
+    }
+
+    function renderBoughtTogether(products) {
+        if (products.length === 0) {
+            boughtTogetherSection.hidden = true;
+            return;
+        }
+        boughtTogetherGrid.innerHTML = products.map(product => `
+            <div class="bought-together-card" onclick="viewProductDetails('${product.id}')">
+                <img src="${thumbnailUrl(product.image_1, 300) || '/static/images/placeholder.jpg'}" alt="${product.name}"
+                     onerror="this.src='/static/images/placeholder.jpg'" loading="lazy">
+                <div class="bought-together-name">${product.name}</div>
+                <div class="bought-together-price">${formatPrice(product.price)}</div>
+            </div>
+        `).join('');
+        boughtTogetherSection.hidden = false;
+    }
+
     // Render Cart Items - UPDATED
     function renderCartItems(items) {
         if (!items || items.length === 0) {
@@ -295,7 +339,7 @@ document.addEventListener('DOMContentLoaded', function() {
     // Create Cart Item HTML - UPDATED for new structure
     function createCartItemHTML(item) {
         const product = item.product;
-        const imageUrl = product.image_1 || '/static/images/placeholder.jpg';
+        const imageUrl = thumbnailUrl(product.image_1, 200) || '/static/images/placeholder.jpg';
         
         // Handle color and size arrays from new API
         const color = Array.isArray(product.color) && product.color.length > 0 ? product.color[0] : null;
@@ -1,15 +1,19 @@
 const API_ORDER_URL = mainDomain + "orders/user/orders/create/";
 const API_COUPON_URL = mainDomain + "orders/apply-promo/";
+const API_SHIPPING_URL = mainDomain + "orders/shipping-quote/";
 
 // State management
 let orderData = null;
 let isSubmitting = false;
 let appliedCouponId = null;
+let shippingRequest = null;
+const shippingQuotes = new Map();
 
 document.addEventListener("DOMContentLoaded", async () => {
     await loadOrderSummary();
     setupFormValidation();
     setupPaymentMethods();
+    setupShippingLookup();
     
     const form = document.getElementById("checkout-form");
     if (form) {
@@ -50,6 +54,63 @@ function setupPaymentMethods() {
     });
 }
 
+// الشحن حسب المدينة أثناء الكتابة: طلب واحد بعد توقف الكتابة، والنتائج محفوظة لكل قيمة
+function setupShippingLookup() {
+    const cityInput = document.getElementById('city');
+    if (!cityInput) return;
+
+    let timer = null;
+    cityInput.addEventListener('input', () => {
+        clearTimeout(timer);
+        timer = setTimeout(() => updateShipping(cityInput.value.trim()), 250);
+    });
+}
+
+async function updateShipping(city) {
+    const key = city.toLowerCase();
+    let quote = shippingQuotes.get(key);
+
+    if (!quote) {
+        // طلب قديم لم ينته لا يكتب فوق نتيجة أحدث
+        if (shippingRequest) shippingRequest.abort();
+        shippingRequest = new AbortController();
+        try {
+            const response = await fetch(API_SHIPPING_URL + '?city=' + encodeURIComponent(city), {
+                signal: shippingRequest.signal
+            });
+            if (!response.ok) return;
+            quote = await response.json();
+            shippingQuotes.set(key, quote);
+        } catch (error) {
+            if (error.name !== 'AbortError') console.error('Shipping lookup error:', error);
+            return;
+        }
+    }
+
+    const datalist = document.getElementById('city-suggestions');
+    if (datalist) {
+        datalist.innerHTML = quote.suggestions
+            .map(suggestion => `<option value="${escapeHtml(suggestion.region)}"></option>`)
+            .join('');
+    }
+
+    const estimate = document.getElementById('shipping-estimate');
+    if (estimate) {
+        estimate.textContent = quote.region && quote.match !== 'default'
+            ? `${quote.region}: ${formatPrice(quote.cost)}, ${quote.estimated_days} day(s)`
+            : '';
+    }
+
+    if (!orderData || !orderData.order_summary || orderData.order_summary.length === 0 || quote.cost === null) return;
+
+    // نفس حساب السيرفر: الشحن لا يدخل في الضريبة
+    orderData.total = Math.round((orderData.total - orderData.shipping + quote.cost) * 100) / 100;
+    orderData.shipping = quote.cost;
+    orderData.shipping_region = quote.region;
+    orderData.estimated_days = quote.estimated_days;
+    renderOrderSummary(orderData);
+}
+
 function validateField(e) {
     const field = e.target;
     const value = field.value.trim();
@@ -233,6 +294,11 @@ async function loadOrderSummary() {
 
     } catch (error) {
         console.error("Error loading order summary:", error);
+        if (error.message === "Session expired, please log in again.") {
+            // سلة الزائر تنتقل للحساب عند تسجيل الدخول، ثم نرجع هنا
+            window.location.href = '/login/?next=' + encodeURIComponent('/checkout/');
+            return;
+        }
         renderEmptyCart(container);
     }
 }
@@ -295,9 +361,15 @@ function renderOrderSummary(data) {
                 </div>
             ` : ''}
             <div class="summary-row">
-                <span>Shipping:</span>
+                <span>Shipping${data.shipping_region ? ` (${escapeHtml(data.shipping_region)})` : ''}:</span>
                 <span>${formatPrice(data.shipping)}</span>
             </div>
+            ${data.estimated_days ? `
+                <div class="summary-row">
+                    <span>Estimated delivery:</span>
+                    <span>${data.estimated_days} day(s)</span>
+                </div>
+            ` : ''}
             ${data.service_fee > 0 ? `
                 <div class="summary-row">
                     <span>Service Fee:</span>
@@ -341,7 +413,7 @@ async function applyPromoCode() {
                 'Content-Type': 'application/json',
                 'X-CSRFToken': getCookie('csrftoken')
             },
-            body: JSON.stringify({ code: promoCode })
+            body: JSON.stringify({ code: promoCode, city: document.getElementById('city')?.value || '' })
         });
         
         const result = await response.json();
@@ -352,16 +424,12 @@ async function applyPromoCode() {
             console.log(appliedCouponId);
             
             if (result.discount_percent) {
-                console.log('Applying discount:', result.discount_percent);
-                
-                const discountPercentage = parseFloat(result.discount_percent);
-                const originalTotal = orderData.total;
-                const discountAmount = (originalTotal * discountPercentage) / 100;
-                
-                orderData.discount = discountAmount;
-                orderData.total = originalTotal - discountAmount;
-                
-                showNotification(`Discount of ${discountPercentage}% applied successfully!`, 'success');
+                // المجاميع محسوبة في السيرفر بنفس حساب الطلب
+                ['subtotal', 'discount', 'tax', 'shipping', 'service_fee', 'total', 'shipping_region', 'estimated_days'].forEach(key => {
+                    orderData[key] = result[key];
+                });
+
+                showNotification(`Discount of ${parseFloat(result.discount_percent)}% applied successfully!`, 'success');
             } else {
                 showNotification(result.message, 'success');
             }
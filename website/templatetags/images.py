@@ -0,0 +1,36 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from website.images import original_url, responsive_image
+
+
+register = template.Library()
+
+DEFAULT_SIZES = '(max-width: 600px) 50vw, 300px'
+
+
+@register.simple_tag
+def responsive_img(image, alt='', sizes=DEFAULT_SIZES, loading='lazy', fallback='', **attrs):
+    """
+    {% responsive_img product.image_1 alt=product.name sizes="..." onclick="..." %}
+    <picture> مع WebP و JPEG srcset إذا كانت النسخ جاهزة، وإلا <img> للصورة الأصلية (أو fallback)
+    """
+    attrs.update({'alt': alt, 'loading': loading, 'decoding': 'async'})
+    info = responsive_image(image)
+    if info is None:
+        attrs['src'] = original_url(image) or fallback
+        return format_html('<img{}>', flatatt(attrs))
+
+    attrs.update({
+        'src': info['src'],
+        'srcset': info['srcset'],
+        'sizes': sizes,
+        'width': info['width'],
+        'height': info['height'],
+    })
+    # display: contents حتى لا يغير <picture> تنسيق الـ CSS الموجود حول <img>
+    return format_html(
+        '<picture style="display: contents"><source type="image/webp" srcset="{}" sizes="{}"><img{}></picture>',
+        info['webp_srcset'], sizes, flatatt(attrs),
+    )
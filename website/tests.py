@@ -1,3 +1,426 @@
-from django.test import TestCase
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+
+from . import images, media_library
+from .images import inspect_image, render_variants
+from .throttling import SharedFileBucketStore
+
+
+def _status_kb(field):
+    with open('/proc/self/status') as handle:
+        for line in handle:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+
+
+def _measure_variants(source_path, target_dir, results):
+    # يعمل في process جديد (spawn). نصفّر ذروة الـ RSS (VmHWM) بعد الـ imports،
+    # فالفرق = ذروة ذاكرة الـ decode والتصغير فقط
+    with open('/proc/self/clear_refs', 'w') as handle:
+        handle.write('5')
+    baseline = _status_kb('VmRSS')
+    render_variants(source_path, target_dir, [200, 400, 800, 1200], 80)
+    results.put(_status_kb('VmHWM') - baseline)
+
+
+def _consume_tokens(path, count, results):
+    store = SharedFileBucketStore(path=path, slots=64)
+    results.put(sum(store.consume('shared', 100, 0.001) == 0 for _ in range(count)))
+
+
+@unittest.skipUnless(os.path.exists('/proc/self/clear_refs'), "needs Linux /proc to measure peak RSS")
+class ImageIngestionMemoryTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, 'phone.jpg')
+        # صورة هاتف 6000×4000: فكها كاملة بـ RGB وحده ~72MB
+        Image.new('RGB', (6000, 4000), (90, 120, 200)).save(self.source, quality=90)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_peak_rss_for_large_upload_stays_bounded(self):
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        worker = context.Process(
+            target=_measure_variants, args=(self.source, os.path.join(self.directory, 'variants'), results),
+        )
+        worker.start()
+        peak_kb = results.get(timeout=60)
+        worker.join()
+        self.assertEqual(worker.exitcode, 0)
+        # draft يفك بمقياس 1/4 (1500×1000) قبل التصغير
+        self.assertLess(peak_kb, 32 * 1024)
+        with Image.open(os.path.join(self.directory, 'variants', '1200.jpg')) as variant:
+            self.assertEqual(variant.size, (1200, 800))
+
+
+@override_settings(IMAGE_MAX_PIXELS=1_000_000, IMAGE_MAX_UPLOAD_BYTES=512 * 1024)
+class ImageIngestionLimitTests(TestCase):
+    def upload(self, size):
+        buffer = BytesIO()
+        Image.new('RGB', size).save(buffer, 'PNG')
+        return SimpleUploadedFile('upload.png', buffer.getvalue(), content_type='image/png')
+
+    def test_pixel_limit_is_checked_from_header(self):
+        with self.assertRaises(ValidationError) as raised:
+            inspect_image(self.upload((2000, 1000)))
+        self.assertEqual(raised.exception.code, 'image_too_many_pixels')
+
+    def test_byte_limit(self):
+        upload = SimpleUploadedFile('upload.jpg', b'\xff' * (600 * 1024), content_type='image/jpeg')
+        with self.assertRaises(ValidationError) as raised:
+            inspect_image(upload)
+        self.assertEqual(raised.exception.code, 'image_too_large')
+
+    def test_not_an_image(self):
+        with self.assertRaises(ValidationError):
+            inspect_image(SimpleUploadedFile('upload.png', b'not an image'))
+
+    def test_model_save_rejects_oversized_upload(self):
+        from products.models import Category
+
+        with self.assertRaises(ValidationError) as raised:
+            Category.objects.create(name='Shoes', image=self.upload((2000, 1000)))
+        self.assertIn('image', raised.exception.message_dict)
+        self.assertFalse(Category.objects.exists())
+
+
+class ResponsiveVariantsTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_VARIANT_WIDTHS=[200, 400, 800, 1200])
+        self.settings_override.enable()
+        self.name = os.path.join('products', 'logo.png')
+        os.makedirs(os.path.join(self.media_root, 'products'))
+        # نصفها شفاف: JPEG بدون alpha → خلفية بيضاء
+        image = Image.new('RGBA', (1000, 500), (200, 40, 40, 255))
+        image.paste((0, 0, 0, 0), (0, 0, 500, 500))
+        image.save(os.path.join(self.media_root, self.name))
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_render_variants_writes_manifest_last(self):
+        manifest = images.render_variants(*images.variant_job(self.name))
+        # لا تكبير: 1200 تصبح عرض الصورة الأصلي
+        self.assertEqual(manifest, {'width': 1000, 'height': 500, 'widths': [200, 400, 800, 1000]})
+        with Image.open(os.path.join(self.media_root, images.variant_name(self.name, 200, 'jpeg'))) as variant:
+            self.assertEqual((variant.size, variant.mode), ((200, 100), 'RGB'))
+            self.assertEqual(variant.getpixel((10, 50)), (255, 255, 255))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, images.variant_name(self.name, 1000, 'webp'))))
+
+        responsive = images.responsive_image(self.name)
+        self.assertTrue(responsive['src'].endswith('/products/logo.png/1000.jpg'))
+        self.assertEqual(len(responsive['webp_srcset'].split(', ')), 4)
+        self.assertIsNone(images.responsive_image('products/missing.png'))
+
+    @override_settings(IMAGE_VARIANTS_ASYNC=True)
+    def test_schedule_variants_after_commit_once_per_image(self):
+        with mock.patch.object(images, '_submit') as submit:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                images.schedule_variants([self.name, self.name, ''])
+                submit.assert_not_called()
+            self.assertEqual(len(callbacks), 1)
+            submit.assert_called_once_with([self.name])
+
+        with override_settings(IMAGE_VARIANTS_ASYNC=False):
+            images.schedule_variants([self.name])
+        self.assertTrue(images.has_variants(self.name))
+        # النسخ موجودة: لا شيء يُجدول
+        with mock.patch.object(images, 'render_variants') as render, mock.patch.object(images, '_submit') as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                images.schedule_variants([self.name])
+        render.assert_not_called()
+        submit.assert_not_called()
+
+
+class ImageResizeTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.media_root = os.path.join(self.directory, 'media')
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, IMAGE_CACHE_DIR=os.path.join(self.directory, 'cache'),
+        )
+        self.settings_override.enable()
+        os.makedirs(os.path.join(self.media_root, 'products'))
+        self.save_photo((90, 120, 200))
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def save_photo(self, color):
+        Image.new('RGB', (1000, 800), color).save(os.path.join(self.media_root, 'products', 'photo.jpg'))
+
+    def get(self, name='products/photo.jpg', **params):
+        headers = params.pop('headers', {})
+        return self.client.get(f'/image/{name}', params, headers=headers)
+
+    def test_derivative_is_cached_by_content(self):
+        response = self.get(w=250, fmt='webp')
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/webp'))
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (300, 240))  # 250 → أقرب عرض مسموح
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        etag = response['ETag']
+
+        with mock.patch.object(images, 'resize_image') as resize:
+            self.assertEqual(self.get(w=300, fmt='webp')['ETag'], etag)
+            self.assertEqual(self.get(w=300, fmt='webp', headers={'If-None-Match': etag}).status_code, 304)
+        resize.assert_not_called()
+
+        # صورة جديدة بنفس الاسم = مفتاح جديد
+        self.save_photo((10, 200, 10))
+        self.assertNotEqual(self.get(w=300, fmt='webp')['ETag'], etag)
+
+        auto = self.get(w=300, headers={'Accept': 'image/avif,image/webp,*/*'})
+        self.assertEqual(auto['Content-Type'], 'image/webp')
+        self.assertIn('Accept', auto['Vary'])
+        self.assertEqual(self.get(w=300)['Content-Type'], 'image/jpeg')
+
+        # الجودة تُقرب لأحد المستويات مثل العرض: q=70 و q=75 نفس النسخة
+        self.assertEqual(self.get(w=300, fmt='jpeg', q=70)['ETag'], self.get(w=300, fmt='jpeg', q=75)['ETag'])
+        self.assertNotEqual(self.get(w=300, fmt='jpeg', q=80)['ETag'], self.get(w=300, fmt='jpeg', q=75)['ETag'])
+        self.assertEqual(self.get(w=300, fmt='jpeg', q=1)['ETag'], self.get(w=300, fmt='jpeg', q=50)['ETag'])
+
+        self.assertEqual(self.get(w='big').status_code, 400)
+        self.assertEqual(self.get(fmt='gif').status_code, 400)
+        self.assertEqual(self.get('products/missing.jpg').status_code, 404)
+        self.assertEqual(self.get('../settings.py').status_code, 404)
+
+    def test_concurrent_resizes_are_bounded(self):
+        semaphore = threading.BoundedSemaphore(1)
+        with mock.patch.object(images, '_get_semaphore', return_value=semaphore):
+            semaphore.acquire()
+            with self.assertRaises(images.ResizeBusy):
+                images.get_derivative('products/photo.jpg', 400, 75, 'jpeg', timeout=0.05)
+            with mock.patch.object(semaphore, 'acquire', return_value=False):
+                response = self.get(w=400, fmt='jpeg')
+            self.assertEqual((response.status_code, response['Retry-After']), (503, '1'))
+            semaphore.release()
+
+            self.assertEqual(self.get(w=400, fmt='jpeg').status_code, 200)
+            # الموجود في الكاش لا يحتاج مكانًا في الـ semaphore
+            semaphore.acquire()
+            self.assertEqual(self.get(w=400, fmt='jpeg').status_code, 200)
+            semaphore.release()
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False)
+class MediaOptimizerTests(TestCase):
+    def setUp(self):
+        from products.models import Category, Product
+
+        self.directory = tempfile.mkdtemp()
+        self.media_root = os.path.join(self.directory, 'media')
+        self.state = os.path.join(self.directory, 'state.jsonl')
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        os.makedirs(os.path.join(self.media_root, 'products'))
+
+        # صورة كبيرة فيها EXIF، صورة صغيرة لا تحتاج شيئًا، ونسختان متطابقتان
+        large = Image.new('RGB', (2400, 1200), (90, 120, 200))
+        exif = large.getexif()
+        exif[0x010F] = 'Camera'
+        large.save(self.path('products/large.jpg'), quality=95, exif=exif.tobytes())
+        Image.new('RGB', (100, 100), (10, 10, 10)).save(self.path('products/small.jpg'))
+        Image.new('RGB', (50, 50), (0, 200, 0)).save(self.path('products/a.png'))
+        shutil.copy(self.path('products/a.png'), self.path('products/copy.png'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category = Category.objects.create(name='Lamps', image='products/copy.png')
+            self.product = Product.objects.create(name='Lamp', price=10, description_1='-', image_1='products/copy.png')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def path(self, name):
+        return os.path.join(self.media_root, name)
+
+    def optimize(self, *args):
+        out = StringIO()
+        call_command('optimize_media', '--workers', '1', '--state', self.state, *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_dry_run_changes_nothing(self):
+        names = ['products/large.jpg', 'products/small.jpg', 'products/a.png', 'products/copy.png']
+        sizes = [os.path.getsize(self.path(name)) for name in names]
+        output = self.optimize('--dry-run')
+        self.assertIn('Re-encoded 1:', output)
+        self.assertIn('Duplicates: 1 file(s)', output)
+        self.assertIn('Would save', output)
+        self.assertEqual([os.path.getsize(self.path(name)) for name in names], sizes)
+        self.assertFalse(os.path.exists(self.state))
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.image.name, 'products/copy.png')
+
+    def test_optimize_merge_duplicates_and_resume(self):
+        from products.models import Category, Product, ProductCard
+
+        # صورته ليست مكررة، لكن بطاقته تحمل صورة التصنيف
+        with self.captureOnCommitCallbacks(execute=True):
+            desk = Product.objects.create(name='Desk', price=10, description_1='-', image_1='products/small.jpg')
+            desk.categories.add(self.category)
+        self.assertTrue(ProductCard.objects.get(pk=desk.pk).categories[0]['image'].endswith('/products/copy.png'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            output = self.optimize()
+        self.assertIn('2 reference(s) rewritten', output)
+        self.assertTrue(ProductCard.objects.get(pk=desk.pk).categories[0]['image'].endswith('/products/a.png'))
+        with Image.open(self.path('products/large.jpg')) as image:
+            self.assertEqual(image.size, (1600, 800))
+            self.assertFalse(image.getexif())
+        self.assertFalse(os.path.exists(self.path('products/copy.png')))
+        self.assertEqual(Category.objects.get(pk=self.category.pk).image.name, 'products/a.png')
+        self.assertEqual(ProductCard.objects.get(pk=self.product.pk).image, 'products/a.png')
+
+        # تشغيل انقطع أثناء كتابة سطر، ثم ملف تغير بعده: فقط هذا الملف يُعاد فحصه
+        with open(self.state, 'a') as handle:
+            handle.write('{"name": "products/sm')
+        Image.new('RGB', (100, 100), (250, 250, 250)).save(self.path('products/small.jpg'))
+        with mock.patch.object(media_library, 'run_pool', wraps=media_library.run_pool) as run_pool:
+            output = self.optimize()
+        self.assertIn('Scanned 3 image(s), 2 unchanged since the last run.', output)
+        self.assertEqual([job[0] for job in run_pool.call_args.args[0]], ['products/small.jpg'])
+
+    def test_file_field_references_are_rewritten(self):
+        from website.models import StoreSettings
+
+        # StoreSettings.logo هو FileField وليس ImageField، والملف المحتفظ به في مجلد آخر
+        for directory in ('category', 'logos'):
+            os.makedirs(self.path(directory))
+            shutil.copy(self.path('products/a.png'), self.path(f'{directory}/lamp.png'))
+        store = StoreSettings.objects.create(logo='logos/lamp.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            output = self.optimize()
+        self.assertIn('Duplicates: 3 file(s)', output)
+        self.assertIn('3 reference(s) rewritten', output)
+        self.assertEqual(StoreSettings.objects.get(pk=store.pk).logo.name, 'category/lamp.png')
+        self.assertFalse(os.path.exists(self.path('logos/lamp.png')))
+        self.assertTrue(os.path.exists(self.path('category/lamp.png')))
+
+    def test_duplicate_still_referenced_is_kept(self):
+        from products.models import Category
+
+        with mock.patch.object(media_library, 'rewrite_references', return_value=0):
+            output = self.optimize()
+        self.assertIn('Duplicates: 0 file(s)', output)
+        self.assertTrue(os.path.exists(self.path('products/copy.png')))
+        self.assertEqual(Category.objects.get(pk=self.category.pk).image.name, 'products/copy.png')
+
+
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            THROTTLE_STORE={'OPTIONS': {'path': os.path.join(self.directory, 'state')}},
+            THROTTLE_RATES={'contact': {'rate': '2/min', 'route_rate': '3/min'}},
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def post_contact(self, ip):
+        data = {'foll_name': 'Sara', 'subject': 'Hi', 'message': 'Hello'}
+        return self.client.post('/contact/create/', data, REMOTE_ADDR=ip)
+
+    def test_bucket_per_ip_and_per_route(self):
+        self.assertEqual([self.post_contact('10.0.0.1').status_code for _ in range(2)], [201, 201])
+        response = self.post_contact('10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(int(response['Retry-After']), range(25, 31))  # token واحد كل 30 ثانية
+        # IP آخر عنده bucket خاص به، لكن bucket الـ route (3/min) فرغ بعد طلب واحد
+        self.assertEqual(self.post_contact('10.0.0.2').status_code, 201)
+        self.assertEqual(self.post_contact('10.0.0.3').status_code, 429)
+
+    @override_settings(THROTTLE_RATES={'contact': {'rate': '2/min'}})
+    def test_spoofed_forwarded_for_shares_the_client_bucket(self):
+        def post(forwarded_for, remote_addr='10.0.0.1'):
+            data = {'foll_name': 'Sara', 'subject': 'Hi', 'message': 'Hello'}
+            return self.client.post('/contact/create/', data, REMOTE_ADDR=remote_addr, HTTP_X_FORWARDED_FOR=forwarded_for).status_code
+
+        self.assertEqual([post(f'203.0.113.{i}') for i in range(3)], [201, 201, 429])
+
+        # خلف proxy واحد: الـ IP هو آخر عنوان أضافه الـ proxy، وليس ما كتبه العميل قبله
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            codes = [post(f'198.51.100.{i}, 192.0.2.7', remote_addr='10.0.0.254') for i in range(3)]
+            self.assertEqual(codes, [201, 201, 429])
+            self.assertEqual(post('192.0.2.8', remote_addr='10.0.0.254'), 201)
+
+    def test_state_is_shared_between_processes(self):
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        path = os.path.join(self.directory, 'shared')
+        workers = [context.Process(target=_consume_tokens, args=(path, 60, results)) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        allowed = sum(results.get(timeout=60) for _ in workers)
+        for worker in workers:
+            worker.join()
+        # 180 محاولة على bucket سعته 100: بالضبط 100 مقبولة مهما تداخلت الـ processes
+        self.assertEqual(allowed, 100)
+
+
+class ConfirmationTests(TestCase):
+    # imports الموديلات داخل الاختبارات: هذا الملف يُستورد أيضًا في processes (spawn) بدون Django
+    def setUp(self):
+        from orders.models import Coupon, Tax
+        from products.models import Product
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tax = Tax.objects.create(name='VAT', rate=10)
+            self.coupon = Coupon.objects.create(code='TEN', discount_percent=10)
+        self.product = Product.objects.create(name='Lamp', price=50, description_1='Lamp', image_1='products/lamp.jpg')
+
+    def test_shows_stored_totals_after_rules_change(self):
+        from orders.models import Order, OrderItem
+        from products.models import Product
+
+        order = Order.objects.create(
+            customer_name='Buyer', customer_phone='0600', customer_address='Street 1', city='Rabat',
+            total=Decimal('119.00'), discount=Decimal('10.00'), coupon=self.coupon, is_use_coupon=True,
+        )
+        OrderItem.objects.create(order=order, product=self.product, product_name='Lamp', quantity=2, unit_price=50)
+        # بعد الطلب: ضريبة جديدة، الكوبون محذوف، المنتج أغلى
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tax.rate = 25
+            self.tax.save()
+            self.coupon.delete()
+        Product.objects.filter(pk=self.product.pk).update(price=80)
+
+        response = self.client.get(f'/confirmation/{order.pk}')
+        self.assertEqual(response.status_code, 200)
+        context = response.context
+        self.assertEqual((context['subtotal'], context['discount'], context['total']),
+                         (Decimal('100.00'), Decimal('10.00'), Decimal('119.00')))
+        self.assertEqual(context['fees'], Decimal('29.00'))
+        self.assertEqual([(item.product_name, item.quantity, item.unit_price) for item in context['items']],
+                         [('Lamp', 2, 50)])
+
+    def test_legacy_order_without_total_is_priced(self):
+        from orders.models import Order
+
+        order = Order.objects.create(customer_name='Old', customer_phone='0600', customer_address='Street 1')
+        order.products.add(self.product)
+        context = self.client.get(f'/confirmation/{order.pk}').context
+        self.assertEqual((context['subtotal'], context['tax'], context['total']),
+                         (Decimal('50.00'), Decimal('5.00'), Decimal('55.00')))
@@ -0,0 +1,199 @@
+"""
+Token bucket لكل عميل (IP) ولكل route على نقاط الكتابة المفتوحة للزوار (تقييم، تواصل، طلب بدون حساب...).
+
+كل طلب كتابة على SQLite يأخذ قفل الكتابة العام، فسيل طلبات من عميل واحد يوقف الـ checkout للجميع.
+الحالة مشتركة بين كل workers تبع gunicorn:
+- SharedFileBucketStore: جدول ثابت الحجم في ملف mmap على نفس الجهاز (الافتراضي).
+- RedisBucketStore: لأكثر من جهاز (pip install redis).
+أي backend آخر: كلاس فيه consume(key, capacity, refill_rate) عبر THROTTLE_STORE['BACKEND'].
+
+الإعدادات (settings.THROTTLE_RATES):
+    'ratings': {'rate': '5/min', 'burst': 10, 'route_rate': '120/min'}
+rate = سرعة امتلاء bucket كل IP، burst = حجمه (الافتراضي = عدد rate)، route_rate (اختياري) = bucket واحد
+للـ route كله مهما كان عدد الـ IPs.
+"""
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE = 'website.throttling.SharedFileBucketStore'
+PERIODS = {'s': 1, 'sec': 1, 'second': 1, 'm': 60, 'min': 60, 'minute': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+def parse_rate(rate):
+    """
+    '10/min' → (10, 10/60 token في الثانية)
+    """
+    try:
+        count, period = rate.split('/')
+        count = int(count)
+        return count, count / PERIODS[period.strip().lower()]
+    except (AttributeError, KeyError, ValueError):
+        raise ImproperlyConfigured(f"Invalid throttle rate {rate!r}, expected e.g. '10/min'")
+
+
+def take_token(tokens, updated, capacity, refill_rate, now, cost=1):
+    """
+    الحساب نفسه لكل الـ backends: (tokens الجديدة، الانتظار بالثواني؛ 0 = مسموح)
+    """
+    tokens = min(capacity, tokens + max(0.0, now - updated) * refill_rate)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / refill_rate
+
+
+class SharedFileBucketStore:
+    """
+    جدول hash ثابت الحجم في ملف mmap، محمي بـ flock (بين الـ processes) و Lock (بين الـ threads).
+    كل خانة: hash المفتاح، tokens، آخر تحديث، ومتى يمتلئ الـ bucket. الـ bucket الممتلئ يساوي
+    bucket غير موجود، فخانته تُعاد استعمالها؛ وإذا امتلأت كل خانات البحث نأخذ الأقرب للامتلاء.
+    """
+    SLOT = struct.Struct('<Qddd')
+    PROBES = 8
+
+    def __init__(self, path=None, slots=65536):
+        self.path = str(path or os.path.join(settings.BASE_DIR, '.throttle_state'))
+        self.slots = slots
+        self.size = self.SLOT.size * slots
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _open(self):
+        # بعد fork (gunicorn --preload) كل process يفتح الملف من جديد
+        if self._pid != os.getpid():
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            self._fd, self._map, self._pid = fd, mmap.mmap(fd, self.size), os.getpid()
+        return self._map
+
+    def _hash(self, key):
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') | 1
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        key_hash = self._hash(key)
+        with self._lock:
+            table = self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                start = key_hash % self.slots
+                slot, reusable = None, None
+                for probe in range(self.PROBES):
+                    offset = ((start + probe) % self.slots) * self.SLOT.size
+                    stored_hash, tokens, updated, full_at = self.SLOT.unpack_from(table, offset)
+                    if stored_hash == key_hash:
+                        slot = offset
+                        break
+                    if reusable is None or full_at < reusable[1]:
+                        reusable = (offset, full_at)
+                if slot is None:
+                    slot, tokens, updated = reusable[0], capacity, now
+                tokens, wait = take_token(tokens, updated, capacity, refill_rate, now, cost)
+                full_at = now + (capacity - tokens) / refill_rate
+                self.SLOT.pack_into(table, slot, key_hash, tokens, now, full_at)
+                return wait
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class RedisBucketStore:
+    """
+    نفس الـ bucket في Redis (مشترك بين عدة أجهزة). الحساب كله داخل script واحد، فهو atomic.
+    """
+    SCRIPT = """
+    local capacity, rate, now, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    local wait = 0
+    if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='throttle:'):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("RedisBucketStore needs the redis package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.script = self.client.register_script(self.SCRIPT)
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        # وقت Redis وليس وقت الجهاز: كل الأجهزة على نفس الساعة
+        seconds, microseconds = self.client.time()
+        now = seconds + microseconds / 1e6
+        return float(self.script(keys=[self.prefix + key], args=[capacity, refill_rate, now, cost]))
+
+
+_stores = {}
+
+
+def get_bucket_store():
+    config = getattr(settings, 'THROTTLE_STORE', {})
+    cache_key = repr(sorted(config.items()))
+    if cache_key not in _stores:
+        backend = import_string(config.get('BACKEND', DEFAULT_STORE))
+        _stores[cache_key] = backend(**config.get('OPTIONS', {}))
+    return _stores[cache_key]
+
+
+def get_throttle_rates(scope):
+    """
+    [(اسم الـ bucket، السعة، token في الثانية)] لهذا الـ scope، أو [] إذا غير مُعرّف
+    """
+    config = getattr(settings, 'THROTTLE_RATES', {}).get(scope)
+    if not config:
+        return []
+    count, refill_rate = parse_rate(config['rate'])
+    buckets = [('ip', config.get('burst', count), refill_rate)]
+    if config.get('route_rate'):
+        route_count, route_refill = parse_rate(config['route_rate'])
+        buckets.append(('route', config.get('route_burst', route_count), route_refill))
+    return buckets
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    throttle_classes = [TokenBucketThrottle] و throttle_scope = '...' في الـ view.
+    طلبات القراءة (GET/HEAD/OPTIONS) لا تُحسب. الرفض = 429 مع Retry-After (من DRF).
+    """
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        scope = getattr(view, 'throttle_scope', None)
+        if request.method in ('GET', 'HEAD', 'OPTIONS') or not scope:
+            return True
+        try:
+            store = get_bucket_store()
+            for bucket, capacity, refill_rate in get_throttle_rates(scope):
+                # bucket الـ IP أولًا: العميل الذي يغرق الموقع يُرفض قبل أن يستهلك bucket الـ route
+                key = f"{scope}:{self.get_ident(request)}" if bucket == 'ip' else f"{scope}:*"
+                wait = store.consume(key, capacity, refill_rate)
+                if wait > 0:
+                    self.retry_after = wait
+                    return False
+        except OSError:
+            # مشكلة في ملف الحالة لا توقف الموقع
+            logger.exception("Throttle store unavailable, allowing request")
+        return True
+
+    def wait(self):
+        return self.retry_after
@@ -14,6 +14,7 @@ urlpatterns = [
     path('checkout/',views.checkout,name='checkout'),
     path('confirmation/<str:id>',views.confirmation,name='Confirmation'),
     path('about/', views.about, name='about'),  # New about page URL
+    path('image/<path:name>', views.resize_image, name='resize_image'),
 
 
     # api urls
@@ -2,8 +2,13 @@ from django.shortcuts import render,get_object_or_404
 from django.contrib.auth.decorators import login_required
 from .models import StoreHeroImage,StoreSettings
 from products.models import *
+from products.cards import get_cards
+from products.similarity import get_similar_ids
 from rest_framework.views import APIView
 from orders.models import *
+from orders.pricing import get_pricing_rules, price_cart
+from orders.cart_summary import get_cart_summary
+from orders.guest_cart import load_guest_cart
 from .models import *
 from users.models import *
 import jwt
@@ -11,10 +16,19 @@ from jwt.exceptions import ExpiredSignatureError, InvalidTokenError
 from django.conf import settings
 from django.db.models import Avg, Count
 from math import floor
+from decimal import Decimal
 from django.conf.urls import handler404
 import jwt
 from jwt.exceptions import ExpiredSignatureError, InvalidTokenError
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from django.core.exceptions import ValidationError
+from django.http import FileResponse, HttpResponse, HttpResponseBadRequest, Http404
+from django.utils.cache import patch_vary_headers
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_safe
+from PIL import UnidentifiedImageError
+from . import images as image_resizer
 
 
 
@@ -70,6 +84,21 @@ def is_user_logged_in(request):
         return False
 
 
+def header_cart_count(request, user_authenticated):
+    """
+    عدد عناصر السلة للـ header: من ملخص الـ cache للمستخدم، ومن الـ cookie للزائر (بدون query)
+    """
+    if not user_authenticated:
+        return len(load_guest_cart(request))
+    access_token = getattr(request, "new_access_token", None) or request.COOKIES.get("access_token")
+    try:
+        # is_user_logged_in تحقق من التوكن قبل قليل
+        payload = jwt.decode(access_token, settings.SECRET_KEY, algorithms=["HS256"], options={"verify_exp": False})
+    except InvalidTokenError:
+        return 0
+    return get_cart_summary(payload[jwt_settings.USER_ID_CLAIM])["item_count"]
+
+
 def Base(request):
     user_authenticated = is_user_logged_in(request)
 
@@ -86,6 +115,7 @@ def Base(request):
         'more_all_categories': more_all_categories,
         'currency': currency,
         'user_authenticated': user_authenticated,
+        'cart_count': header_cart_count(request, user_authenticated),
     }
     return context
 
@@ -95,8 +125,8 @@ def Base(request):
 # Home
 def Home(request):
     currency = settings.CURRENCY_SYMBOL
-    top_discount_products = Product.objects.filter(discount__gt=0).order_by('-discount')[:5]
-    new_products = Product.objects.all().order_by('-created_at')[:10]
+    top_discount_products = ProductCard.objects.filter(discount__gt=0).order_by('-discount')[:5]
+    new_products = ProductCard.objects.order_by('-created_at')[:10]
     hero_images = StoreHeroImage.objects.all()[:10]
     stars = range(1, 6)
 
@@ -119,15 +149,19 @@ def Home(request):
 def Product_Details(request, pk):
     product = get_object_or_404(Product, id=pk)
     
-    similar_products = Product.objects.filter(
-        categories__in=product.categories.all()
-    ).exclude(id=product.id).distinct()[:8]
+    similar_ids = get_similar_ids(product.id)
+    if similar_ids is not None:
+        # القائمة محسوبة مسبقًا (python manage.py build_similar_products)
+        similar_products = get_cards(similar_ids)
+    else:
+        similar_products = ProductCard.objects.filter(
+            product__categories__in=product.categories.all()
+        ).exclude(product_id=product.id).order_by('-sales_count').distinct()[:8]
     
     for p in similar_products:
-        rating_info = p.ratings.aggregate(avg_rating=Avg('rating'), count=Count('id'))
-        avg = rating_info['avg_rating'] or 0
+        avg = p.average_rating()
         p.avg_rating = avg
-        p.review_count = rating_info['count'] or 0
+        p.review_count = p.total_reviews()
         
         # حساب النجوم الكاملة والنصفية والفارغة
         full_stars = floor(avg)  # نجوم كاملة
@@ -190,21 +224,21 @@ def profile(request):
 
 
 
+def pricing_context(rules):
+    # نفس أسماء المتغيرات في القوالب (tax.rate، discount.percent، shippingFee.cost، serviceFee.cost)
+    return {
+        "tax": rules.tax,
+        "discount": rules.discount,
+        "shippingFee": rules.shipping,
+        "serviceFee": rules.service_fee,
+    }
+
+
 def cart(request):
-    tax = Tax.objects.filter(active=True).last()
-    discount = Discount.objects.filter(active=True).last()
-    shippingFee = ShippingFee.objects.filter(active=True).last()
-    serviceFee = ServiceFee.objects.filter(active=True).last()
-    
     base_context = Base(request)  # جلب logo وبيانات أساسية
-    
-    context = {
-        "tax": tax,
-        "discount": discount,
-        "shippingFee": shippingFee,
-        "serviceFee": serviceFee,
-    }
-    
+
+    context = pricing_context(get_pricing_rules())
+
     context.update(base_context)
     return render(request, 'cart.html', context)
 
@@ -212,20 +246,10 @@ def cart(request):
 
 
 def checkout(request):
-    tax = Tax.objects.filter(active=True).last()
-    discount = Discount.objects.filter(active=True).last()
-    shippingFee = ShippingFee.objects.filter(active=True).last()
-    serviceFee = ServiceFee.objects.filter(active=True).last()
-    
     base_context = Base(request)  # جلب logo وبيانات أساسية
-    
-    context = {
-        "tax": tax,
-        "discount": discount,
-        "shippingFee": shippingFee,
-        "serviceFee": serviceFee,
-    }
-    
+
+    context = pricing_context(get_pricing_rules())
+
     context.update(base_context)
     return render(request,'checkout.html',context)
 
@@ -234,33 +258,39 @@ def confirmation(request, id):
     base_context = Base(request)  # جلب logo
 
     order = get_object_or_404(Order, id=id)
-    
-    # احسب المجاميع
-    subtotal = sum(float(item.price) * getattr(item, 'quantity', 1) for item in order.products.all())
-    
-    shippingFee = ShippingFee.objects.filter(active=True).last()
-    serviceFee = ServiceFee.objects.filter(active=True).last()
-    tax_rate = 0.08  # مثال: 8%
-    discount_amount = getattr(order, 'discount_amount', 0)  # أو مثال ثابت
-
-    shipping = float(shippingFee.cost) if shippingFee else 0
-    service = float(serviceFee.cost) if serviceFee else 0
-    tax = subtotal * tax_rate
-    total = subtotal + shipping + service + tax - discount_amount
 
+    # سطور الطلب والمجموع كما حُفظت وقت الشراء: تعديل الضريبة/الشحن/الكوبون لاحقًا لا يغير طلبًا قديمًا
+    items = list(order.items.select_related('product'))
+    subtotal = sum((item.line_total for item in items), Decimal('0'))
     context = {
         'order': order,
+        'items': items,
         'subtotal': subtotal,
-        'shipping': shipping,
-        'service': service,
-        'tax': tax,
-        'discount': discount_amount,
-        'total': total,
-        "shippingFee": shippingFee,
-        "serviceFee": serviceFee,
+        'fees': order.total - subtotal + order.discount,  # الشحن + الخدمة + الضريبة
+        'discount': order.discount,
+        'total': order.total,
     }
+
+    if not order.total:
+        # طلبات قديمة بدون مجموع محفوظ (قبل OrderItem: منتجات الطلب بكمية 1)، تُحسب بالقواعد الحالية
+        lines = [(item.unit_price, item.quantity) for item in items]
+        if not lines:
+            lines = [(product.price, 1) for product in order.products.all()]
+        rules = get_pricing_rules()
+        coupon = rules.coupons.get(str(order.coupon_id)) if order.coupon_id else None
+        quote = price_cart(lines, rules, coupon)
+        context.update({
+            'subtotal': quote.subtotal,
+            'fees': None,
+            'shipping': quote.shipping,
+            'service': quote.service_fee,
+            'tax': quote.tax,
+            'discount': quote.discount + quote.coupon_discount,
+            'total': quote.total,
+        })
+
     context.update(base_context)
-    return render(request, 'confirmation.html', context)
+    return render(request, 'Confirmation.html', context)
 
 
 
@@ -271,6 +301,57 @@ def about(request):
     context.update(base_context) 
     return render(request,'about.html',context)
 
+# ________________________________________________________________________
+#
+#                    تصغير الصور عند الطلب (website/images.py)
+# ________________________________________________________________________
+
+
+def negotiate_format(request, fmt):
+    # auto: WebP إذا قال المتصفح إنه يقبلها في Accept، وإلا JPEG
+    if fmt == 'auto':
+        return 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+    return fmt
+
+
+@require_safe
+def resize_image(request, name):
+    """
+    /image/<اسم الصورة في media>?w=200&q=75&fmt=auto|webp|jpeg|png
+    """
+    try:
+        width = image_resizer.snap_width(int(request.GET.get('w', 400)))
+        quality = image_resizer.snap_quality(int(request.GET.get('q', 75)))
+    except ValueError:
+        return HttpResponseBadRequest("w and q must be integers")
+    requested = request.GET.get('fmt', 'auto')
+    if requested != 'auto' and requested not in image_resizer.RESIZE_FORMATS:
+        return HttpResponseBadRequest("fmt must be auto, webp, jpeg or png")
+    fmt = negotiate_format(request, requested)
+
+    try:
+        path, key = image_resizer.get_derivative(name, width, quality, fmt)
+    except (ValueError, FileNotFoundError, IsADirectoryError, UnidentifiedImageError, ValidationError):
+        raise Http404("Image not found")
+    except image_resizer.ResizeBusy:
+        response = HttpResponse("Too many images are being resized, try again", status=503)
+        response['Retry-After'] = '1'
+        return response
+
+    etag = quote_etag(key)
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponse(status=304)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=image_resizer.RESIZE_FORMATS[fmt][1])
+    response['ETag'] = etag
+    # الرابط بالاسم: صورة جديدة بنفس الاسم = نفس الرابط، فلا immutable. بعد max-age يرجع المتصفح
+    # بـ If-None-Match، والـ ETag (hash المحتوى) يجيب بـ 304 إذا لم تتغير
+    response['Cache-Control'] = f"public, max-age={getattr(settings, 'IMAGE_RESIZE_MAX_AGE', 3600)}"
+    if requested == 'auto':
+        patch_vary_headers(response, ['Accept'])
+    return response
+
+
 # ________________________________________________________________________
 # 
 #                              create api
@@ -289,9 +370,12 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny
 from .models import Contact
+from .throttling import TokenBucketThrottle
 
 class ContactCreateAPIView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'contact'
 
     def post(self, request):
         foll_name = request.data.get("foll_name")